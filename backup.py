@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+数据库逻辑备份与恢复 - 学习：服务器端游标、流式压缩、校验和、增量备份
+每张表用服务器端游标（stream_results）按 CHUNK_SIZE 行分批读取，逐行写入 gzip 压缩的 JSON Lines，
+内存占用与表大小无关；SQLite 和 MySQL 用同一套代码。
+
+归档格式（解压后每行一个 JSON）：
+    {"format": "personal-log-backup", "version": 1, "mode": "full", "since": null, "started_at": "..."}
+    {"table": "user", "columns": ["id", "username", ...]}    # 表头
+    [1, "alice", ...]                                        # 每行数据一个数组
+    {"table": "user", "rows": 123}                           # 表尾：行数
+    ...
+    {"table": "post.update", "columns": ["id", "view_count", "hot_score"]}   # 仅增量：见下
+    ...
+    {"sha256": "...", "rows": 4567}                          # 最后一行：之前所有行的 SHA-256
+
+增量备份：post 按 updated_at、comment 按 created_at（评论不可编辑）只导出 since 之后的行，
+post_tag 跟随变化的文章导出；user / category / tag 没有可靠的修改时间，体积也小，总是全量导出。
+阅读数、热度分由写缓冲和定时任务更新，不改 updated_at，所以增量归档另带一节 post.update：
+所有文章的 (id, view_count, hot_score)，恢复时按主键 UPDATE（三列数值，百万文章也只有几十MB未压缩）。
+删除不会出现在增量备份里，需要定期做全量备份。
+
+全量恢复在一个事务里完成（清空、插入、重建冗余计数），中途失败整体回滚，不会留下恢复了一半的数据库。
+
+运行：python backup.py backup [--incremental | --since 2024-01-01T00:00:00] [-o 文件]
+      python backup.py verify <文件>
+      python backup.py restore <文件>   # 恢复后自动重建冗余计数、清空页面缓存
+"""
+
+import pymysql
+pymysql.install_as_MySQLdb()
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import and_, bindparam, inspect, select
+
+from models import db
+from bulk import insert_ignore, upsert
+import counters
+
+ARCHIVE_FORMAT = 'personal-log-backup'
+ARCHIVE_VERSION = 1
+
+# 按外键依赖排序：恢复时按此顺序插入，清空时倒序删除
+TABLES = ['user', 'category', 'tag', 'post', 'post_tag', 'comment']
+# 引用了上面这些表的派生数据：全量恢复前清空，恢复后用 python search.py rebuild 重建
+DERIVED_TABLES = ['search_posting', 'search_term']
+# 增量备份时按哪一列筛选；不在这里的表（post_tag 除外）总是全量导出
+INCREMENTAL_COLUMNS = {'post': 'updated_at', 'comment': 'created_at'}
+# 不改修改时间的派生列：增量备份时对所有行导出，恢复时按主键 UPDATE
+UPDATE_COLUMNS = {'post': ['view_count', 'hot_score']}
+
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+BACKUP_RETENTION_DAYS = int(os.environ.get('BACKUP_RETENTION_DAYS', '14'))
+STATE_FILE = 'last_backup.json'
+
+# 读取时每批行数、恢复时每批写入的行数
+CHUNK_SIZE = 2000
+RESTORE_BATCH_SIZE = 1000
+
+
+class BackupError(ValueError):
+    """归档损坏、校验失败或格式不支持"""
+
+
+def _encode(value):
+    """json.dumps 不认识的类型"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def _decoder(column):
+    """按列类型把 JSON 值还原成数据库值"""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat
+    if python_type is date:
+        return date.fromisoformat
+    return None
+
+
+class _ArchiveWriter:
+    """逐行写入压缩归档，同时计算未压缩内容的 SHA-256"""
+
+    def __init__(self, fileobj):
+        self.file = fileobj
+        self.sha256 = hashlib.sha256()
+
+    def write(self, record):
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=_encode)
+                + '\n').encode('utf-8')
+        self.sha256.update(line)
+        self.file.write(line)
+
+
+def _begin_snapshot(connection):
+    """整个备份在同一个一致性快照里读，备份过程中的写入不会让各表之间对不上"""
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        connection.exec_driver_sql("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        connection.exec_driver_sql("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+    elif dialect == 'sqlite':
+        connection.exec_driver_sql("BEGIN")
+
+
+def _backup_query(table, since):
+    """某张表的导出查询（按主键排序，post_tag 因此按文章分组）"""
+    query = select(table).order_by(*table.primary_key.columns)
+    if since is None:
+        return query
+    if table.name in INCREMENTAL_COLUMNS:
+        return query.where(table.c[INCREMENTAL_COLUMNS[table.name]] > since)
+    if table.name == 'post_tag':
+        post = db.metadata.tables['post']
+        return query.where(table.c.post_id.in_(
+            select(post.c.id).where(post.c[INCREMENTAL_COLUMNS['post']] > since)))
+    return query
+
+
+def _write_section(connection, writer, name, columns, query):
+    """导出一节：表头、按 CHUNK_SIZE 流式读取的数据行、表尾，返回行数"""
+    writer.write({'table': name, 'columns': columns})
+    count = 0
+    result = connection.execution_options(stream_results=True).execute(query)
+    try:
+        while True:
+            rows = result.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                writer.write(list(row))
+            count += len(rows)
+    finally:
+        result.close()
+    writer.write({'table': name, 'rows': count})
+    return count
+
+
+def _load_state(directory):
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def create_backup(path=None, since=None, incremental=False, directory=BACKUP_DIR):
+    """
+    导出备份，返回 {'path', 'mode', 'since', 'rows', 'tables', 'bytes', 'sha256'}
+    incremental=True 且未给出 since 时，从上一次备份的开始时间起做增量；没有上一次备份则做全量
+    """
+    if incremental and since is None:
+        state = _load_state(directory)
+        if state:
+            since = datetime.fromisoformat(state['started_at'])
+    mode = 'incremental' if since is not None else 'full'
+    # 数据库里是不带时区的UTC时间；以开始时间作为下一次增量的起点（宁可多导出，不可漏）
+    started_at = datetime.utcnow()
+    if path is None:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"blog-{mode}-{started_at:%Y%m%d-%H%M%S}.ndjson.gz")
+
+    table_rows = {}
+    partial_path = path + '.part'
+    try:
+        with db.engine.connect() as connection, gzip.open(partial_path, 'wb', compresslevel=6) as f:
+            _begin_snapshot(connection)
+            writer = _ArchiveWriter(f)
+            writer.write({'format': ARCHIVE_FORMAT, 'version': ARCHIVE_VERSION, 'mode': mode,
+                          'since': since, 'started_at': started_at, 'dialect': connection.dialect.name})
+            for name in TABLES:
+                table = db.metadata.tables[name]
+                table_rows[name] = _write_section(connection, writer, name,
+                                                  [column.name for column in table.columns],
+                                                  _backup_query(table, since))
+            if since is not None:
+                for name, columns in UPDATE_COLUMNS.items():
+                    table = db.metadata.tables[name]
+                    key = [column.name for column in table.primary_key.columns]
+                    query = (select(*[table.c[column] for column in key + columns])
+                             .order_by(*table.primary_key.columns))
+                    table_rows[f"{name}.update"] = _write_section(connection, writer, f"{name}.update",
+                                                                  key + columns, query)
+            total = sum(table_rows.values())
+            digest = writer.sha256.hexdigest()
+            writer.write({'sha256': digest, 'rows': total})
+    except BaseException:
+        # 失败（包括 Ctrl-C）时不留下半截的 .part 文件
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    # 写完才改名，半截的归档不会被当成可用备份
+    os.replace(partial_path, path)
+
+    if path.startswith(os.path.join(directory, '')):
+        with open(os.path.join(directory, STATE_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'path': path, 'mode': mode, 'started_at': started_at.isoformat()}, f)
+    return {'path': path, 'mode': mode, 'since': since, 'rows': total, 'tables': table_rows,
+            'bytes': os.path.getsize(path), 'sha256': digest}
+
+
+def _read_records(path):
+    """逐行读取归档，产出 (记录, 读到此行之前内容的 SHA-256 对象)"""
+    sha256 = hashlib.sha256()
+    with gzip.open(path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise BackupError(f"归档内容损坏: {e}")
+            yield record, sha256
+            sha256.update(line)
+
+
+def verify_backup(path):
+    """
+    流式校验归档：SHA-256、每张表的行数、结尾记录是否完整
+    返回归档头信息加上 {'tables': {表名: 行数}}；校验失败抛出 BackupError
+    """
+    header = None
+    tables = {}
+    current = None
+    count = 0
+    try:
+        for record, sha256 in _read_records(path):
+            if header is None:
+                if not isinstance(record, dict) or record.get('format') != ARCHIVE_FORMAT:
+                    raise BackupError("不是备份归档")
+                if record.get('version') != ARCHIVE_VERSION:
+                    raise BackupError(f"不支持的归档版本: {record.get('version')}")
+                header = record
+            elif isinstance(record, list):
+                if current is None:
+                    raise BackupError("数据行不属于任何表")
+                count += 1
+            elif 'columns' in record:
+                current, count = record['table'], 0
+            elif 'rows' in record and 'table' in record:
+                if record['table'] != current or record['rows'] != count:
+                    raise BackupError(f"表 {record['table']} 行数不符")
+                tables[current] = count
+                current = None
+            elif 'sha256' in record:
+                if record['sha256'] != sha256.hexdigest():
+                    raise BackupError("校验和不符")
+                if record['rows'] != sum(tables.values()):
+                    raise BackupError("总行数不符")
+                return dict(header, tables=tables)
+    except (OSError, EOFError) as e:
+        raise BackupError(f"无法读取归档: {e}")
+    raise BackupError("归档不完整（缺少结尾校验记录）")
+
+
+def _clear_tables(names):
+    """全量恢复前清空（先删派生表，再按外键依赖倒序删）；不提交，和随后的插入同属一个事务"""
+    existing = set(inspect(db.engine).get_table_names())
+    for name in DERIVED_TABLES + list(reversed(names)):
+        if name in existing:
+            db.session.execute(db.metadata.tables[name].delete())
+
+
+def _update_batch(table, rows):
+    """按主键 UPDATE 一批派生列（归档之后删除了的行自然跳过，不改 updated_at）"""
+    key = [column.name for column in table.primary_key.columns]
+    values = {name: bindparam(name) for name in rows[0] if name not in key}
+    if 'updated_at' in table.c:
+        values['updated_at'] = table.c.updated_at
+    statement = (table.update()
+                 .where(and_(*[table.c[name] == bindparam(f"key_{name}") for name in key]))
+                 .values(values))
+    db.session.execute(statement, [{(f"key_{name}" if name in key else name): value
+                                    for name, value in row.items()} for row in rows])
+
+
+def _restore_batch(table, rows, incremental, update=False):
+    """
+    写入一批行（不提交）：全量直接 INSERT；增量按主键 upsert；post.update 一节按主键 UPDATE
+    增量归档里的文章带着它当前的全部标签，所以先删掉这些文章原有的 post_tag 关联（包括标签被清空的）
+    """
+    if update:
+        _update_batch(table, rows)
+    elif not incremental:
+        db.session.execute(table.insert(), rows)
+    elif table.name == 'post_tag':
+        insert_ignore(table, rows)
+    else:
+        if table.name == 'post':
+            post_tag = db.metadata.tables['post_tag']
+            db.session.execute(post_tag.delete().where(post_tag.c.post_id.in_([row['id'] for row in rows])))
+        upsert(table, rows)
+
+
+def restore_backup(path, verify=True):
+    """
+    从归档恢复，返回 {'mode', 'tables': {表名: 行数}}
+    全量归档：清空这些表后按批插入；增量归档：按主键 upsert 到现有数据上
+    先完整校验一遍再写入；整个恢复（含冗余计数重建）在一个事务里，失败时回滚，
+    损坏或写入出错的归档都不会留下恢复了一半的数据库
+    """
+    if verify:
+        verify_backup(path)
+    incremental = False
+    tables = {}
+    table = columns = decoders = None
+    update = False
+    batch = []
+    try:
+        for record, _ in _read_records(path):
+            if isinstance(record, list):
+                row = {}
+                for name, decoder, value in zip(columns, decoders, record):
+                    if name is None:
+                        continue
+                    row[name] = decoder(value) if decoder and value is not None else value
+                batch.append(row)
+                if len(batch) >= RESTORE_BATCH_SIZE:
+                    _restore_batch(table, batch, incremental, update)
+                    batch = []
+            elif 'format' in record:
+                incremental = record['mode'] == 'incremental'
+                if not incremental:
+                    _clear_tables(TABLES)
+            elif 'columns' in record:
+                table_name, _, action = record['table'].partition('.')
+                table, update = db.metadata.tables[table_name], action == 'update'
+                # 归档里有、当前表结构已删除的列直接丢弃；新增的列用默认值
+                columns = [name if name in table.c else None for name in record['columns']]
+                decoders = [_decoder(table.c[name]) if name else None for name in columns]
+                tables[record['table']] = 0
+            elif 'rows' in record and 'table' in record:
+                if batch:
+                    _restore_batch(table, batch, incremental, update)
+                    batch = []
+                tables[record['table']] = record['rows']
+        # 增量归档里没有只改了冗余计数（如新增评论）的文章，按实际数据重建；
+        # rebuild_counters 最后的提交就是整个恢复的提交
+        counters.rebuild_counters()
+    except Exception:
+        db.session.rollback()
+        raise
+    _invalidate_caches()
+    return {'mode': 'incremental' if incremental else 'full', 'tables': tables}
+
+
+def _invalidate_caches():
+    """恢复后数据整体变化，页面缓存全部失效"""
+    try:
+        from cache_helper import cache
+    except ImportError:
+        return
+    for namespace in ('index', 'categories', 'views'):
+        cache.invalidate_namespace(namespace)
+    cache.clear_pattern('view:*')
+
+
+def prune_backups(directory=BACKUP_DIR, retention_days=BACKUP_RETENTION_DAYS):
+    """删除超过保留天数的归档，返回删除的文件名"""
+    if not os.path.isdir(directory):
+        return []
+    cutoff = time.time() - timedelta(days=retention_days).total_seconds()
+    removed = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith('.ndjson.gz') and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed.append(name)
+    return removed
+
+
+if __name__ == '__main__':
+    import argparse
+    from app import app
+
+    parser = argparse.ArgumentParser(description='数据库逻辑备份与恢复')
+    commands = parser.add_subparsers(dest='command', required=True)
+    backup_parser = commands.add_parser('backup', help='导出备份')
+    backup_parser.add_argument('-o', '--output', help='归档路径（默认写到 BACKUP_DIR）')
+    backup_parser.add_argument('--incremental', action='store_true', help='从上一次备份起做增量')
+    backup_parser.add_argument('--since', type=datetime.fromisoformat, help='导出此时间（UTC）之后的变化')
+    commands.add_parser('verify', help='校验归档').add_argument('path')
+    commands.add_parser('restore', help='从归档恢复').add_argument('path')
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.time()
+        try:
+            if args.command == 'backup':
+                print("💾 开始数据库备份...")
+                info = create_backup(args.output, since=args.since, incremental=args.incremental)
+                for name, count in info['tables'].items():
+                    print(f"   {name}: {count} 行")
+                print(f"✅ {info['mode']} 备份完成: {info['path']} "
+                      f"({info['bytes'] / 1024:.1f}KB，用时 {time.time() - start:.2f}s)")
+            elif args.command == 'verify':
+                info = verify_backup(args.path)
+                print(f"✅ 归档完好: {info['mode']}，{sum(info['tables'].values())} 行，开始于 {info['started_at']}")
+            else:
+                print("♻️  开始恢复数据库...")
+                info = restore_backup(args.path)
+                for name, count in info['tables'].items():
+                    print(f"   {name}: {count} 行")
+                print(f"✅ {info['mode']} 恢复完成（冗余计数已重建），用时 {time.time() - start:.2f}s")
+                print("   搜索索引需要重建: python search.py rebuild")
+        except BackupError as e:
+            print(f"❌ {e}")
+            raise SystemExit(1)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+可复现的性能基准 - 学习：预热、多次迭代、分位数、SQL条数、缓存命中率、回归对比
+用固定随机种子生成数据集（默认 SQLite 临时库，也可以指定 MySQL 测试库），
+通过 Flask 测试客户端请求真实路由、直接调用关键 ORM 查询，每个场景先预热再迭代多次，
+输出 p50/p95/p99、每次请求的SQL条数和缓存命中率，结果保存为 JSON，可在两次提交之间对比。
+
+运行：python benchmark.py run [-o results.json] [--scale small|medium] [--cache on|off]
+      python benchmark.py run --database-url mysql+pymysql://u:p@localhost/blog_bench --allow-reset
+      python benchmark.py compare old.json new.json [--threshold 0.15]
+缓存场景会清空 REDIS_URL 指向的库里的页面缓存，请用单独的 Redis 库（如 redis://localhost:6379/15）。
+"""
+
+import pymysql
+pymysql.install_as_MySQLdb()
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from datagen import EN_WORDS as WORDS_EN, ZH_WORDS as WORDS_ZH
+
+# 数据集规模：用户、分类、标签、文章、评论、每篇文章的标签数上限
+SCALES = {
+    'small': {'users': 50, 'categories': 10, 'tags': 200, 'posts': 2000, 'comments': 8000, 'max_tags': 4},
+    'medium': {'users': 200, 'categories': 20, 'tags': 1000, 'posts': 20000, 'comments': 80000, 'max_tags': 5},
+}
+# datagen 生成的 user1 带密码，用来测试登录后的页面
+BENCH_USER = 'user1'
+BENCH_PASSWORD = 'bench-password'
+# 每个场景轮流访问的文章数
+SAMPLE_POSTS = 50
+
+
+class BenchmarkError(RuntimeError):
+    """场景执行失败（如路由返回错误状态码）"""
+
+
+def seed_dataset(scale, seed):
+    """用 datagen 按固定种子生成数据集，并重建搜索索引"""
+    import datagen
+    import search as search_index
+    from models import db
+
+    datagen.generate(seed=seed, password=BENCH_PASSWORD, **scale)
+    search_index.rebuild_index()
+    db.session.remove()
+
+
+def percentiles(samples):
+    """p50/p95/p99（线性插值）及均值、最值，单位与输入相同"""
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {'p50': value, 'p95': value, 'p99': value, 'mean': value, 'min': value, 'max': value}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98], 'mean': statistics.fmean(samples),
+            'min': min(samples), 'max': max(samples)}
+
+
+def _cache_stats():
+    try:
+        from cache_helper import cache
+    except ImportError:
+        return {}
+    return cache.get_stats()
+
+
+def _cache_delta(before, after):
+    """两次缓存统计之差，附命中率"""
+    delta = {}
+    for tier, counts in after.items():
+        hits = counts.get('hits', 0) - before.get(tier, {}).get('hits', 0)
+        misses = counts.get('misses', 0) - before.get(tier, {}).get('misses', 0)
+        if hits or misses:
+            delta[tier] = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 4)}
+    return delta
+
+
+def run_scenario(fn, warmup, iterations, engine):
+    """预热后迭代 iterations 次，返回耗时分位数（毫秒）、SQL条数和缓存命中情况"""
+    from feed_queries import QueryCounter
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(warmup):
+            fn(i)
+        before = _cache_stats()
+        timings, statements = [], []
+        with QueryCounter(engine) as counter:
+            for i in range(warmup, warmup + iterations):
+                executed = counter.count
+                start = time.perf_counter()
+                fn(i)
+                timings.append((time.perf_counter() - start) * 1000)
+                statements.append(counter.count - executed)
+        after = _cache_stats()
+    return {
+        'iterations': iterations,
+        'latency_ms': {key: round(value, 3) for key, value in percentiles(timings).items()},
+        'sql_per_iteration': {'mean': round(statistics.fmean(statements), 2), 'max': max(statements)},
+        'cache': _cache_delta(before, after),
+    }
+
+
+def build_scenarios(app, sample_ids):
+    """场景名 -> fn(i)：路由场景走测试客户端，ORM 场景直接调用查询函数"""
+    from models import db
+    from feed_queries import get_feed_page, get_post_detail, get_comments_page, get_categories
+    import search as search_index
+
+    anonymous = app.test_client()
+    logged_in = app.test_client()
+    response = logged_in.post('/login', data={'username': BENCH_USER, 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise BenchmarkError(f"基准用户登录失败: {response.status_code}")
+
+    with app.app_context():
+        second_page = get_feed_page().next_cursor
+        db.session.remove()
+    first = anonymous.get('/')
+    index_etag = first.headers.get('ETag')
+
+    def post_id(i):
+        return sample_ids[i % len(sample_ids)]
+
+    def get(client, path, expected=(200,), headers=None):
+        def fn(i):
+            url = path(i) if callable(path) else path
+            response = client.get(url, headers=headers)
+            if response.status_code not in expected:
+                raise BenchmarkError(f"GET {url} 返回 {response.status_code}")
+        return fn
+
+    def orm(query):
+        def fn(i):
+            with app.app_context():
+                query(i)
+                db.session.remove()
+        return fn
+
+    return {
+        'route:index': get(anonymous, '/'),
+        'route:index_page2': get(anonymous, f'/?cursor={second_page}'),
+        'route:index_logged_in': get(logged_in, '/'),
+        'route:index_304': get(anonymous, '/', expected=(304,), headers={'If-None-Match': index_etag}),
+        'route:show_post': get(anonymous, lambda i: f'/post/{post_id(i)}'),
+        'route:comments_json': get(anonymous, lambda i: f'/post/{post_id(i)}/comments'),
+        'route:search': get(anonymous, lambda i: f'/search?q={WORDS_ZH[i % len(WORDS_ZH)]}'),
+        'route:hot': get(anonymous, '/hot'),
+        'orm:feed_page': orm(lambda i: get_feed_page().items),
+        'orm:categories': orm(lambda i: get_categories()),
+        'orm:post_detail': orm(lambda i: get_post_detail(post_id(i)).tags),
+        'orm:comments_page': orm(lambda i: get_comments_page(post_id(i)).items),
+        'orm:search': orm(lambda i: search_index.search(WORDS_EN[i % len(WORDS_EN)]).items),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='blog-bench-'), 'bench.db')
+    elif not database_url.startswith('sqlite') and not args.allow_reset:
+        raise SystemExit("❌ 基准会清空并重建数据库，请确认这是测试库后加上 --allow-reset")
+    # app.py 在导入时读取 DATABASE_URL 并建表；测的是请求路径，按 web 进程配置连接池
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('BLOG_PROCESS_TYPE', 'web')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        from app import app
+    from models import db
+
+    app.config['VIEW_CACHE'] = args.cache == 'on'
+    scale = SCALES[args.scale]
+    print(f"🧪 准备数据集: {args.scale} (seed={args.seed}) -> {database_url.split('@')[-1]}")
+    start = time.time()
+    with app.app_context(), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        engine = db.engine
+        db.drop_all()
+        db.create_all()
+        seed_dataset(scale, args.seed)
+        if args.cache == 'on':
+            from cache_helper import cache
+            cache.clear_pattern('view:*')
+    print(f"   数据集就绪，用时 {time.time() - start:.1f}s")
+
+    sample_ids = random.Random(args.seed).sample(range(1, scale['posts'] + 1), SAMPLE_POSTS)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        scenarios = build_scenarios(app, sample_ids)
+    results = {}
+    for name, fn in scenarios.items():
+        if args.only and args.only not in name:
+            continue
+        result = run_scenario(fn, args.warmup, args.iterations, engine)
+        results[name] = result
+        latency = result['latency_ms']
+        hit_rates = ' '.join(f"{tier}命中{counts['hit_rate']:.0%}" for tier, counts in result['cache'].items())
+        print(f"   {name:<24} p50 {latency['p50']:8.2f}ms  p95 {latency['p95']:8.2f}ms  "
+              f"p99 {latency['p99']:8.2f}ms  SQL {result['sql_per_iteration']['mean']:5.1f}  {hit_rates}")
+
+    report = {
+        'meta': {
+            'revision': _git_revision(),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dialect': engine.dialect.name,
+            'scale': args.scale,
+            'dataset': scale,
+            'seed': args.seed,
+            'warmup': args.warmup,
+            'iterations': args.iterations,
+            'cache': args.cache,
+        },
+        'scenarios': results,
+    }
+    output = args.output or f"benchmark-{report['meta']['revision'] or 'local'}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f"✅ 结果已保存: {output}")
+
+
+def compare(old, new, threshold):
+    """
+    对比两份结果，返回回归列表
+    p95 变慢超过 threshold（比例）或每次请求的平均SQL条数增加都算回归
+    """
+    regressions = []
+    print(f"{'场景':<26}{'p50':>20}{'p95':>20}{'SQL':>14}")
+    for name in sorted(set(old['scenarios']) | set(new['scenarios'])):
+        if name not in old['scenarios'] or name not in new['scenarios']:
+            print(f"{name:<26}{'(仅在一侧)':>20}")
+            continue
+        before, after = old['scenarios'][name], new['scenarios'][name]
+        cells = []
+        for key in ('p50', 'p95'):
+            a, b = before['latency_ms'][key], after['latency_ms'][key]
+            change = (b - a) / a if a else 0.0
+            cells.append(f"{a:.2f}->{b:.2f} ({change:+.0%})")
+            if key == 'p95' and change > threshold:
+                regressions.append(f"{name}: p95 {a:.2f}ms -> {b:.2f}ms ({change:+.0%})")
+        sql_before, sql_after = before['sql_per_iteration']['mean'], after['sql_per_iteration']['mean']
+        if sql_after > sql_before:
+            regressions.append(f"{name}: SQL {sql_before} -> {sql_after}")
+        print(f"{name:<26}{cells[0]:>20}{cells[1]:>20}{f'{sql_before}->{sql_after}':>14}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='博客性能基准')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='生成数据集并运行全部场景')
+    run_parser.add_argument('--database-url', help='默认使用临时 SQLite 文件')
+    run_parser.add_argument('--allow-reset', action='store_true', help='允许清空非 SQLite 数据库')
+    run_parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--warmup', type=int, default=20)
+    run_parser.add_argument('--iterations', type=int, default=200)
+    run_parser.add_argument('--cache', choices=('on', 'off'), default='on', help='是否启用页面缓存')
+    run_parser.add_argument('--only', help='只运行名字包含该字符串的场景')
+    run_parser.add_argument('-o', '--output', help='结果文件（默认 benchmark-<提交>.json）')
+    compare_parser = commands.add_parser('compare', help='对比两份结果')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.15, help='p95 允许变慢的比例')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        run(args)
+        return 0
+    with open(args.old, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    regressions = compare(old, new, args.threshold)
+    if regressions:
+        print("\n❌ 发现性能回归:")
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+    print("\n✅ 没有性能回归")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
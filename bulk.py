@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+批量写入工具 - 学习：executemany、并发安全的批量插入、批量 upsert、排序规则
+"""
+
+import unicodedata
+
+from models import db
+
+
+def collation_key(value):
+    """
+    近似 MySQL 默认排序规则（utf8mb4_0900_ai_ci 等，不区分大小写和重音）的比较键：
+    数据库认为相同的两个名字，这里得到相同的键
+    """
+    decomposed = unicodedata.normalize('NFKD', value.casefold())
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return unicodedata.normalize('NFKC', stripped).rstrip()
+
+
+def match_names(names, rows):
+    """
+    把按名字 IN 查询到的 (名字, 值) 对应回请求的名字，返回 {请求的名字: 值}
+    MySQL 按排序规则比较，请求 'flask' 可能返回 'Flask' 那一行；先按原样对应，再按 collation_key 对应，
+    对应不上的名字不在结果里
+    """
+    exact = dict(rows)
+    folded = {}
+    for name, value in exact.items():
+        folded.setdefault(collation_key(name), value)
+    matched = {}
+    for name in names:
+        if name in exact:
+            matched[name] = exact[name]
+        elif collation_key(name) in folded:
+            matched[name] = folded[collation_key(name)]
+    return matched
+
+
+def insert_ignore(table, rows):
+    """
+    批量插入，唯一键冲突的行直接跳过（并发写入同一个名字时不会报错）
+    MySQL: INSERT IGNORE；SQLite: INSERT OR IGNORE；一条语句 executemany
+    """
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    statement = table.insert()
+    if dialect == 'mysql':
+        statement = statement.prefix_with('IGNORE')
+    elif dialect == 'sqlite':
+        statement = statement.prefix_with('OR IGNORE')
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).on_conflict_do_nothing()
+    db.session.execute(statement, rows)
+
+
+def upsert(table, rows):
+    """
+    批量插入，主键已存在的行改为更新其余列（增量恢复时使用）
+    MySQL: INSERT ... ON DUPLICATE KEY UPDATE；SQLite/PostgreSQL: INSERT ... ON CONFLICT DO UPDATE
+    """
+    if not rows:
+        return
+    primary_key = [column.name for column in table.primary_key.columns]
+    others = [column.name for column in table.columns if column.name not in primary_key]
+    if not others:
+        insert_ignore(table, rows)
+        return
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        statement = statement.on_duplicate_key_update({name: statement.inserted[name] for name in others})
+    else:
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=primary_key,
+            set_={name: statement.excluded[name] for name in others},
+        )
+    db.session.execute(statement, rows)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+缓存编解码基准 - 学习：序列化开销、压缩率与CPU的权衡
+用真实渲染出的首页和文章页HTML，对比各种编码方式的存储字节数和编解码耗时。
+运行：python cache_benchmark.py [迭代次数]
+"""
+
+import pymysql
+pymysql.install_as_MySQLdb()
+
+import pickle
+import sys
+import time
+
+from app import app
+from models import Post
+from cache_helper import Codec
+
+# 参与对比的编码方式
+CODECS = {
+    '旧方式 pickle+latin1': None,
+    'pickle 不压缩': Codec('pickle', compress_threshold=None),
+    'pickle + zlib(1)': Codec('pickle', compress_threshold=1024, compress_level=1),
+    'pickle + zlib(6)': Codec('pickle', compress_threshold=1024, compress_level=6),
+    'json + zlib(6)': Codec('json', compress_threshold=1024, compress_level=6),
+}
+
+
+def _legacy_encode(value):
+    return pickle.dumps(value).decode('latin1')
+
+
+def _legacy_decode(data):
+    return pickle.loads(data.encode('latin1'))
+
+
+def render_payloads():
+    """用测试客户端渲染真实页面，包装成 cache_view 存入缓存的条目格式"""
+    payloads = {}
+    with app.test_client() as client:
+        pages = {'index': '/'}
+        latest = Post.query.order_by(Post.created_at.desc()).first()
+        if latest:
+            pages['show_post'] = f'/post/{latest.id}'
+        for name, url in pages.items():
+            html = client.get(url).get_data(as_text=True)
+            payloads[name] = {'value': html, 'soft_expire': time.time() + 300, 'delta': 0.05}
+    return payloads
+
+
+def measure(codec, payload, iterations):
+    """返回 (存储字节数, 平均编码微秒, 平均解码微秒)"""
+    encode = _legacy_encode if codec is None else codec.encode
+    decode = _legacy_decode if codec is None else codec.decode
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        data = encode(payload)
+    encode_us = (time.perf_counter() - start) / iterations * 1e6
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode(data)
+    decode_us = (time.perf_counter() - start) / iterations * 1e6
+
+    # 旧方式经 decode_responses 以 UTF-8 写入 Redis，按实际落盘字节计算
+    size = len(data.encode('utf-8')) if isinstance(data, str) else len(data)
+    return size, encode_us, decode_us
+
+
+def run_benchmark(iterations=200):
+    with app.app_context():
+        payloads = render_payloads()
+
+    for name, payload in payloads.items():
+        print(f"\n📄 {name}（HTML {len(payload['value'].encode('utf-8'))} 字节）")
+        print(f"   {'编码方式':<22}{'存储字节':>10}{'编码(μs)':>12}{'解码(μs)':>12}")
+        for codec_name, codec in CODECS.items():
+            size, encode_us, decode_us = measure(codec, payload, iterations)
+            print(f"   {codec_name:<22}{size:>10}{encode_us:>12.1f}{decode_us:>12.1f}")
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -2,29 +2,259 @@
 """
 Redis缓存工具类
 学习：缓存机制、内存管理、缓存策略
+
+失效策略：分代命名空间（generational namespace）
+每个逻辑分组（index、post:<id>、category:<id>）有一个版本号 ns:<分组>，
+缓存键里带上版本号；失效时只需 INCR 版本号，旧键不再被访问，随TTL自然过期。
+失效代价是一次 INCR，与缓存了多少页面无关。
+
+防击穿：cache_view 的缓存条目带“软过期时间”和上次计算耗时。
+同一个键同时只有一个请求（持有短期 Redis 锁）重新计算，其它请求等待或拿旧值；
+软过期前按概率提前刷新（XFetch），软过期后 stale_ttl 秒内仍可返回旧值。
+
+序列化：Redis 客户端直接收发 bytes，值经 Codec 编码——可选 pickle/json 序列化，
+超过阈值的值用 zlib 压缩；两字节头部记录格式，解码时不依赖当前配置。
+
+两级缓存：每个 worker 进程内有一个按条数和字节数限制的 LRU（L1），
+L1 未命中才访问 Redis（L2）。delete 和命名空间失效通过 Redis pub/sub
+广播给所有 worker，各自从 L1 中剔除；订阅线程不在时 L1 自动停用。
 """
 
+import os
 import redis
 import json
 import pickle
+import time
+import hashlib
+import math
+import random
+import threading
+import zlib
+from collections import OrderedDict
 from functools import wraps
-from app import app
+from urllib.parse import quote
+from flask import current_app, request, session
+from flask_login import current_user
+from config import REDIS_URL, redis_pool_options
+from replicas import primary_reads
+
+# 缓存键超过该长度时对变体部分做哈希
+MAX_KEY_LENGTH = 200
+
+# L1 失效广播频道
+INVALIDATION_CHANNEL = 'cache:invalidate'
+
+
+class PickleSerializer:
+    """pickle 序列化：支持任意Python对象"""
+    code = b'p'
+
+    def dumps(self, value):
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class JsonSerializer:
+    """JSON 序列化：只支持JSON类型，但不会执行任意代码，跨语言可读"""
+    code = b'j'
+
+    def dumps(self, value):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data.decode('utf-8'))
+
+
+SERIALIZERS = {'pickle': PickleSerializer(), 'json': JsonSerializer()}
+
+
+class Codec:
+    """
+    缓存值编解码：头部2字节 = 序列化格式 + 压缩标记（z 压缩 / - 未压缩）
+    compress_threshold 字节以上的值用 zlib 压缩（HTML压缩率通常在 4~8 倍）
+    """
+    COMPRESSED = b'z'
+    RAW = b'-'
+
+    def __init__(self, serializer='pickle', compress_threshold=1024, compress_level=6):
+        self.serializer = SERIALIZERS[serializer] if isinstance(serializer, str) else serializer
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self._by_code = {s.code: s for s in SERIALIZERS.values()}
+        self._by_code[self.serializer.code] = self.serializer
+
+    def encode(self, value):
+        payload = self.serializer.dumps(value)
+        if self.compress_threshold is not None and len(payload) >= self.compress_threshold:
+            return self.serializer.code + self.COMPRESSED + zlib.compress(payload, self.compress_level)
+        return self.serializer.code + self.RAW + payload
+
+    def decode(self, data):
+        """解码；无法识别的数据（如旧格式）抛出 ValueError"""
+        serializer = self._by_code.get(data[:1])
+        flag = data[1:2]
+        if serializer is None or flag not in (self.COMPRESSED, self.RAW):
+            raise ValueError("未知的缓存数据格式")
+        payload = data[2:]
+        if flag == self.COMPRESSED:
+            payload = zlib.decompress(payload)
+        return serializer.loads(payload)
+
+class LocalLRU:
+    """
+    进程内LRU缓存：同时限制条数和字节数，每条带过期时间
+    存的是反序列化后的对象，调用方不要修改取出的可变对象
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=16 * 1024 * 1024, default_ttl=30):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """返回 (是否命中, 值)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, size, ttl=None):
+        if size > self.max_bytes:
+            return
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, time.monotonic() + ttl)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
 
 class RedisCache:
-    def __init__(self):
-        self.redis_client = redis.Redis(
-            host='localhost',
-            port=6379,
-            db=0,
-            decode_responses=True
-        )
+    def __init__(self, local_cache=None, codec=None, url=REDIS_URL):
+        # 连接池在首次使用时创建，参数与 Celery broker 共用（见 config.py）
+        self.url = url
+        self._redis_client = None
+        self.codec = codec or Codec()
+        self.local_cache = local_cache
+        self.stats = {
+            'l1': {'hits': 0, 'misses': 0},
+            'l2': {'hits': 0, 'misses': 0, 'bytes_read': 0, 'bytes_written': 0},
+        }
+        self._pubsub_thread = None
+        self._pubsub_pid = None
+
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            pool = redis.ConnectionPool.from_url(self.url, **redis_pool_options())
+            self._redis_client = redis.Redis(connection_pool=pool)
+        return self._redis_client
+
+    @redis_client.setter
+    def redis_client(self, client):
+        self._redis_client = client
+
+    def _count(self, tier, outcome, n=1):
+        self.stats[tier][outcome] += n
+
+    def get_stats(self):
+        """各级缓存的命中/未命中次数、Redis读写字节数及L1占用"""
+        stats = {tier: dict(counts) for tier, counts in self.stats.items()}
+        if self.local_cache is not None:
+            stats['l1']['entries'] = len(self.local_cache)
+            stats['l1']['bytes'] = self.local_cache.size_bytes
+        return stats
+
+    def _local(self):
+        """
+        当前可用的L1；订阅线程未运行（Redis断开等）时返回 None，
+        因为此时收不到失效广播，继续使用L1可能读到旧数据
+        """
+        if self.local_cache is None:
+            return None
+        if self._pubsub_pid != os.getpid():
+            # gunicorn fork 之后每个 worker 需要自己的订阅线程和空的L1
+            self.local_cache.clear()
+            self._start_subscriber()
+        if self._pubsub_thread is None or not self._pubsub_thread.is_alive():
+            self._pubsub_thread = None
+            self._pubsub_pid = None
+            self.local_cache.clear()
+            return None
+        return self.local_cache
+
+    def _start_subscriber(self):
+        self._pubsub_pid = os.getpid()
+        try:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_invalidation})
+            self._pubsub_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        except Exception as e:
+            print(f"缓存失效订阅失败，停用本地缓存: {e}")
+            self._pubsub_thread = None
+
+    def _on_invalidation(self, message):
+        if self.local_cache is not None:
+            self.local_cache.delete(message['data'].decode('utf-8'))
+
+    def _broadcast_invalidation(self, key):
+        if self.local_cache is not None:
+            self.local_cache.delete(key)
+            self.redis_client.publish(INVALIDATION_CHANNEL, key)
     
     def get(self, key):
-        """获取缓存"""
+        """获取缓存：先查L1，再查Redis"""
+        local = self._local()
+        if local is not None:
+            hit, value = local.get(key)
+            if hit:
+                self._count('l1', 'hits')
+                return value
+            self._count('l1', 'misses')
         try:
             value = self.redis_client.get(key)
             if value:
-                return pickle.loads(value.encode('latin1'))
+                self._count('l2', 'hits')
+                self._count('l2', 'bytes_read', len(value))
+                result = self.codec.decode(value)
+                if local is not None:
+                    local.set(key, result, len(value))
+                return result
+            self._count('l2', 'misses')
             return None
         except Exception as e:
             print(f"缓存获取失败: {e}")
@@ -33,80 +263,348 @@ class RedisCache:
     def set(self, key, value, expire=3600):
         """设置缓存"""
         try:
+            data = self.codec.encode(value)
             self.redis_client.setex(
                 key,
                 expire,
-                pickle.dumps(value).decode('latin1')
+                data
             )
+            self._count('l2', 'bytes_written', len(data))
+            local = self._local()
+            if local is not None:
+                local.set(key, value, len(data), expire)
             return True
         except Exception as e:
             print(f"缓存设置失败: {e}")
             return False
     
     def delete(self, key):
-        """删除缓存"""
+        """删除缓存，并通知所有 worker 剔除L1中的副本"""
         try:
             self.redis_client.delete(key)
+            self._broadcast_invalidation(key)
             return True
         except Exception as e:
             print(f"缓存删除失败: {e}")
             return False
     
+    def get_many(self, keys):
+        """
+        批量获取：先查L1，剩余的键一次 MGET
+        返回 {键: 值}，只包含命中的键
+        """
+        results = {}
+        local = self._local()
+        missing = []
+        for key in keys:
+            if local is not None:
+                hit, value = local.get(key)
+                self._count('l1', 'hits' if hit else 'misses')
+                if hit:
+                    results[key] = value
+                    continue
+            missing.append(key)
+        if not missing:
+            return results
+        try:
+            for key, data in zip(missing, self.redis_client.mget(missing)):
+                if data is None:
+                    self._count('l2', 'misses')
+                    continue
+                self._count('l2', 'hits')
+                self._count('l2', 'bytes_read', len(data))
+                try:
+                    value = self.codec.decode(data)
+                except ValueError:
+                    continue
+                results[key] = value
+                if local is not None:
+                    local.set(key, value, len(data))
+        except Exception as e:
+            print(f"批量缓存获取失败: {e}")
+        return results
+
+    def set_many(self, mapping, expire=3600):
+        """批量设置：一个 pipeline 内多条 SETEX，一次往返"""
+        try:
+            encoded = {key: self.codec.encode(value) for key, value in mapping.items()}
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, data in encoded.items():
+                pipe.setex(key, expire, data)
+            pipe.execute()
+            self._count('l2', 'bytes_written', sum(len(data) for data in encoded.values()))
+            local = self._local()
+            if local is not None:
+                for key, data in encoded.items():
+                    local.set(key, mapping[key], len(data), expire)
+            return True
+        except Exception as e:
+            print(f"批量缓存设置失败: {e}")
+            return False
+
+    def delete_many(self, keys):
+        """批量删除：一条 DEL，并在同一 pipeline 内广播L1失效"""
+        keys = list(keys)
+        if not keys:
+            return True
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.delete(*keys)
+            if self.local_cache is not None:
+                for key in keys:
+                    self.local_cache.delete(key)
+                    pipe.publish(INVALIDATION_CHANNEL, key)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"批量缓存删除失败: {e}")
+            return False
+
+    def acquire_lock(self, key, timeout=10):
+        """非阻塞获取重新计算锁，成功返回锁对象，失败或Redis不可用返回 None"""
+        try:
+            lock = self.redis_client.lock(f"lock:{key}", timeout=timeout, blocking=False)
+            return lock if lock.acquire() else None
+        except Exception as e:
+            print(f"缓存锁获取失败: {e}")
+            return None
+
+    def release_lock(self, lock):
+        try:
+            lock.release()
+        except Exception:
+            # 锁已超时被释放或被他人持有，忽略
+            pass
+
     def clear_pattern(self, pattern):
-        """按模式清除缓存"""
+        """
+        按模式清除缓存（运维用，不要在请求路径上调用）
+        使用 SCAN 增量遍历，不会像 KEYS 那样阻塞 Redis
+        """
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                self.redis_client.delete(*keys)
-            return len(keys)
+            deleted = 0
+            batch = []
+            for key in self.redis_client.scan_iter(match=pattern, count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    deleted += self.redis_client.delete(*batch)
+                    batch = []
+            if batch:
+                deleted += self.redis_client.delete(*batch)
+            return deleted
         except Exception as e:
             print(f"模式清除失败: {e}")
             return 0
 
-# 创建全局缓存实例
-cache = RedisCache()
+    def namespace_versions(self, namespaces):
+        """
+        一次 MGET 取回多个命名空间的当前版本号
+        版本号不存在时（首次使用或被淘汰）以当前毫秒时间戳初始化，保证不会回到旧版本
+        """
+        if not namespaces:
+            return []
+        version_keys = [f"ns:{namespace}" for namespace in namespaces]
+        versions = [None] * len(version_keys)
+        # 版本号是最热的键，优先从L1读取
+        local = self._local()
+        if local is not None:
+            for i, version_key in enumerate(version_keys):
+                hit, version = local.get(version_key)
+                self._count('l1', 'hits' if hit else 'misses')
+                if hit:
+                    versions[i] = version
+        missing = [i for i, version in enumerate(versions) if version is None]
+        if not missing:
+            return versions
+        try:
+            fetched = self.redis_client.mget([version_keys[i] for i in missing])
+            for i, version in zip(missing, fetched):
+                if version is None:
+                    initial = int(time.time() * 1000)
+                    self.redis_client.set(version_keys[i], initial, nx=True)
+                    version = self.redis_client.get(version_keys[i]) or initial
+                if isinstance(version, bytes):
+                    version = version.decode('ascii')
+                versions[i] = str(version)
+                if local is not None:
+                    local.set(version_keys[i], versions[i], len(versions[i]))
+            return versions
+        except Exception as e:
+            print(f"版本号获取失败: {e}")
+            return None
+
+    def namespaced_key(self, namespaces, key):
+        """生成带命名空间版本号的缓存键，取版本号失败时返回 None"""
+        versions = self.namespace_versions(namespaces)
+        if versions is None:
+            return None
+        suffix = ",".join(f"{namespace}@{version}" for namespace, version in zip(namespaces, versions))
+        return f"{key}#{suffix}"
+
+    def invalidate_namespace(self, namespace):
+        """使命名空间下的所有缓存失效：一次 INCR（版本号不存在时先按时间戳初始化）"""
+        try:
+            version_key = f"ns:{namespace}"
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.set(version_key, int(time.time() * 1000), nx=True)
+            pipe.incr(version_key)
+            pipe.execute()
+            self._broadcast_invalidation(version_key)
+            return True
+        except Exception as e:
+            print(f"命名空间失效失败: {e}")
+            return False
+
+# 创建全局缓存实例；CACHE_L1_ENTRIES=0 关闭进程内缓存
+_l1_entries = int(os.environ.get('CACHE_L1_ENTRIES', 1000))
+cache = RedisCache(
+    codec=Codec(
+        serializer=os.environ.get('CACHE_SERIALIZER', 'pickle'),
+        compress_threshold=int(os.environ.get('CACHE_COMPRESS_THRESHOLD', 1024)),
+    ),
+    local_cache=LocalLRU(
+        max_entries=_l1_entries,
+        max_bytes=int(os.environ.get('CACHE_L1_BYTES', 16 * 1024 * 1024)),
+        default_ttl=int(os.environ.get('CACHE_L1_TTL', 30)),
+    ) if _l1_entries > 0 else None
+)
 
-def cache_view(timeout=300):
-    """视图缓存装饰器"""
+def _format_namespaces(namespaces, kwargs):
+    """命名空间可以引用视图参数，例如 'post:{post_id}'"""
+    return [namespace.format(**kwargs) for namespace in namespaces]
+
+def build_view_key(name, view_args, query_args=(), vary_on_auth=True, vary_on_user=False):
+    """
+    生成视图缓存键，只包含视图声明的变化维度：
+    - view_args: 路由参数（全部参与）
+    - query_args: 参与的查询参数名，其它查询参数（如统计用的 utm_*）被忽略
+    - vary_on_auth: 是否区分登录/未登录
+    - vary_on_user: 是否区分登录用户（页面含个人信息时开启）
+    各部分排序、URL编码后拼接；超过 MAX_KEY_LENGTH 时对变体部分取 SHA1
+    """
+    parts = [f"{k}={quote(str(v), safe='')}" for k, v in sorted(view_args.items())]
+    for arg in sorted(query_args):
+        values = [v.strip() for v in request.args.getlist(arg) if v.strip()]
+        if values:
+            parts.append(f"?{arg}=" + ",".join(quote(v, safe='') for v in values))
+    authenticated = current_user.is_authenticated
+    if vary_on_auth or vary_on_user:
+        parts.append("auth" if authenticated else "anon")
+    if vary_on_user and authenticated:
+        parts.append(f"user={current_user.get_id()}")
+
+    variant = "&".join(parts)
+    key = f"view:{name}:{variant}"
+    if len(key) > MAX_KEY_LENGTH:
+        digest = hashlib.sha1(variant.encode('utf-8')).hexdigest()
+        key = f"view:{name}:h:{digest}"
+    return key
+
+def _should_refresh_early(entry, beta):
+    """XFetch：越接近软过期、上次计算越慢，越可能提前刷新"""
+    if beta <= 0:
+        return False
+    return time.time() - entry['delta'] * beta * math.log(1.0 - random.random()) >= entry['soft_expire']
+
+def _compute_and_store(f, args, kwargs, cache_key, timeout, stale_ttl):
+    """
+    执行视图并写入缓存条目（值 + 软过期时间 + 计算耗时）
+    渲染时只读主库：用延迟的副本数据渲染的页面会带着新的命名空间版本号一直缓存到过期
+    """
+    start = time.time()
+    with primary_reads():
+        result = f(*args, **kwargs)
+    delta = time.time() - start
+    # 缓存结果（重定向、错误响应等不缓存）
+    if isinstance(result, str):
+        entry = {'value': result, 'soft_expire': time.time() + timeout, 'delta': delta}
+        cache.set(cache_key, entry, timeout + stale_ttl)
+    return result
+
+def cache_view(timeout=300, namespaces=(), query_args=(), vary_on_auth=True, vary_on_user=False,
+               stale_ttl=0, early_refresh_beta=1.0, lock_timeout=10, lock_wait=2.0):
+    """
+    视图缓存装饰器
+    namespaces: 结果所依赖的命名空间，任一命名空间失效后缓存自动作废
+    query_args / vary_on_auth / vary_on_user: 缓存键的变化维度，见 build_view_key
+    stale_ttl: 软过期后仍可返回旧值的秒数，期间由一个请求负责刷新
+    early_refresh_beta: 提前概率刷新的强度，0 表示关闭
+    lock_timeout / lock_wait: 重新计算锁的超时，以及没有旧值时等待他人计算的最长秒数
+    只缓存渲染好的HTML字符串；会话里有待显示的 flash 消息时不读写缓存
+    命中、未命中不逐条打印（每个请求都会经过这里），命中率看 cache.get_stats() / metrics
+    配置 VIEW_CACHE = False 时整体关闭（如基准测试对比有无缓存）
+    """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            if session.get('_flashes') or not current_app.config.get('VIEW_CACHE', True):
+                return f(*args, **kwargs)
+
             # 生成缓存键
-            cache_key = f"view:{f.__name__}:{str(kwargs)}"
+            cache_key = build_view_key(f.__name__, kwargs, query_args, vary_on_auth, vary_on_user)
+            if namespaces:
+                cache_key = cache.namespaced_key(_format_namespaces(namespaces, kwargs), cache_key)
+                if cache_key is None:
+                    # Redis不可用时直接执行视图
+                    return f(*args, **kwargs)
             
             # 尝试从缓存获取
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                print(f"✅ 缓存命中: {cache_key}")
-                return cached_result
-            
-            # 执行原函数
-            print(f"❌ 缓存未命中: {cache_key}")
-            result = f(*args, **kwargs)
+            entry = cache.get(cache_key)
+            if entry is not None:
+                fresh = time.time() < entry['soft_expire']
+                if fresh and not _should_refresh_early(entry, early_refresh_beta):
+                    return entry['value']
+                # 需要刷新：只有拿到锁的请求重新计算，其它请求直接返回旧值
+                lock = cache.acquire_lock(cache_key, lock_timeout)
+                if lock is None:
+                    return entry['value']
+                try:
+                    return _compute_and_store(f, args, kwargs, cache_key, timeout, stale_ttl)
+                finally:
+                    cache.release_lock(lock)
             
-            # 缓存结果
-            cache.set(cache_key, result, timeout)
-            return result
+            # 缓存未命中：合并并发请求，只有一个请求执行原函数
+            lock = cache.acquire_lock(cache_key, lock_timeout)
+            if lock is None:
+                deadline = time.time() + lock_wait
+                while time.time() < deadline:
+                    time.sleep(0.05)
+                    entry = cache.get(cache_key)
+                    if entry is not None:
+                        return entry['value']
+                # 等待超时（计算者失败或太慢），自己计算
+                return _compute_and_store(f, args, kwargs, cache_key, timeout, stale_ttl)
+            try:
+                return _compute_and_store(f, args, kwargs, cache_key, timeout, stale_ttl)
+            finally:
+                cache.release_lock(lock)
         return decorated_function
     return decorator
 
-def cache_invalidate(pattern):
-    """缓存失效装饰器"""
+def cache_invalidate(*namespaces):
+    """
+    缓存失效装饰器
+    视图执行后把相关命名空间的版本号 +1，例如 @cache_invalidate('index', 'post:{post_id}')
+    """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             # 先执行函数
             result = f(*args, **kwargs)
             
-            # 然后清除相关缓存
-            deleted_count = cache.clear_pattern(pattern)
-            print(f"🗑️  清除缓存: {pattern} ({deleted_count}个)")
+            # 然后使相关命名空间失效（仅对写请求生效，GET 只是渲染表单）
+            if request.method != 'GET':
+                for namespace in _format_namespaces(namespaces, kwargs):
+                    cache.invalidate_namespace(namespace)
+                    print(f"🗑️  命名空间失效: {namespace}")
             
             return result
         return decorated_function
     return decorator
 
 if __name__ == '__main__':
+    from app import app
+
     # 测试缓存功能
     with app.app_context():
         # 测试基本缓存
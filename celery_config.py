@@ -4,15 +4,18 @@ Celery配置 - 学习：进程管理、消息队列、后台任务
 """
 
 from celery import Celery
+from celery.schedules import crontab
 import pymysql
 pymysql.install_as_MySQLdb()
 
+from config import REDIS_URL, CELERY_RESULT_BACKEND, celery_redis_options
+
 # 创建Celery应用
 def make_celery():
     celery = Celery(
         'blog_tasks',
-        broker='redis://localhost:6379/0',
-        backend='redis://localhost:6379/1',
+        broker=REDIS_URL,
+        backend=CELERY_RESULT_BACKEND,
         include=['celery_tasks']
     )
     
@@ -23,7 +26,38 @@ def make_celery():
         result_serializer='json',
         timezone='Asia/Shanghai',
         enable_utc=True,
+        # 连接池参数与缓存共用 config.py 中的设置
+        **celery_redis_options(),
     )
+
+    # 定时任务（celery -A celery_config beat）
+    celery.conf.beat_schedule = {
+        # 阅读数每30秒批量落库一次，Redis 故障时最多丢失这段时间的阅读数
+        'flush-view-counts': {
+            'task': 'celery_tasks.flush_view_counts',
+            'schedule': 30.0,
+        },
+        # 热度随时间衰减，全量重算一次（百万文章也只是一条查询和几次数组运算）
+        'score-hot-posts': {
+            'task': 'celery_tasks.update_post_statistics',
+            'schedule': 600.0,
+        },
+        # 复制心跳：只读副本上的心跳比当前时间落后多少就是复制延迟（REPLICA_MAX_LAG 要大于这个间隔）
+        'replica-heartbeat': {
+            'task': 'celery_tasks.replica_heartbeat',
+            'schedule': 5.0,
+        },
+        # 每天凌晨全量备份，其余时间每小时增量备份
+        'backup-database-full': {
+            'task': 'celery_tasks.backup_database',
+            'schedule': crontab(hour=3, minute=0),
+        },
+        'backup-database-incremental': {
+            'task': 'celery_tasks.backup_database',
+            'schedule': crontab(minute=30),
+            'kwargs': {'incremental': True},
+        },
+    }
     
     return celery
 
@@ -4,7 +4,9 @@
 """
 
 from celery_config import celery
+from celery.signals import task_postrun
 from app import app, db, User, Post, Comment
+import metrics
 import smtplib
 from email.mime.text import MIMEText
 import time
@@ -39,64 +41,167 @@ def send_email_notification(self, to_email, subject, content):
         raise self.retry(countdown=60, exc=e)  # 60秒后重试
 
 @celery.task
-def update_post_statistics(post_id):
+def update_post_statistics(post_ids=None):
     """
-    更新文章统计信息 - 学习：CPU密集型任务异步化
+    更新文章热度分 - 学习：CPU密集型任务的向量化批处理
+    post_ids 为 None 时一次计算全部文章（定时任务），否则只计算给定文章
     """
     with app.app_context():
         try:
-            print(f"📊 开始更新文章统计: {post_id}")
+            from hot_posts import score_posts
+            if isinstance(post_ids, (int, str)):
+                post_ids = [post_ids]
+            if post_ids is not None:
+                post_ids = [int(post_id) for post_id in post_ids]
+            start = time.time()
+            scored = score_posts(post_ids)
+            elapsed = time.time() - start
+            print(f"📊 文章热度更新完成: {scored}篇，用时 {elapsed:.2f}s")
+            return {"status": "success", "scored": scored, "seconds": round(elapsed, 3)}
             
-            post = Post.query.get(post_id)
-            if not post:
-                return {"status": "error", "message": "文章不存在"}
-            
-            # 计算阅读量趋势（模拟复杂计算）
-            time.sleep(1)
-            
-            # 更新评论数缓存
-            comment_count = Comment.query.filter_by(post_id=post_id).count()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ 统计更新失败: {e}")
+            return {"status": "error", "message": str(e)}
+
+# 合并派发：同一组里待处理的项目放进 Redis 集合，窗口内只投递一个批量任务
+COALESCE_PREFIX = 'coalesce:'
+# 热度重算的合并窗口（秒）：窗口内的评论合并成一次计算（阅读数由落库任务按批派发）
+STATS_COALESCE_WINDOW = 60
+# 每次从集合里取出的项目数
+COALESCE_BATCH_SIZE = 1000
+# 批量任务失败后重试的间隔（秒），失败的项目放回集合
+COALESCE_RETRY_DELAY = 60
+
+def dispatch_coalesced(task, group, item, window):
+    """
+    合并派发 - 学习：防抖、去重、批处理
+    把 item 记入 coalesce:<group>:pending 集合；只有窗口内第一次派发会投递一个延迟 window 秒的
+    drain_coalesced 任务，由它把集合里所有项目一次交给 task(items)。
+    消息数和 worker 工作量与不同项目数成正比，而不是事件数。Redis 不可用时直接派发单个项目。
+    """
+    from cache_helper import cache
+    pending_key = f"{COALESCE_PREFIX}{group}:pending"
+    scheduled_key = f"{COALESCE_PREFIX}{group}:scheduled"
+    try:
+        pipe = cache.redis_client.pipeline(transaction=False)
+        pipe.sadd(pending_key, item)
+        # 标记带过期时间：万一批量任务丢失，过期后下一次派发会重新投递
+        pipe.set(scheduled_key, 1, nx=True, ex=window * 2 + 60)
+        _, first = pipe.execute()
+    except Exception as e:
+        print(f"⚠️  合并派发不可用，直接派发: {e}")
+        return task.delay([item])
+    if first:
+        return drain_coalesced.apply_async(args=(task.name, group), countdown=window)
+    return None
+
+@celery.task(bind=True, max_retries=3)
+def drain_coalesced(self, task_name, group):
+    """
+    取出一组里积累的全部项目，分批交给对应任务在本 worker 内执行
+    先清除调度标记再取项目：清除之后到来的派发会投递新的批量任务，不会有项目滞留
+    某一批失败（抛异常或返回 status 不是 success）时把这批项目放回集合，稍后重试
+    """
+    from cache_helper import cache
+    r = cache.redis_client
+    r.delete(f"{COALESCE_PREFIX}{group}:scheduled")
+    pending_key = f"{COALESCE_PREFIX}{group}:pending"
+    task = celery.tasks[task_name]
+    drained = 0
+    while True:
+        items = r.spop(pending_key, COALESCE_BATCH_SIZE)
+        if not items:
+            break
+        items = [item.decode('utf-8') if isinstance(item, bytes) else item for item in items]
+        try:
+            result = task(items)
+            error = None
+            if isinstance(result, dict) and result.get('status') != 'success':
+                error = result.get('message', result.get('status'))
+        except Exception as e:
+            error = e
+        if error is not None:
+            r.sadd(pending_key, *items)
+            print(f"❌ 合并任务 {group} 失败，{len(items)}项放回稍后重试: {error}")
+            # 重试次数用完后项目仍留在集合里，下一次派发会把它们一起带上
+            raise self.retry(countdown=COALESCE_RETRY_DELAY,
+                             exc=error if isinstance(error, Exception) else RuntimeError(error))
+        drained += len(items)
+    print(f"🧺 合并任务 {group}: {drained}项")
+    return {"status": "success", "group": group, "drained": drained}
+
+def schedule_post_statistics(post_id):
+    """文章有新的阅读或评论：窗口内同一篇文章只重算一次，所有文章合并成一个批量任务"""
+    return dispatch_coalesced(update_post_statistics, 'post_statistics', post_id,
+                              STATS_COALESCE_WINDOW)
+
+@celery.task
+def backup_database(incremental=False):
+    """
+    数据库备份任务 - 学习：定时任务、流式导出、资源管理
+    incremental=True 时只导出上一次备份之后的变化
+    """
+    with app.app_context():
+        try:
+            from backup import create_backup, prune_backups
+            print("💾 开始数据库备份...")
+            start = time.time()
             
-            # 模拟一些数据分析
-            import random
-            popularity_score = comment_count * random.uniform(0.8, 1.2)
+            # 1. 流式导出为压缩、带校验和的归档
+            info = create_backup(incremental=incremental)
             
-            print(f"✅ 文章统计更新完成: {post_id}")
-            print(f"   评论数: {comment_count}, 热度分: {popularity_score:.2f}")
+            # 2. 清理过期备份
+            removed = prune_backups()
             
+            print(f"✅ 数据库备份完成: {info['path']} ({info['rows']}行, {time.time() - start:.2f}s)")
             return {
-                "status": "success", 
-                "post_id": post_id,
-                "comment_count": comment_count,
-                "popularity_score": popularity_score
+                "status": "success",
+                "backup_time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "path": info['path'],
+                "mode": info['mode'],
+                "rows": info['rows'],
+                "bytes": info['bytes'],
+                "sha256": info['sha256'],
+                "pruned": removed
             }
             
         except Exception as e:
-            print(f"❌ 统计更新失败: {e}")
+            print(f"❌ 备份失败: {e}")
             return {"status": "error", "message": str(e)}
 
 @celery.task
-def backup_database():
+def flush_view_counts():
     """
-    数据库备份任务 - 学习：定时任务、资源管理
+    阅读数批量落库 - 学习：写缓冲、定时任务
     """
-    try:
-        print("💾 开始数据库备份...")
-        
-        # 模拟备份过程
-        time.sleep(3)
-        
-        # 这里可以添加真实的备份逻辑
-        # 1. 导出数据库
-        # 2. 上传到云存储
-        # 3. 清理旧备份
-        
-        print("✅ 数据库备份完成")
-        return {"status": "success", "backup_time": time.strftime("%Y-%m-%d %H:%M:%S")}
-        
-    except Exception as e:
-        print(f"❌ 备份失败: {e}")
-        return {"status": "error", "message": str(e)}
+    with app.app_context():
+        try:
+            from view_counter import flush_views
+            # 阅读数变化的文章按批重算热度：落库周期本身就是合并窗口
+            flushed = flush_views(on_flushed=update_post_statistics.delay)
+            if flushed:
+                print(f"👀 阅读数落库: {flushed}次")
+            return {"status": "success", "flushed": flushed}
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ 阅读数落库失败: {e}")
+            return {"status": "error", "message": str(e)}
+
+@celery.task
+def replica_heartbeat():
+    """
+    主库写入复制心跳 - 学习：复制延迟检测（只读副本据此判断是否落后太多）
+    """
+    with app.app_context():
+        try:
+            from replicas import replica_binds, write_heartbeat
+            if not replica_binds(app):
+                return {"status": "skipped", "message": "没有配置只读副本"}
+            return {"status": "success", "beat": write_heartbeat(db)}
+        except Exception as e:
+            print(f"❌ 复制心跳写入失败: {e}")
+            return {"status": "error", "message": str(e)}
 
 @celery.task
 def process_user_registration(user_id):
@@ -140,10 +245,19 @@ def process_user_registration(user_id):
             print(f"❌ 用户注册处理失败: {e}")
             return {"status": "error", "message": str(e)}
 
+@task_postrun.connect
+def report_worker_metrics(**kwargs):
+    """任务结束时把本进程的连接池、缓存指标写入 /metrics（按 FLUSH_INTERVAL 节流）"""
+    with app.app_context():
+        metrics.maybe_flush()
+
 if __name__ == '__main__':
     print("✅ Celery任务模块加载成功")
     print("   可用的任务:")
     print("   - send_email_notification")
     print("   - update_post_statistics") 
+    print("   - drain_coalesced")
     print("   - backup_database")
+    print("   - flush_view_counts")
+    print("   - replica_heartbeat")
     print("   - process_user_registration")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+HTTP条件请求 - 学习：ETag、Last-Modified、304 Not Modified
+只用元数据（更新时间、计数）计算校验值，命中时在渲染、读缓存、加载正文之前直接返回304。
+"""
+
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+
+
+def make_etag(parts):
+    """由元数据拼出不透明的ETag；页面导航栏因人而异，所以带上当前用户"""
+    user = current_user.get_id() if current_user.is_authenticated else 'anon'
+    raw = "|".join(str(part) for part in parts) + f"|{user}"
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def _as_http_date(value):
+    """数据库里是不带时区的UTC时间，HTTP日期只精确到秒"""
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def is_not_modified(etag, last_modified):
+    """按 RFC 7232：有 If-None-Match 时只看它，否则看 If-Modified-Since"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # 每次都向服务器确认（代价只是一条元数据查询），登录用户的页面不允许共享缓存
+    response.cache_control.no_cache = True
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional_view(validators):
+    """
+    条件请求装饰器（放在 cache_view 外层）
+    validators(**view_args) 返回 (参与ETag的元数据列表, 最后修改时间) 或 None（交给视图处理，如404）；
+    最后修改时间只有在每一项元数据变化时都会跟着变大才能给出，否则返回 None 只用 ETag
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # 有待显示的 flash 消息时页面内容不同，必须重新渲染
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return f(*args, **kwargs)
+            if not current_app.config.get('CONDITIONAL_REQUESTS', True):
+                return f(*args, **kwargs)
+
+            meta = validators(**kwargs)
+            if meta is None:
+                return f(*args, **kwargs)
+            parts, last_modified = meta
+            etag = make_etag(parts)
+            last_modified = _as_http_date(last_modified)
+
+            if is_not_modified(etag, last_modified):
+                return _set_validators(make_response('', 304), etag, last_modified)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            return _set_validators(response, etag, last_modified)
+        return decorated_function
+    return decorator
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+配置 - 学习：环境变量配置、连接池
+Redis 连接参数由缓存和 Celery 共用，避免两边各自使用默认配置。
+
+数据库连接池按进程类型（web / worker）分别配置：每个 gunicorn worker 和每个 Celery 子进程
+各有一个连接池，总连接数 = 进程数 × (pool_size + max_overflow)，要小于 MySQL 的 max_connections。
+空闲连接在 pool_recycle 秒后重建、取出前 pre-ping，避免超过 wait_timeout 后被服务端断开的连接报错。
+DATABASE_URL 以 sqlite:/// 开头时使用 SQLite 配置（测试、基准、本地开发）。
+"""
+
+import os
+import sys
+
+# Redis 地址（缓存与 Celery broker 共用）
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+# Celery 结果存储
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/1')
+
+# 每个进程的 Redis 连接池上限
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 20))
+# 读写超时、建连超时（秒），Redis 卡住时请求快速失败而不是一直挂起
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 2.0))
+REDIS_CONNECT_TIMEOUT = float(os.environ.get('REDIS_CONNECT_TIMEOUT', 1.0))
+# 空闲连接超过该秒数后，使用前先 PING 检查
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+
+
+def redis_pool_options():
+    """redis-py ConnectionPool 参数"""
+    return {
+        'max_connections': REDIS_MAX_CONNECTIONS,
+        'socket_timeout': REDIS_SOCKET_TIMEOUT,
+        'socket_connect_timeout': REDIS_CONNECT_TIMEOUT,
+        'health_check_interval': REDIS_HEALTH_CHECK_INTERVAL,
+    }
+
+
+def celery_redis_options():
+    """Celery 的 broker / 结果存储连接参数，与缓存连接池保持一致"""
+    return {
+        'broker_pool_limit': REDIS_MAX_CONNECTIONS,
+        'broker_transport_options': {
+            'socket_timeout': REDIS_SOCKET_TIMEOUT,
+            'socket_connect_timeout': REDIS_CONNECT_TIMEOUT,
+            'health_check_interval': REDIS_HEALTH_CHECK_INTERVAL,
+        },
+        'redis_max_connections': REDIS_MAX_CONNECTIONS,
+        'redis_socket_timeout': REDIS_SOCKET_TIMEOUT,
+        'redis_socket_connect_timeout': REDIS_CONNECT_TIMEOUT,
+    }
+
+
+# 未设置 DATABASE_URL 时使用本地 SQLite 文件（相对路径以应用目录为准）；
+# MySQL 的账号密码只从环境变量 / .env 读取，不写进代码
+DEFAULT_DATABASE_URL = 'sqlite:///blog.db'
+
+# 各进程类型的连接池默认值；环境变量 DB_POOL_SIZE 等覆盖所有进程，
+# WEB_DB_POOL_SIZE / WORKER_DB_POOL_SIZE 只覆盖一种进程
+DATABASE_PROFILES = {
+    # 请求处理：连接池小、SELECT 超过5秒直接中止，慢查询不会拖住 worker
+    'web': {'pool_size': 5, 'max_overflow': 5, 'pool_timeout': 10, 'pool_recycle': 280,
+            'pool_pre_ping': True, 'statement_timeout_ms': 5000},
+    # Celery：每个子进程同时只执行一个任务；备份、热度计算等批量任务不限制语句时间
+    'worker': {'pool_size': 2, 'max_overflow': 2, 'pool_timeout': 30, 'pool_recycle': 280,
+               'pool_pre_ping': True, 'statement_timeout_ms': 0},
+}
+# SQLite 等待写锁的秒数
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 30))
+
+
+# 按 web 配置的启动命令（python -m flask 时 argv[0] 为 .../flask/__main__.py）和入口脚本
+WEB_COMMANDS = ('gunicorn', 'uwsgi', 'flask', 'waitress-serve')
+WEB_SCRIPTS = ('app.py', 'wsgi.py')
+
+
+def process_type():
+    """
+    BLOG_PROCESS_TYPE 指定；未指定时 gunicorn、flask run、python app.py 启动的是 web，
+    Celery 和 backup.py、search.py 等命令行脚本是 worker（批量查询不受 web 的语句超时限制）。
+    嵌入式服务器（mod_wsgi）的 argv 为空，按 web 处理，wsgi.py 也会显式设置
+    """
+    explicit = os.environ.get('BLOG_PROCESS_TYPE')
+    if explicit:
+        return explicit
+    command = os.path.normpath(sys.argv[0]) if sys.argv and sys.argv[0] else ''
+    if not command or command == '-c':
+        return 'web'
+    parent, name = os.path.split(command)
+    if name == '__main__.py':
+        name = os.path.basename(parent)
+    return 'web' if name in WEB_COMMANDS or name in WEB_SCRIPTS else 'worker'
+
+
+def _setting(process, name, default):
+    value = os.environ.get(f'{process.upper()}_DB_{name.upper()}', os.environ.get(f'DB_{name.upper()}'))
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes')
+    return type(default)(value)
+
+
+def database_settings(process=None):
+    """当前进程类型生效的连接池设置（环境变量覆盖后的 DATABASE_PROFILES）"""
+    process = process or process_type()
+    profile = DATABASE_PROFILES.get(process, DATABASE_PROFILES['web'])
+    return {name: _setting(process, name, default) for name, default in profile.items()}
+
+
+def database_config(process=None):
+    """
+    Flask-SQLAlchemy 的数据库配置：SQLALCHEMY_DATABASE_URI、SQLALCHEMY_BINDS（只读副本）和 SQLALCHEMY_ENGINE_OPTIONS
+    每次调用时读取环境变量（基准、数据生成脚本会在导入 app 之前设置 DATABASE_URL）
+    """
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.pool import StaticPool
+
+    url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    backend = make_url(url).get_backend_name()
+    # 只读副本（逗号分隔），连接池参数与主库相同
+    replica_urls = [item.strip() for item in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if item.strip()]
+    binds = {f'replica{i}': replica_url for i, replica_url in enumerate(replica_urls)}
+    if backend == 'sqlite':
+        # SQLAlchemy 对 SQLite 文件库默认不使用连接池，连接池参数不适用
+        options = {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT, 'check_same_thread': False}}
+        if make_url(url).database in (None, '', ':memory:'):
+            # 内存库只存在于一个连接里，所有线程共用这一个连接
+            options['poolclass'] = StaticPool
+        return {'SQLALCHEMY_DATABASE_URI': url, 'SQLALCHEMY_BINDS': binds, 'SQLALCHEMY_ENGINE_OPTIONS': options}
+
+    settings = database_settings(process)
+    options = {name: settings[name] for name in
+               ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle', 'pool_pre_ping')}
+    timeout_ms = settings['statement_timeout_ms']
+    if backend == 'mysql':
+        options['connect_args'] = {'connect_timeout': 10}
+        if timeout_ms:
+            # MySQL 5.7.8+：只对只读 SELECT 生效，写操作不受影响
+            options['connect_args']['init_command'] = f'SET SESSION max_execution_time={int(timeout_ms)}'
+    elif backend == 'postgresql' and timeout_ms:
+        options['connect_args'] = {'options': f'-c statement_timeout={int(timeout_ms)}'}
+    return {'SQLALCHEMY_DATABASE_URI': url, 'SQLALCHEMY_BINDS': binds, 'SQLALCHEMY_ENGINE_OPTIONS': options}
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+内容批量导入导出 - 学习：NDJSON 流式处理、executemany、批量解析外键、可恢复的检查点
+与 backup.py 的区别：这里导出的是可移植的内容（作者、分类、标签用名字表示，不带数据库id），
+可以导入到另一个已有数据的博客里。
+
+每行一篇文章（评论内嵌）：
+    {"type": "post", "id": 12, "title": "...", "content": "...", "author": "alice",
+     "category": "Python", "tags": ["flask", "redis"],
+     "created_at": "2024-01-01T08:00:00", "updated_at": "2024-01-02T09:00:00",
+     "comments": [{"author": "bob", "content": "...", "created_at": "..."}]}
+导入时 id 只作参考，文章重新分配id；不存在的作者会建成无密码（不能登录）的用户，
+不存在的分类、标签批量创建。
+
+导入按 IMPORT_BATCH_SIZE 篇一批：一批文章、关联、评论各一条 executemany，计数列批量更新，
+检查点（已处理的字节偏移和行数）和这批数据在同一个事务里提交，中断后重跑会从检查点继续，不会重复导入。
+导入不更新搜索索引，完成后运行 python search.py rebuild。
+
+运行：python content_transfer.py export [-o posts.ndjson] [--since 2024-01-01T00:00:00]
+      python content_transfer.py import posts.ndjson [--checkpoint 名字 | --no-checkpoint]
+"""
+
+import pymysql
+pymysql.install_as_MySQLdb()
+
+import gzip
+import json
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from models import db, User, Post, Category, Tag, Comment, ImportCheckpoint, post_tag
+from bulk import insert_ignore, match_names
+from tag_service import resolve_tags, normalize_tag_names
+import counters
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+# 导入时分配的文章id与并发发布的文章冲突时，重新分配的次数
+MAX_ID_RETRIES = 3
+# 自动创建的作者账号的邮箱域名（保留域名，不会真的发信）
+IMPORTED_EMAIL_DOMAIN = 'imported.invalid'
+
+
+class ContentImportError(ValueError):
+    """导入失败，line_number 是出错的（第一）行；之前的批次已提交"""
+
+    def __init__(self, line_number, message):
+        super().__init__(message)
+        self.line_number = line_number
+
+
+class ImportFormatError(ContentImportError):
+    """导入文件某一行格式不对"""
+
+    def __init__(self, line_number, message):
+        super().__init__(line_number, f"第 {line_number} 行: {message}")
+
+
+class ImportBatchError(ContentImportError):
+    """一批数据写入数据库失败，整批已回滚"""
+
+    def __init__(self, first_line, last_line, message):
+        super().__init__(first_line, f"第 {first_line}-{last_line} 行写入失败: {message}")
+        self.last_line = last_line
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def export_posts(since=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    逐行产出 NDJSON 字符串（生成器）
+    按主键分批（WHERE id > ? LIMIT ?），每批的标签、评论各用一条 IN 查询取回，内存只占一批
+    since 给出时只导出此后更新过的文章
+    """
+    last_id = 0
+    while True:
+        query = (db.session.query(Post.id, Post.title, Post.content, User.username, Category.name,
+                                  Post.created_at, Post.updated_at)
+                 .join(User, User.id == Post.user_id)
+                 .join(Category, Category.id == Post.category_id)
+                 .filter(Post.id > last_id))
+        if since is not None:
+            query = query.filter(Post.updated_at > since)
+        posts = query.order_by(Post.id).limit(batch_size).all()
+        if not posts:
+            return
+        post_ids = [post.id for post in posts]
+
+        tags = defaultdict(list)
+        for post_id, name in (db.session.query(post_tag.c.post_id, Tag.name)
+                              .join(Tag, Tag.id == post_tag.c.tag_id)
+                              .filter(post_tag.c.post_id.in_(post_ids))
+                              .order_by(post_tag.c.post_id, Tag.name)):
+            tags[post_id].append(name)
+        comments = defaultdict(list)
+        for post_id, author, content, created_at in (
+                db.session.query(Comment.post_id, User.username, Comment.content, Comment.created_at)
+                .join(User, User.id == Comment.user_id)
+                .filter(Comment.post_id.in_(post_ids))
+                .order_by(Comment.post_id, Comment.created_at, Comment.id)):
+            comments[post_id].append({'author': author, 'content': content,
+                                      'created_at': _isoformat(created_at)})
+
+        for post_id, title, content, author, category, created_at, updated_at in posts:
+            yield json.dumps({
+                'type': 'post', 'id': post_id, 'title': title, 'content': content,
+                'author': author, 'category': category, 'tags': tags[post_id],
+                'created_at': _isoformat(created_at), 'updated_at': _isoformat(updated_at),
+                'comments': comments[post_id],
+            }, ensure_ascii=False) + '\n'
+        last_id = post_ids[-1]
+        db.session.expunge_all()
+
+
+def _parse_datetime(value, line_number, default):
+    if value is None:
+        return default
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ImportFormatError(line_number, f"无法解析的时间: {value!r}")
+
+
+def _parse_record(line, line_number, now):
+    """一行 -> 规范化后的文章 dict；空行返回 None"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        raise ImportFormatError(line_number, f"不是合法的JSON: {e}")
+    if not isinstance(record, dict) or record.get('type', 'post') != 'post':
+        raise ImportFormatError(line_number, "只支持 type 为 post 的记录")
+    for field in ('title', 'content', 'author', 'category'):
+        if not isinstance(record.get(field), str) or not record[field].strip():
+            raise ImportFormatError(line_number, f"缺少字段 {field}")
+    created_at = _parse_datetime(record.get('created_at'), line_number, now)
+    comments = []
+    for comment in record.get('comments') or []:
+        if not isinstance(comment, dict) or not comment.get('content') or not comment.get('author'):
+            raise ImportFormatError(line_number, "评论缺少 author 或 content")
+        comments.append({'author': comment['author'].strip()[:80], 'content': comment['content'],
+                         'created_at': _parse_datetime(comment.get('created_at'), line_number, now)})
+    return {
+        'title': record['title'][:200],
+        'content': record['content'],
+        'author': record['author'].strip()[:80],
+        'category': record['category'].strip()[:200],
+        'tags': normalize_tag_names(record.get('tags') or []),
+        'created_at': created_at,
+        'updated_at': _parse_datetime(record.get('updated_at'), line_number, created_at),
+        'comments': comments,
+    }
+
+
+def _resolve_names(model, column, names, make_row):
+    """
+    名字 -> id：一条 IN 查询取已有的，缺失的一次 INSERT IGNORE 后再取回
+    结果按请求的名字为键（数据库排序规则不区分大小写时，'flask' 对应到已有的 'Flask'）
+    """
+    names = sorted(set(names))
+    if not names:
+        return {}
+    ids = match_names(names, db.session.query(column, model.id).filter(column.in_(names)))
+    missing = [name for name in names if name not in ids]
+    if missing:
+        insert_ignore(model.__table__, [make_row(name) for name in missing])
+        ids.update(match_names(missing, db.session.query(column, model.id).filter(column.in_(missing))))
+    unresolved = [name for name in names if name not in ids]
+    if unresolved:
+        raise LookupError(f"{model.__tablename__} 无法对应到数据库中的行: {', '.join(unresolved[:5])}")
+    return ids
+
+
+def _resolve_authors(names):
+    return _resolve_names(User, User.username, names, lambda name: {
+        'username': name,
+        'email': f"{name}@{IMPORTED_EMAIL_DOMAIN}"[:120],
+    })
+
+
+def _resolve_categories(names):
+    return _resolve_names(Category, Category.name, names, lambda name: {'name': name})
+
+
+def _insert_batch(records):
+    """写入一批文章及其标签、评论、计数；返回 (文章数, 评论数)"""
+    authors = _resolve_authors([r['author'] for r in records] +
+                               [c['author'] for r in records for c in r['comments']])
+    categories = _resolve_categories(r['category'] for r in records)
+    tags = resolve_tags([name for r in records for name in r['tags']])
+
+    # executemany INSERT 拿不到自增id，这里显式分配一段连续id，关联和评论才能直接引用
+    first_id = (db.session.query(func.max(Post.id)).scalar() or 0) + 1
+    post_rows, tag_rows, comment_rows = [], [], []
+    post_counts, user_posts, user_comments = Counter(), Counter(), Counter()
+    for post_id, record in enumerate(records, first_id):
+        user_id = authors[record['author']]
+        category_id = categories[record['category']]
+        post_rows.append({
+            'id': post_id, 'title': record['title'], 'content': record['content'],
+            'user_id': user_id, 'category_id': category_id,
+            'created_at': record['created_at'], 'updated_at': record['updated_at'],
+            'comment_count': len(record['comments']),
+        })
+        # 'Flask' 和 'flask' 可能对应同一个标签，关联去重
+        tag_ids = sorted({tags[name].id for name in record['tags']})
+        tag_rows.extend({'post_id': post_id, 'tag_id': tag_id} for tag_id in tag_ids)
+        for comment in record['comments']:
+            commenter_id = authors[comment['author']]
+            comment_rows.append({'post_id': post_id, 'user_id': commenter_id,
+                                 'content': comment['content'], 'created_at': comment['created_at']})
+            user_comments[commenter_id] += 1
+        post_counts[category_id] += 1
+        user_posts[user_id] += 1
+
+    db.session.execute(Post.__table__.insert(), post_rows)
+    if tag_rows:
+        db.session.execute(post_tag.insert(), tag_rows)
+    if comment_rows:
+        db.session.execute(Comment.__table__.insert(), comment_rows)
+    counters.bulk_increment(Category, 'post_count', post_counts)
+    counters.bulk_increment(User, 'post_count', user_posts)
+    counters.bulk_increment(User, 'comment_count', user_comments)
+    return len(post_rows), len(comment_rows)
+
+
+def _commit_batch(records, checkpoint, byte_offset, lines, first_line):
+    """
+    写入一批并和检查点一起提交；分配的id被并发发布的文章占用时重试，
+    其它失败整批回滚，抛出带行号范围的 ImportBatchError
+    """
+    for attempt in range(MAX_ID_RETRIES):
+        try:
+            result = _insert_batch(records)
+            if checkpoint is not None:
+                checkpoint.byte_offset = byte_offset
+                checkpoint.lines = lines
+                db.session.merge(checkpoint)
+            db.session.commit()
+            return result
+        except IntegrityError as e:
+            db.session.rollback()
+            if attempt == MAX_ID_RETRIES - 1:
+                raise ImportBatchError(first_line, lines, e.orig)
+        except (SQLAlchemyError, LookupError) as e:
+            db.session.rollback()
+            raise ImportBatchError(first_line, lines, e)
+
+
+def import_posts(stream, checkpoint_name=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    从按行迭代的二进制流导入文章，返回统计 dict
+    checkpoint_name 给出时从该检查点继续：可 seek 的文件直接跳到字节偏移，其它流跳过已导入的行数
+    """
+    checkpoint = None
+    byte_offset = lines = 0
+    if checkpoint_name is not None:
+        saved = db.session.get(ImportCheckpoint, checkpoint_name)
+        checkpoint = ImportCheckpoint(name=checkpoint_name)
+        if saved is not None:
+            byte_offset, lines = saved.byte_offset, saved.lines
+    resumed_from = lines
+    if lines and getattr(stream, 'seekable', lambda: False)():
+        stream.seek(byte_offset)
+        skip = 0
+    else:
+        skip = lines
+        byte_offset = lines = 0
+
+    now = datetime.utcnow()
+    stats = {'posts': 0, 'comments': 0, 'lines': 0, 'resumed_from_line': resumed_from}
+    batch = []
+    first_line = lines + 1
+    for line in stream:
+        byte_offset += len(line)
+        lines += 1
+        if lines <= skip:
+            continue
+        record = _parse_record(line.decode('utf-8') if isinstance(line, bytes) else line, lines, now)
+        if record is not None:
+            if not batch:
+                first_line = lines
+            batch.append(record)
+        if len(batch) >= batch_size:
+            posts, comments = _commit_batch(batch, checkpoint, byte_offset, lines, first_line)
+            stats['posts'] += posts
+            stats['comments'] += comments
+            batch = []
+            db.session.expunge_all()
+    if batch:
+        posts, comments = _commit_batch(batch, checkpoint, byte_offset, lines, first_line)
+        stats['posts'] += posts
+        stats['comments'] += comments
+    stats['lines'] = lines
+    return stats
+
+
+def _open(path, mode):
+    """.gz 结尾的文件自动压缩/解压"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import sys
+    import time
+    from app import app
+
+    parser = argparse.ArgumentParser(description='NDJSON 内容导入导出')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='导出文章（含标签、评论）')
+    export_parser.add_argument('-o', '--output', help='输出文件（默认标准输出）')
+    export_parser.add_argument('--since', type=datetime.fromisoformat, help='只导出此时间（UTC）后更新的文章')
+    import_parser = commands.add_parser('import', help='导入文章')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--checkpoint', help='检查点名字（默认用文件的绝对路径）')
+    import_parser.add_argument('--no-checkpoint', action='store_true', help='不记录检查点')
+    import_parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.time()
+        if args.command == 'export':
+            out = _open(args.output, 'wt') if args.output else sys.stdout
+            count = 0
+            for line in export_posts(since=args.since):
+                out.write(line)
+                count += 1
+            if args.output:
+                out.close()
+            print(f"✅ 导出完成: {count} 篇，用时 {time.time() - start:.2f}s", file=sys.stderr)
+        else:
+            name = None if args.no_checkpoint else (args.checkpoint or os.path.abspath(args.path)[-191:])
+            try:
+                with _open(args.path, 'rb') as f:
+                    stats = import_posts(f, checkpoint_name=name, batch_size=args.batch_size)
+            except ContentImportError as e:
+                print(f"❌ 导入中止，{e}（之前的批次已提交，修正后重新运行会从检查点继续）")
+                raise SystemExit(1)
+            elapsed = time.time() - start
+            rows = stats['posts'] + stats['comments']
+            if stats['resumed_from_line']:
+                print(f"   从第 {stats['resumed_from_line']} 行之后继续")
+            print(f"✅ 导入完成: {stats['posts']} 篇文章, {stats['comments']} 条评论，"
+                  f"用时 {elapsed:.2f}s（{rows / max(elapsed, 1e-6):.0f} 行/秒）")
+            print("   搜索索引需要重建: python search.py rebuild")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+冗余计数维护 - 学习：反范式设计、原子自增、批量校正
+分类文章数、文章评论数、用户文章/评论数保存在各自的表中，
+写操作在同一事务内用 UPDATE ... SET x = x + 1 原子更新，读取只需读一列。
+"""
+
+import pymysql
+pymysql.install_as_MySQLdb()
+
+from sqlalchemy import func, inspect, select, text
+from models import db, User, Post, Category, Comment
+
+# 各计数列及其校正用的关联子查询：(模型, 计数列, 被计数的表, 外键列)
+COUNTER_COLUMNS = [
+    (Category, 'post_count', Post, Post.category_id),
+    (User, 'post_count', Post, Post.user_id),
+    (User, 'comment_count', Comment, Comment.user_id),
+    (Post, 'comment_count', Comment, Comment.post_id),
+]
+
+# 其它由写缓冲或定时任务维护、不能从关联表重算的列：(模型, 列名)
+BUFFERED_COLUMNS = [
+    (Post, 'view_count'),
+    (Post, 'hot_score'),
+]
+
+
+def _increment(model, ident, **deltas):
+    """原子地增减一行上的计数列（不修改 updated_at）"""
+    values = {getattr(model, column): getattr(model, column) + delta
+              for column, delta in deltas.items()}
+    if 'updated_at' in model.__table__.c:
+        # 计数变化不是内容修改，避免触发 onupdate
+        values[model.updated_at] = model.updated_at
+    db.session.query(model).filter(model.id == ident).update(values, synchronize_session=False)
+
+
+def bulk_increment(model, column, deltas):
+    """
+    批量增减多行的同一计数列 {id: 增量}（批量导入时使用）
+    相同增量的行合并成一条 UPDATE ... WHERE id IN
+    """
+    by_delta = {}
+    for ident, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(ident)
+    for delta, idents in by_delta.items():
+        values = {getattr(model, column): getattr(model, column) + delta}
+        if 'updated_at' in model.__table__.c:
+            values[model.updated_at] = model.updated_at
+        db.session.query(model).filter(model.id.in_(idents)).update(values, synchronize_session=False)
+
+
+def post_created(post):
+    """发布文章：分类文章数、作者文章数 +1"""
+    _increment(Category, post.category_id, post_count=1)
+    _increment(User, post.user_id, post_count=1)
+
+
+def post_deleted(post):
+    """
+    删除文章：分类文章数、作者文章数 -1，
+    文章下每位评论者的评论数减去其在该文章下的评论数
+    （需在删除评论之前调用）
+    """
+    _increment(Category, post.category_id, post_count=-1)
+    _increment(User, post.user_id, post_count=-1)
+    commenters = (db.session.query(Comment.user_id, func.count(Comment.id))
+                  .filter(Comment.post_id == post.id)
+                  .group_by(Comment.user_id)
+                  .all())
+    for user_id, count in commenters:
+        _increment(User, user_id, comment_count=-count)
+
+
+def post_category_changed(post, old_category_id):
+    """文章换分类：旧分类 -1，新分类 +1"""
+    if old_category_id == post.category_id:
+        return
+    _increment(Category, old_category_id, post_count=-1)
+    _increment(Category, post.category_id, post_count=1)
+
+
+def comment_added(comment):
+    """发表评论：文章评论数、评论者评论数 +1"""
+    _increment(Post, comment.post_id, comment_count=1)
+    _increment(User, comment.user_id, comment_count=1)
+
+
+def ensure_counter_columns():
+    """为已有数据库补上计数列（db.create_all 不会修改已存在的表）"""
+    inspector = inspect(db.engine)
+    added = []
+    columns = [(model, column) for model, column, _, _ in COUNTER_COLUMNS] + BUFFERED_COLUMNS
+    for model, column in columns:
+        table = model.__table__.name
+        existing = {c['name'] for c in inspector.get_columns(table)}
+        if column not in existing:
+            quoted = db.engine.dialect.identifier_preparer.quote(table)
+            column_type = model.__table__.c[column].type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(
+                f"ALTER TABLE {quoted} ADD COLUMN {column} {column_type} NOT NULL DEFAULT 0"
+            ))
+            added.append(f"{table}.{column}")
+    db.session.commit()
+    return added
+
+
+def rebuild_counters():
+    """
+    按实际数据批量重建所有计数列
+    每个计数列一条 UPDATE ... SET x = (SELECT COUNT(*) ...)，不逐行加载
+    """
+    for model, column, counted, foreign_key in COUNTER_COLUMNS:
+        subquery = (select(func.count())
+                    .select_from(counted)
+                    .where(foreign_key == model.id)
+                    .scalar_subquery())
+        values = {getattr(model, column): subquery}
+        if 'updated_at' in model.__table__.c:
+            values[model.updated_at] = model.updated_at
+        db.session.query(model).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        print("🔢 开始校正冗余计数...")
+        for column in ensure_counter_columns():
+            print(f"   + 新增计数列: {column}")
+        rebuild_counters()
+        print("✅ 计数校正完成")
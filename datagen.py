@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+大规模测试数据生成 - 学习：批量插入、长尾分布（Zipf / 对数正态）、可复现的随机数据
+按 models.py 的表结构生成用户、分类、标签、文章、评论，用于本地复现生产规模的性能问题。
+
+分布：
+- 文章中英文混合（english_ratio），正文长度服从对数正态：中文按字数、英文按词数，少数长文拉出长尾
+- 作者、分类、标签的使用频率服从 Zipf：少数热门标签占据大部分文章
+- 评论按文章热度（Pareto）分配，发表时间在文章之后
+- 文章 id 与发布时间同序，和真实数据一样新文章 id 更大
+
+写入：每批 batch_size 篇文章及其关联、评论各一条 executemany，内存只占一批；
+计数列（文章数、评论数）在生成时累计，最后批量写入，不需要再跑 counters.py。
+相同参数和种子生成完全相同的数据。
+
+运行：python datagen.py --posts 1000000 --users 20000 --comments 4000000 --reset
+      python datagen.py --database-url sqlite:///big.db --posts 100000 --reset --index-search
+"""
+
+import pymysql
+pymysql.install_as_MySQLdb()
+
+import math
+import random
+import time
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import bindparam
+
+# 默认规模
+DEFAULTS = {'users': 1000, 'categories': 30, 'tags': 5000, 'posts': 100000, 'comments': 400000}
+
+ZH_WORDS = ['数据库', '索引', '缓存', '性能', '优化', '查询', '并发', '事务', '分页', '部署',
+            '日志', '监控', '架构', '服务', '异步', '任务', '队列', '连接池', '压缩', '备份',
+            '我们', '这个', '问题', '方案', '实现', '测试', '线上', '用户', '请求', '延迟',
+            '内存', '磁盘', '网络', '配置', '版本', '升级', '迁移', '脚本', '接口', '模块']
+EN_WORDS = ['flask', 'redis', 'mysql', 'python', 'celery', 'index', 'cache', 'query', 'latency',
+            'throughput', 'cursor', 'session', 'worker', 'profile', 'benchmark', 'deploy',
+            'the', 'a', 'to', 'of', 'and', 'in', 'is', 'for', 'with', 'we', 'this', 'that',
+            'request', 'server', 'database', 'memory', 'connection', 'pool', 'thread', 'process']
+TECH_TAGS = ['Python', 'Flask', 'MySQL', 'Redis', 'Celery', 'Linux', 'Nginx', 'Docker', 'Git',
+             'SQLAlchemy', 'JavaScript', '性能优化', '数据库', '缓存', '运维', '算法', '读书笔记', '随笔']
+CATEGORY_NAMES = ['技术', '生活', '随笔', '教程', '读书', '项目', '工具', '面试', '架构', '运维']
+
+# 长度分布（对数正态的中位数和 sigma，及上下限）
+ZH_CONTENT_CHARS = (900, 0.9, 50, 30000)
+EN_CONTENT_WORDS = (500, 0.9, 30, 12000)
+ZH_TITLE_CHARS = (14, 0.35, 4, 60)
+EN_TITLE_WORDS = (7, 0.35, 2, 20)
+COMMENT_CHARS = (40, 1.0, 2, 2000)
+
+# Zipf 指数：越大越集中
+AUTHOR_ZIPF = 1.0
+CATEGORY_ZIPF = 0.8
+TAG_ZIPF = 1.1
+# 评论时间：文章发布后平均几天
+COMMENT_DELAY_DAYS = 3
+# 文章被编辑过（updated_at 晚于 created_at）的比例
+EDITED_RATIO = 0.1
+
+START_TIME = datetime(2022, 1, 1)
+CORPUS_WORDS = 200000
+
+
+def _zipf_cum_weights(n, exponent):
+    """第 k 名的权重 1/k^s 的累计和，配合 bisect 做 O(log n) 抽样"""
+    return list(accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+class _Sampler:
+    """按累计权重抽取 1..n 的 id（id 越小越热门）"""
+
+    def __init__(self, rng, n, exponent):
+        self.rng = rng
+        self.cum_weights = _zipf_cum_weights(n, exponent)
+        self.total = self.cum_weights[-1]
+
+    def __call__(self):
+        return bisect_left(self.cum_weights, self.rng.random() * self.total) + 1
+
+
+class Generator:
+    """按种子生成数据；文本从预先生成的语料里截取，避免逐字随机"""
+
+    def __init__(self, seed=42, english_ratio=0.3):
+        self.rng = random.Random(seed)
+        self.english_ratio = english_ratio
+        rng = self.rng
+        self.zh_corpus = ''.join(
+            rng.choice(ZH_WORDS) + (rng.choice('，。、；') if rng.random() < 0.15 else '')
+            for _ in range(CORPUS_WORDS))
+        self.en_corpus = ' '.join(
+            rng.choice(EN_WORDS) + ('.' if rng.random() < 0.08 else '')
+            for _ in range(CORPUS_WORDS)).split(' ')
+
+    def _length(self, spec):
+        median, sigma, low, high = spec
+        return int(min(high, max(low, self.rng.lognormvariate(math.log(median), sigma))))
+
+    def _zh(self, spec):
+        length = self._length(spec)
+        start = self.rng.randrange(len(self.zh_corpus) - length)
+        return self.zh_corpus[start:start + length]
+
+    def _en(self, spec):
+        length = self._length(spec)
+        start = self.rng.randrange(len(self.en_corpus) - length)
+        return ' '.join(self.en_corpus[start:start + length])
+
+    def post_text(self):
+        """(标题, 正文)"""
+        if self.rng.random() < self.english_ratio:
+            return self._en(EN_TITLE_WORDS).capitalize(), self._en(EN_CONTENT_WORDS)
+        return self._zh(ZH_TITLE_CHARS), self._zh(ZH_CONTENT_CHARS)
+
+    def comment_text(self):
+        if self.rng.random() < self.english_ratio:
+            return self._en((max(COMMENT_CHARS[0] // 5, 1),) + COMMENT_CHARS[1:])
+        return self._zh(COMMENT_CHARS)
+
+
+def _insert(table, rows):
+    from models import db
+    if rows:
+        db.session.execute(table.insert(), rows)
+
+
+def _tag_names(count):
+    names = list(TECH_TAGS[:count])
+    for i in range(len(names), count):
+        names.append(f"{EN_WORDS[i % len(EN_WORDS)]}-{i}" if i % 3 else f"{ZH_WORDS[i % len(ZH_WORDS)]}{i}")
+    return names
+
+
+def _write_counts(table, column, counts):
+    """生成过程中累计的计数一次性写回：UPDATE ... WHERE id = ? 的 executemany"""
+    from models import db
+    rows = [{'row_id': ident, 'value': value} for ident, value in counts.items() if value]
+    statement = (table.update()
+                 .where(table.c.id == bindparam('row_id'))
+                 .values({column: bindparam('value')}))
+    for i in range(0, len(rows), 5000):
+        db.session.execute(statement, rows[i:i + 5000])
+
+
+def generate(users=DEFAULTS['users'], categories=DEFAULTS['categories'], tags=DEFAULTS['tags'],
+             posts=DEFAULTS['posts'], comments=DEFAULTS['comments'], max_tags=6, seed=42,
+             english_ratio=0.3, days=1095, batch_size=5000, password=None, progress=None):
+    """
+    向空库写入数据，返回各表行数
+    password 给出时 user1 可以用它登录（基准测试用），其余用户没有密码
+    progress(已生成文章数, 总数) 每批调用一次
+    """
+    from werkzeug.security import generate_password_hash
+    from models import db, User, Post, Category, Tag, Comment, post_tag
+
+    generator = Generator(seed, english_ratio)
+    rng = generator.rng
+    span = days * 86400
+
+    for start in range(1, users + 1, batch_size):
+        _insert(User.__table__, [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+             'password_hash': generate_password_hash(password) if password and i == 1 else None,
+             'created_at': START_TIME + timedelta(seconds=span * (i - 1) / max(users, 1) / 2)}
+            for i in range(start, min(start + batch_size, users + 1))
+        ])
+    _insert(Category.__table__, [
+        {'id': i, 'name': CATEGORY_NAMES[i - 1] if i <= len(CATEGORY_NAMES) else f'分类{i}'}
+        for i in range(1, categories + 1)
+    ])
+    tag_names = _tag_names(tags)
+    for start in range(0, tags, batch_size):
+        _insert(Tag.__table__, [{'id': i + 1, 'name': tag_names[i]}
+                                for i in range(start, min(start + batch_size, tags))])
+    db.session.commit()
+
+    pick_author = _Sampler(rng, users, AUTHOR_ZIPF)
+    pick_category = _Sampler(rng, categories, CATEGORY_ZIPF)
+    pick_tag = _Sampler(rng, tags, TAG_ZIPF) if tags else None
+    user_posts, user_comments, category_posts = Counter(), Counter(), Counter()
+    links_total = 0
+
+    for start in range(1, posts + 1, batch_size):
+        end = min(start + batch_size, posts + 1)
+        # 本批评论数按文章数比例分配，总数正好等于 comments；再按热度分给各篇文章
+        budget = round(comments * (end - 1) / posts) - round(comments * (start - 1) / posts)
+        popularity = [rng.paretovariate(1.5) for _ in range(end - start)]
+        per_post = Counter(rng.choices(range(start, end), weights=popularity, k=budget))
+
+        post_rows, link_rows, comment_rows = [], [], []
+        for post_id in range(start, end):
+            title, content = generator.post_text()
+            author_id = pick_author()
+            category_id = pick_category()
+            created_at = START_TIME + timedelta(seconds=span * post_id / posts + rng.uniform(0, 60))
+            updated_at = created_at
+            if rng.random() < EDITED_RATIO:
+                updated_at += timedelta(days=rng.expovariate(1 / 30))
+            post_rows.append({'id': post_id, 'title': title[:200], 'content': content,
+                              'user_id': author_id, 'category_id': category_id,
+                              'created_at': created_at, 'updated_at': updated_at,
+                              'comment_count': per_post[post_id]})
+            user_posts[author_id] += 1
+            category_posts[category_id] += 1
+            if pick_tag is not None:
+                for tag_id in {pick_tag() for _ in range(rng.randint(0, max_tags))}:
+                    link_rows.append({'post_id': post_id, 'tag_id': tag_id})
+            for _ in range(per_post[post_id]):
+                commenter_id = pick_author()
+                comment_rows.append({
+                    'content': generator.comment_text(), 'user_id': commenter_id, 'post_id': post_id,
+                    'created_at': created_at + timedelta(days=rng.expovariate(1 / COMMENT_DELAY_DAYS)),
+                })
+                user_comments[commenter_id] += 1
+
+        _insert(Post.__table__, post_rows)
+        _insert(post_tag, link_rows)
+        _insert(Comment.__table__, comment_rows)
+        db.session.commit()
+        links_total += len(link_rows)
+        if progress:
+            progress(end - 1, posts)
+
+    _write_counts(User.__table__, 'post_count', user_posts)
+    _write_counts(User.__table__, 'comment_count', user_comments)
+    _write_counts(Category.__table__, 'post_count', category_posts)
+    db.session.commit()
+    return {'users': users, 'categories': categories, 'tags': tags, 'posts': posts,
+            'post_tag': links_total, 'comments': comments}
+
+
+def _speed_up_sqlite():
+    """生成数据时 SQLite 不需要每次提交都刷盘（只影响当前连接）"""
+    from models import db
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(db.text("PRAGMA synchronous = OFF"))
+        db.session.execute(db.text("PRAGMA journal_mode = MEMORY"))
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description='生成大规模测试数据')
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f'--{name}', type=int, default=default)
+    parser.add_argument('--max-tags', type=int, default=6, help='每篇文章最多几个标签')
+    parser.add_argument('--english-ratio', type=float, default=0.3)
+    parser.add_argument('--days', type=int, default=1095, help='文章发布时间跨度（天）')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--database-url', help='默认使用应用配置的数据库')
+    parser.add_argument('--reset', action='store_true', help='先删除并重建所有表')
+    parser.add_argument('--index-search', action='store_true', help='生成后重建搜索索引')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    from app import app
+    from models import db, Post
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+        elif db.session.query(Post.id).first() is not None:
+            raise SystemExit("❌ 数据库里已有文章，加 --reset 清空后再生成")
+        _speed_up_sqlite()
+        print(f"🏭 开始生成数据 (seed={args.seed}): {args.posts} 篇文章, {args.comments} 条评论...")
+        start = time.time()
+
+        def report(done, total):
+            elapsed = time.time() - start
+            print(f"   {done}/{total} 篇，{done / max(elapsed, 1e-6):.0f} 篇/秒")
+
+        counts = generate(users=args.users, categories=args.categories, tags=args.tags, posts=args.posts,
+                          comments=args.comments, max_tags=args.max_tags, seed=args.seed,
+                          english_ratio=args.english_ratio, days=args.days, batch_size=args.batch_size,
+                          progress=report)
+        print(f"✅ 生成完成，用时 {time.time() - start:.1f}s: " +
+              ', '.join(f"{table} {count}" for table, count in counts.items()))
+        if args.index_search:
+            import search as search_index
+            print("🔎 开始重建搜索索引...")
+            print(f"✅ 索引重建完成: {search_index.rebuild_index()} 篇")
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+首页信息流查询层 - 学习：N+1查询问题、预加载（eager loading）、查询预算
+"""
+
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import joinedload, selectinload
+from models import db, User, Post, Category, Comment
+from pagination import keyset_paginate, approximate_count
+
+# 分类改名这类不改变文章元数据的修改，靠页面缓存命名空间的版本号（cache_invalidate 时递增）反映到 ETag 上
+try:
+    from cache_helper import cache
+except ImportError:
+    cache = None
+
+# 首页每页文章数
+FEED_PER_PAGE = 5
+
+# 首页单次请求允许执行的SQL语句数：
+# 条件请求校验 + 文章(JOIN作者/分类) + 标签 + 分类列表(含冗余文章数) + 当前登录用户 + 近似总数(缓存过期时)
+FEED_QUERY_BUDGET = 6
+
+# 近似文章总数的缓存秒数
+FEED_COUNT_TTL = 60
+
+# 文章详情页单次请求允许执行的SQL语句数：
+# 条件请求校验 + 文章(JOIN作者/分类) + 标签 + 第一页评论(JOIN评论作者) + 当前登录用户
+POST_QUERY_BUDGET = 5
+
+# 每页评论数（第一页随文章页渲染，之后的页走JSON接口）
+COMMENTS_PER_PAGE = 20
+
+
+class QueryBudgetExceeded(AssertionError):
+    """请求执行的SQL语句数超出预算"""
+
+
+class QueryCounter:
+    """
+    统计一段代码内执行的SQL语句（只统计创建它的线程）
+    用法：
+        with QueryCounter(db.engine) as counter:
+            client.get('/')
+        assert counter.count <= FEED_QUERY_BUDGET
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self._thread_id = threading.get_ident()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread_id:
+            self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
+
+
+@contextmanager
+def query_budget(max_queries, engine=None):
+    """断言代码块内执行的SQL语句不超过 max_queries 条（测试使用）"""
+    with QueryCounter(engine or db.engine) as counter:
+        yield counter
+    if counter.count > max_queries:
+        raise QueryBudgetExceeded(
+            f"执行了{counter.count}条SQL，超出预算{max_queries}条:\n" + "\n".join(counter.statements)
+        )
+
+
+def query_budget_view(max_queries):
+    """
+    视图查询预算装饰器
+    请求内的SQL语句数记录在 g.query_count；超出预算时打印警告，
+    QUERY_BUDGET_STRICT（测试环境默认开启）时直接抛出 QueryBudgetExceeded
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with QueryCounter(db.engine) as counter:
+                result = f(*args, **kwargs)
+            g.query_count = counter.count
+            if counter.count > max_queries:
+                message = f"{f.__name__} 执行了{counter.count}条SQL，超出预算{max_queries}条"
+                if current_app.config.get('QUERY_BUDGET_STRICT', current_app.testing):
+                    raise QueryBudgetExceeded(message + ":\n" + "\n".join(counter.statements))
+                print(f"⚠️  {message}")
+            return result
+        return decorated_function
+    return decorator
+
+
+def feed_query():
+    """文章列表查询：作者、分类随文章JOIN取回，标签用一条IN查询批量加载"""
+    return (Post.query
+            .options(joinedload(Post.author),
+                     joinedload(Post.category),
+                     selectinload(Post.tags))
+            .order_by(Post.created_at.desc(), Post.id.desc()))
+
+
+def get_feed_page(cursor=None, per_page=FEED_PER_PAGE, with_total=True):
+    """
+    按游标获取首页一页文章（固定2条SQL，与每页文章数和翻页深度无关）
+    with_total 时附带缓存的近似文章总数
+    """
+    page = keyset_paginate(feed_query(), Post.created_at, Post.id, cursor=cursor, per_page=per_page)
+    if with_total:
+        page.total = approx_post_count()
+    return page
+
+
+def approx_post_count():
+    """近似文章总数：对分类冗余计数求和，并在进程内缓存 FEED_COUNT_TTL 秒"""
+    return approximate_count(
+        'post',
+        lambda: db.session.query(func.coalesce(func.sum(Category.post_count), 0)).scalar(),
+        ttl=FEED_COUNT_TTL,
+    )
+
+
+def get_categories():
+    """获取分类列表，文章数直接读 Category.post_count，不加载文章本身"""
+    return Category.query.order_by(Category.name).all()
+
+
+def get_post_detail(post_id):
+    """获取文章详情：作者、分类、标签一并预加载；评论另行分页"""
+    return (Post.query
+            .options(joinedload(Post.author),
+                     joinedload(Post.category),
+                     selectinload(Post.tags))
+            .filter(Post.id == post_id)
+            .first())
+
+
+def get_comments_page(post_id, cursor=None, per_page=COMMENTS_PER_PAGE):
+    """
+    按 (created_at, id) 游标分页获取文章评论（从早到晚），走 idx_comment_post_created
+    评论作者随评论JOIN取回且只加载用户名，一页一条SQL
+    """
+    query = (Comment.query
+             .options(joinedload(Comment.author).load_only(User.id, User.username))
+             .filter(Comment.post_id == post_id))
+    return keyset_paginate(query, Comment.created_at, Comment.id,
+                           cursor=cursor, per_page=per_page, descending=False)
+
+
+def serialize_comment(comment):
+    """评论的JSON表示"""
+    return {
+        'id': comment.id,
+        'author': comment.author.username,
+        'content': comment.content,
+        'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M'),
+    }
+
+
+def namespace_versions(*namespaces):
+    """页面缓存命名空间的版本号（一次 MGET，通常命中L1）；Redis 不可用时返回 None"""
+    if cache is None:
+        return None
+    return cache.namespace_versions(list(namespaces))
+
+
+def get_feed_validators(cursor=None):
+    """
+    首页条件请求的校验元数据（一条SQL）：
+    最近一次文章更新时间、文章总数、分类数（新增/删除/编辑文章都会改变其中之一），
+    以及 categories（分类改名）、views（“最多阅读”排行榜落库校正）命名空间的版本号。
+    删除文章、分类改名、排行榜校正都不改变最大的 updated_at，所以不返回 Last-Modified，
+    否则只带 If-Modified-Since 的客户端会拿到过期的304
+    """
+    latest, total, category_count = db.session.execute(select(
+        select(func.max(Post.updated_at)).scalar_subquery(),
+        select(func.coalesce(func.sum(Category.post_count), 0)).scalar_subquery(),
+        select(func.count(Category.id)).scalar_subquery(),
+    )).one()
+    return ['index', cursor, latest, total, category_count, namespace_versions('categories', 'views')], None
+
+
+def get_post_validators(post_id):
+    """
+    文章页条件请求的校验元数据（一条SQL，不加载正文）：
+    更新时间、评论数、最新评论时间、categories 命名空间的版本号（页面显示分类名）；
+    文章不存在时返回 None。分类改名不改变文章的时间，所以同样只用 ETag，不返回 Last-Modified
+    """
+    latest_comment = (select(func.max(Comment.created_at))
+                      .where(Comment.post_id == Post.id)
+                      .scalar_subquery())
+    row = (db.session.query(Post.updated_at, Post.comment_count, latest_comment)
+           .filter(Post.id == post_id)
+           .first())
+    if row is None:
+        return None
+    updated_at, comment_count, last_comment_at = row
+    return ['post', post_id, updated_at, comment_count, last_comment_at, namespace_versions('categories')], None
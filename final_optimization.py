@@ -9,14 +9,14 @@ def final_test():
     with app.app_context():
         print("🎯 最终优化效果测试...")
         
-        # 测试1：使用覆盖索引的优化查询
+        # 测试1：按发布时间倒序走 idx_post_created_id（models.py 声明，python optimize_indexes.py apply 创建）
         start_time = time.time()
         result = db.session.execute(text("""
             SELECT 
                 p.id, p.title, p.created_at, 
                 p.category_id, u.username, u.email
             FROM post p 
-            FORCE INDEX (idx_post_covering)
+            FORCE INDEX (idx_post_created_id)
             JOIN user u ON p.user_id = u.id 
             ORDER BY p.created_at DESC 
             LIMIT 20
@@ -28,7 +28,7 @@ def final_test():
         explain_result = db.session.execute(text("""
             EXPLAIN 
             SELECT p.id, p.title, p.created_at, u.username
-            FROM post p FORCE INDEX (idx_post_covering)
+            FROM post p FORCE INDEX (idx_post_created_id)
             JOIN user u ON p.user_id = u.id 
             ORDER BY p.created_at DESC 
             LIMIT 20
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+文章热度 - 学习：向量化计算（NumPy）、批量写回、Redis有序集合排行榜
+按主键分段查询取出所有文章的评论数、阅读数、发布时间（都是冗余计数列，不需要 JOIN/GROUP BY），
+用 NumPy 数组一次算出全部热度分，再分批写回 post.hot_score 并发布 posts:hot 排行榜。
+
+热度公式（类似 Hacker News 的时间衰减）：
+    hot = (1 + 阅读数 * VIEW_WEIGHT + 评论数 * COMMENT_WEIGHT) / (发布小时数 + 2) ^ GRAVITY
+运行：python hot_posts.py   # 全量计算一次
+"""
+
+import pymysql
+pymysql.install_as_MySQLdb()
+
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import Integer, cast, func, literal_column, select
+
+from models import db, Post
+from cache_helper import cache
+from feed_queries import feed_query
+
+HOT_KEY = 'posts:hot'
+EPOCH = datetime(1970, 1, 1)
+
+VIEW_WEIGHT = 0.1
+COMMENT_WEIGHT = 2.0
+GRAVITY = 1.5
+
+# 排行榜只保留前 HOT_SIZE 名（百万文章全放进 Redis 没有意义）
+HOT_SIZE = 1000
+# 流式读取、写回时每批的行数
+FETCH_BATCH_SIZE = 50000
+WRITE_BATCH_SIZE = 5000
+
+
+def _epoch_seconds(column):
+    """
+    在数据库里把时间列转成 Unix 秒数，省掉百万次 datetime 对象构造
+    （MySQL 的 UNIX_TIMESTAMP 会按会话时区换算，这里的列存的是UTC，所以用 TIMESTAMPDIFF）
+    """
+    if db.engine.dialect.name == 'mysql':
+        return func.timestampdiff(literal_column('SECOND'), '1970-01-01 00:00:00', column)
+    return cast(func.strftime('%s', column), Integer)
+
+
+def hotness(views, comments, age_hours):
+    """向量化计算热度分：参数都是等长的 NumPy 数组"""
+    points = 1.0 + views * VIEW_WEIGHT + comments * COMMENT_WEIGHT
+    return points / np.power(np.maximum(age_hours, 0.0) + 2.0, GRAVITY)
+
+
+def _fetch_matrix(statement):
+    """
+    执行查询并把结果直接转成 float64 二维数组（NULL -> NaN）
+    绕过 ORM 的 Row 对象：百万行时逐行构造 Row 比查询本身还慢
+    """
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute(str(compiled))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return np.array(rows, dtype=np.float64).reshape(-1, 4)
+
+
+def load_post_stats(post_ids=None):
+    """
+    读出文章统计，返回 (ids, views, comments, age_hours) 四个数组
+    全量时按主键分段（WHERE id > ? ORDER BY id LIMIT ?）读取，每段一条查询，
+    不需要服务器端游标也不会一次把整表读进驱动；指定文章时按 WRITE_BATCH_SIZE 分批 IN 查询
+    """
+    statement = select(Post.id, Post.view_count, Post.comment_count, _epoch_seconds(Post.created_at))
+    chunks = []
+    if post_ids is None:
+        last_id = 0
+        while True:
+            chunk = _fetch_matrix(statement.where(Post.id > last_id)
+                                  .order_by(Post.id).limit(FETCH_BATCH_SIZE))
+            if not len(chunk):
+                break
+            chunks.append(chunk)
+            last_id = int(chunk[-1, 0])
+    else:
+        post_ids = [int(post_id) for post_id in post_ids]
+        for i in range(0, len(post_ids), WRITE_BATCH_SIZE):
+            chunks.append(_fetch_matrix(statement.where(Post.id.in_(post_ids[i:i + WRITE_BATCH_SIZE]))))
+
+    stats = np.concatenate(chunks) if chunks else np.empty((0, 4))
+    # 数据库里是不带时区的UTC时间，按UTC换算成秒数再比较
+    now = (datetime.utcnow() - EPOCH).total_seconds()
+    # 没有发布时间（NULL -> NaN）的按刚发布处理
+    age_hours = np.nan_to_num((now - stats[:, 3]) / 3600.0, nan=0.0)
+    return stats[:, 0].astype(np.int64), stats[:, 1], stats[:, 2], age_hours
+
+
+def _write_scores(ids, scores):
+    """
+    批量写回热度分（文本 SQL 不会触发 updated_at 的 onupdate：热度不是内容修改）
+    SQLite：DBAPI executemany UPDATE，驱动在C里循环，不经过网络也不构造 ORM 参数；
+    MySQL：pymysql 的 executemany UPDATE 是逐行往返，改为用多行 INSERT 写入临时表，
+    再一条 UPDATE ... JOIN 更新
+    """
+    rows = list(zip(scores.tolist(), ids.tolist()))
+    if not rows:
+        return
+    cursor = db.session.connection().connection.cursor()
+    try:
+        if db.engine.dialect.name == 'mysql':
+            cursor.execute("CREATE TEMPORARY TABLE IF NOT EXISTS post_hot_score "
+                           "(score DOUBLE NOT NULL, post_id INTEGER PRIMARY KEY)")
+            cursor.execute("TRUNCATE TABLE post_hot_score")
+            for i in range(0, len(rows), WRITE_BATCH_SIZE):
+                cursor.executemany("INSERT INTO post_hot_score (score, post_id) VALUES (%s, %s)",
+                                   rows[i:i + WRITE_BATCH_SIZE])
+            cursor.execute("UPDATE post JOIN post_hot_score h ON h.post_id = post.id "
+                           "SET post.hot_score = h.score")
+            cursor.execute("DROP TEMPORARY TABLE post_hot_score")
+        else:
+            for i in range(0, len(rows), WRITE_BATCH_SIZE):
+                cursor.executemany("UPDATE post SET hot_score = ? WHERE id = ?",
+                                   rows[i:i + WRITE_BATCH_SIZE])
+    finally:
+        cursor.close()
+
+
+def _publish_full(ids, scores):
+    """全量发布排行榜：前 HOT_SIZE 名写入临时键后 RENAME，读者看不到半成品"""
+    if len(ids) > HOT_SIZE:
+        top = np.argpartition(scores, -HOT_SIZE)[-HOT_SIZE:]
+        ids, scores = ids[top], scores[top]
+    r = cache.redis_client
+    if not len(ids):
+        r.delete(HOT_KEY)
+        return
+    staging_key = f"{HOT_KEY}:staging:{uuid.uuid4().hex}"
+    r.zadd(staging_key, dict(zip(ids.tolist(), scores.tolist())))
+    r.rename(staging_key, HOT_KEY)
+
+
+def _publish_partial(ids, scores):
+    """部分文章重新计算后合并进排行榜，再裁剪回 HOT_SIZE 名"""
+    if not len(ids):
+        return
+    pipe = cache.redis_client.pipeline(transaction=False)
+    pipe.zadd(HOT_KEY, dict(zip(ids.tolist(), scores.tolist())))
+    pipe.zremrangebyrank(HOT_KEY, 0, -(HOT_SIZE + 1))
+    pipe.execute()
+
+
+def score_posts(post_ids=None):
+    """
+    计算热度分、批量写回数据库并发布排行榜，返回计算的文章数
+    post_ids 为 None 时计算全部文章（定期执行，让所有分数随时间衰减）
+    """
+    ids, views, comments, age_hours = load_post_stats(post_ids)
+    scores = hotness(views, comments, age_hours)
+    _write_scores(ids, scores)
+    db.session.commit()
+    if post_ids is None:
+        _publish_full(ids, scores)
+    else:
+        _publish_partial(ids, scores)
+    return len(ids)
+
+
+def hot_post_ids(offset=0, limit=10):
+    """排行榜上的文章id，只读 Redis"""
+    try:
+        return [int(post_id) for post_id in
+                cache.redis_client.zrevrange(HOT_KEY, offset, offset + limit - 1)]
+    except Exception as e:
+        print(f"热门文章获取失败: {e}")
+        return []
+
+
+def hot_posts(offset=0, limit=10):
+    """按热度排序的文章（一条 IN 查询加载，保持排行榜顺序）"""
+    ids = hot_post_ids(offset, limit)
+    if not ids:
+        return []
+    posts = {post.id: post for post in feed_query().filter(Post.id.in_(ids))}
+    return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        print("🔥 开始计算文章热度...")
+        start = time.time()
+        count = score_posts()
+        print(f"✅ 热度计算完成: {count} 篇，用时 {time.time() - start:.2f}s")
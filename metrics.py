@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+请求指标 - 学习：Prometheus 文本格式、直方图、SQLAlchemy 事件、多进程聚合
+main 蓝图的每个请求记录：按端点的耗时直方图、SQL语句数和数据库耗时（engine 事件统计），
+以及各级缓存的命中/未命中和读写字节数，在 /metrics 以 Prometheus 文本格式输出。
+
+多 worker 聚合：每个 gunicorn worker 先在进程内累计（只是几次字典加法），
+每 FLUSH_INTERVAL 秒在请求结束时把增量用一个 pipeline HINCRBYFLOAT 到 Redis，
+/metrics 读出 Redis 里的总和。只有最近 SCRAPE_TTL 秒内有人抓取过才会写 Redis，
+没人抓取时只在内存里累计，开始抓取后第一次写入会带上之前的全部增量。
+每个 worker 当前的 L1 占用、数据库连接数等瞬时值（gauge）单独写一个带过期时间的哈希，输出时求和；
+Celery worker 在任务结束时同样写入，连接数按进程类型（web / worker）区分。
+
+抓取：GET /metrics（设置了 METRICS_TOKEN 时需要 Authorization: Bearer <token>）
+"""
+
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, abort, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import process_type
+
+# 安全导入缓存：没有 Redis 时只在进程内累计，/metrics 不可用
+try:
+    from cache_helper import cache
+except ImportError:
+    cache = None
+
+COUNTERS_KEY = 'metrics:counters'
+GAUGES_KEY_PREFIX = 'metrics:gauges:'
+SCRAPED_KEY = 'metrics:scraped'
+
+# 每个 worker 最多每隔多少秒写一次 Redis
+FLUSH_INTERVAL = 10
+# 最后一次抓取后多久停止写 Redis
+SCRAPE_TTL = 600
+# worker 的瞬时值多久不更新就不再计入（worker 退出后自然消失）
+GAUGE_TTL = 300
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+DB_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# 指标名 -> (类型, 说明)
+METRICS = {
+    'blog_http_requests_total': ('counter', '请求数（按端点、方法、状态码）'),
+    'blog_http_request_duration_seconds': ('histogram', '请求耗时（秒）'),
+    'blog_http_request_sql_statements': ('histogram', '每个请求执行的SQL语句数'),
+    'blog_http_request_db_seconds': ('histogram', '每个请求的数据库耗时（秒）'),
+    'blog_cache_requests_total': ('counter', '缓存读取次数（按层级、命中与否）'),
+    'blog_cache_bytes_total': ('counter', 'Redis 缓存读写字节数'),
+    'blog_cache_local_entries': ('gauge', '各 worker 进程内 L1 缓存条数之和'),
+    'blog_cache_local_bytes': ('gauge', '各 worker 进程内 L1 缓存字节数之和'),
+    'blog_db_pool_connections': ('gauge', '各进程数据库连接池中的连接数之和（按进程类型、使用中/空闲）'),
+    'blog_db_pool_limit': ('gauge', '各进程数据库连接池的连接上限之和（pool_size + max_overflow）'),
+}
+
+_LE_PATTERN = re.compile(r'le="([^"]+)"')
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _series(name, labels):
+    """指标名加标签，如 blog_http_requests_total{endpoint="main.index",status="200"}"""
+    if not labels:
+        return name
+    body = ','.join('{}="{}"'.format(key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                    for key, value in labels)
+    return f'{name}{{{body}}}'
+
+
+class Registry:
+    """进程内的计数器和直方图；drain() 取出增量（直方图转成累计桶）并清零"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._carry = {}
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels, buckets)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            histogram[0][bisect_left(buckets, value)] += 1
+            histogram[1] += value
+
+    def drain(self):
+        """返回 {序列: 增量}"""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+            series, self._carry = self._carry, {}
+        for (name, labels), value in counters.items():
+            key = _series(name, labels)
+            series[key] = series.get(key, 0) + value
+        for (name, labels, buckets), (counts, total) in histograms.items():
+            cumulative = 0
+            for bound, count in zip(buckets + (float('inf'),), counts):
+                cumulative += count
+                key = _series(f'{name}_bucket', labels + (('le', _format_number(bound)),))
+                series[key] = series.get(key, 0) + cumulative
+            for suffix, value in (('_sum', total), ('_count', cumulative)):
+                key = _series(name + suffix, labels)
+                series[key] = series.get(key, 0) + value
+        return series
+
+    def restore(self, series):
+        """写入 Redis 失败时把增量放回去，下次一起写"""
+        with self._lock:
+            for key, value in series.items():
+                self._carry[key] = self._carry.get(key, 0) + value
+
+
+registry = Registry()
+
+
+class _RequestStats:
+    __slots__ = ('start', 'statements', 'db_time')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+
+
+# 当前线程正在处理的请求（不在 main 蓝图的请求里时为 None，SQL 事件直接返回）
+_local = threading.local()
+_state = {'last_flush': 0.0, 'cache_flushed': {}, 'listening': False}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 开始时间记在这条语句的执行上下文上：语句抛出异常时没有 after 事件，不会留下残值
+    if context is not None and getattr(_local, 'request', None) is not None:
+        context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, 'request', None)
+    start = getattr(context, '_metrics_start', None)
+    if stats is None or start is None:
+        return
+    stats.statements += 1
+    stats.db_time += time.perf_counter() - start
+
+
+def _start_request():
+    _local.request = _RequestStats()
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _finish_request(exc):
+    stats = getattr(_local, 'request', None)
+    if stats is None:
+        return
+    _local.request = None
+    endpoint = request.endpoint or 'unknown'
+    # 视图抛出异常时没有经过 after_request
+    status = g.get('metrics_status', 500)
+    registry.inc('blog_http_requests_total',
+                 (('endpoint', endpoint), ('method', request.method), ('status', status)))
+    labels = (('endpoint', endpoint),)
+    registry.observe('blog_http_request_duration_seconds', labels,
+                     time.perf_counter() - stats.start, LATENCY_BUCKETS)
+    registry.observe('blog_http_request_sql_statements', labels, stats.statements, SQL_COUNT_BUCKETS)
+    registry.observe('blog_http_request_db_seconds', labels, stats.db_time, DB_TIME_BUCKETS)
+    maybe_flush()
+
+
+def maybe_flush():
+    """距上次写入超过 FLUSH_INTERVAL 秒时写入（请求结束、Celery 任务结束时调用）"""
+    if time.monotonic() - _state['last_flush'] >= FLUSH_INTERVAL:
+        flush()
+
+
+def _cache_series():
+    """缓存统计是进程内的累计值，换算成上次写入以来的增量；另返回 L1 的瞬时值"""
+    stats = cache.get_stats()
+    current = {}
+    for tier, counts in stats.items():
+        for outcome, result in (('hits', 'hit'), ('misses', 'miss')):
+            key = _series('blog_cache_requests_total', (('tier', tier), ('result', result)))
+            current[key] = counts.get(outcome, 0)
+    for direction in ('read', 'written'):
+        current[_series('blog_cache_bytes_total', (('tier', 'l2'), ('direction', direction)))] = \
+            stats['l2'].get(f'bytes_{direction}', 0)
+    flushed = _state['cache_flushed']
+    deltas = {key: value - flushed.get(key, 0) for key, value in current.items()}
+    gauges = {
+        'blog_cache_local_entries': stats['l1'].get('entries', 0),
+        'blog_cache_local_bytes': stats['l1'].get('bytes', 0),
+    }
+    return current, deltas, gauges
+
+
+def _pool_gauges():
+    """本进程各数据库（主库、只读副本）连接池的连接数；SQLite 不使用连接池，没有这些指标"""
+    from models import db
+    from replicas import replica_binds
+    try:
+        engines = [('primary', db.engine)]
+        engines += [(bind, db.get_engine(current_app, bind=bind)) for bind in replica_binds(current_app)]
+        options = current_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    except RuntimeError:
+        # 不在应用上下文里
+        return {}
+    gauges = {}
+    for database, engine in engines:
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            continue
+        labels = (('process', process_type()), ('database', database))
+        gauges[_series('blog_db_pool_connections', labels + (('state', 'in_use'),))] = pool.checkedout()
+        gauges[_series('blog_db_pool_connections', labels + (('state', 'idle'),))] = pool.checkedin()
+        gauges[_series('blog_db_pool_limit', labels)] = \
+            options.get('pool_size', 0) + max(options.get('max_overflow', 0), 0)
+    return gauges
+
+
+def flush(force=False):
+    """
+    把本进程的增量写入 Redis；最近没人抓取时（SCRAPED_KEY 不存在）跳过，增量留在内存里
+    返回是否写入
+    """
+    _state['last_flush'] = time.monotonic()
+    if cache is None:
+        return False
+    try:
+        r = cache.redis_client
+        if not force and not r.exists(SCRAPED_KEY):
+            return False
+    except Exception as e:
+        print(f"指标写入失败: {e}")
+        return False
+    series = registry.drain()
+    cache_current, cache_deltas, gauges = _cache_series()
+    gauges.update(_pool_gauges())
+    gauges_key = f'{GAUGES_KEY_PREFIX}{os.getpid()}'
+    try:
+        pipe = r.pipeline(transaction=False)
+        # 值为0的也写：直方图的每个桶、每个计数器都应该出现在输出里
+        for key, value in list(series.items()) + list(cache_deltas.items()):
+            pipe.hincrbyfloat(COUNTERS_KEY, key, value)
+        pipe.hset(gauges_key, mapping=gauges)
+        pipe.expire(gauges_key, GAUGE_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"指标写入失败: {e}")
+        registry.restore(series)
+        return False
+    _state['cache_flushed'] = cache_current
+    return True
+
+
+def _family(series):
+    name = series.split('{', 1)[0]
+    for suffix in ('_bucket', '_sum', '_count'):
+        base = name[:-len(suffix)]
+        if name.endswith(suffix) and METRICS.get(base, ('',))[0] == 'histogram':
+            return base
+    return name
+
+
+def _sort_key(series):
+    # 直方图的桶按 le 数值排序（字符串排序会把 10 排在 2.5 前面）
+    match = _LE_PATTERN.search(series)
+    if match is None:
+        return _LE_PATTERN.sub('', series), 0.0
+    return _LE_PATTERN.sub('', series), float(match.group(1).replace('+Inf', 'inf'))
+
+
+def render():
+    """从 Redis 读出所有 worker 汇总后的指标，生成 Prometheus 文本格式"""
+    r = cache.redis_client
+    values = {field.decode('utf-8'): float(value) for field, value in r.hgetall(COUNTERS_KEY).items()}
+    gauges = {}
+    for key in r.scan_iter(match=f'{GAUGES_KEY_PREFIX}*', count=100):
+        for field, value in r.hgetall(key).items():
+            name = field.decode('utf-8')
+            gauges[name] = gauges.get(name, 0.0) + float(value)
+    values.update(gauges)
+
+    families = {}
+    for series in values:
+        families.setdefault(_family(series), []).append(series)
+    lines = []
+    for family in sorted(families):
+        kind, description = METRICS.get(family, ('untyped', ''))
+        lines.append(f'# HELP {family} {description}')
+        lines.append(f'# TYPE {family} {kind}')
+        for series in sorted(families[family], key=_sort_key):
+            lines.append(f'{series} {_format_number(values[series])}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+    if cache is None:
+        return Response('# 指标需要 Redis\n', status=503, content_type=CONTENT_TYPE)
+    try:
+        cache.redis_client.set(SCRAPED_KEY, 1, ex=SCRAPE_TTL)
+        flush(force=True)
+        body = render()
+    except Exception as e:
+        print(f"指标读取失败: {e}")
+        return Response(f'# 指标读取失败: {e}\n', status=503, content_type=CONTENT_TYPE)
+    return Response(body, content_type=CONTENT_TYPE)
+
+
+def init_app(app, blueprint):
+    """
+    给蓝图加上请求计时钩子、注册 SQL 事件和 /metrics
+    需要在 app.register_blueprint(blueprint) 之前调用（注册时才会合并蓝图的钩子）
+    """
+    if not _state['listening']:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _state['listening'] = True
+    blueprint.before_request(_start_request)
+    blueprint.after_request(_record_status)
+    blueprint.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        print(render(), end='')
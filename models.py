@@ -1,10 +1,11 @@
 from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import mysql
+from replicas import RoutingSQLAlchemy
 
-# 创建数据库实例
-db = SQLAlchemy()
+# 创建数据库实例（配置了只读副本时，GET 请求的查询会路由到副本，见 replicas.py）
+db = RoutingSQLAlchemy()
 
 #用户模型
 class User(UserMixin,db.Model): #这行代码定义了一个用户模型类，它同时继承了两个类：UserMixin 和 db.Model。
@@ -15,6 +16,9 @@ class User(UserMixin,db.Model): #这行代码定义了一个用户模型类，
     posts=db.relationship('Post',backref='author',lazy=True)
     comments=db.relationship('Comment',backref='author',lazy=True)
     created_at=db.Column(db.DateTime,default=datetime.utcnow)
+    # 冗余计数（由 counters.py 维护），读取时不再 COUNT(*)
+    post_count=db.Column(db.Integer,nullable=False,default=0,server_default='0')
+    comment_count=db.Column(db.Integer,nullable=False,default=0,server_default='0')
 
     def set_password(self,password):
         self.password_hash=generate_password_hash(password)
@@ -31,8 +35,20 @@ class Post(db.Model):
     category_id=db.Column(db.Integer,db.ForeignKey('category.id'),nullable=False)
     comments=db.relationship('Comment',backref='post',lazy=True)
     created_at=db.Column(db.DateTime,default=datetime.utcnow)
-    updated_at=db.Column(db.DateTime,default=datetime.utcnow,onupdate=datetime.utcnow)
+    updated_at=db.Column(db.DateTime,default=datetime.utcnow,onupdate=datetime.utcnow,index=True)
     tags=db.relationship('Tag',secondary='post_tag',backref='posts')
+    comment_count=db.Column(db.Integer,nullable=False,default=0,server_default='0')
+    # 阅读数：先累积在 Redis，由 view_counter.py 定时批量写回
+    view_count=db.Column(db.Integer,nullable=False,default=0,server_default='0')
+    # 热度分：由 hot_posts.py 定期批量计算
+    hot_score=db.Column(db.Float,nullable=False,default=0,server_default='0')
+    # 索引由 optimize_indexes.py 对比数据库后补齐（create_all 不会给已有的表加索引）
+    __table_args__=(
+        # 首页/分类页信息流按 (created_at, id) 倒序游标分页
+        db.Index('idx_post_created_id','created_at','id'),
+        # 某个作者的文章按时间排序
+        db.Index('idx_post_user_created','user_id','created_at'),
+    )
 
 #标签模型
 class Tag(db.Model):
@@ -42,7 +58,9 @@ class Tag(db.Model):
 #文章标签关联表
 post_tag=db.Table('post_tag',
                   db.Column('post_id',db.Integer,db.ForeignKey('post.id'),primary_key=True),
-                  db.Column('tag_id',db.Integer,db.ForeignKey('tag.id'),primary_key=True)
+                  db.Column('tag_id',db.Integer,db.ForeignKey('tag.id'),primary_key=True),
+                  # 主键是 (post_id, tag_id)；按标签查文章走这个索引
+                  db.Index('idx_post_tag_tag_post','tag_id','post_id')
                 )   
 
 #分类模型
@@ -50,6 +68,7 @@ class Category(db.Model):
     id=db.Column(db.Integer,primary_key=True)
     name=db.Column(db.String(200),unique=True,nullable=False)
     posts=db.relationship('Post',backref='category',lazy=True)
+    post_count=db.Column(db.Integer,nullable=False,default=0,server_default='0')
 
 #评论模型
 class Comment(db.Model):
@@ -57,4 +76,40 @@ class Comment(db.Model):
     content=db.Column(db.Text,nullable=False)
     user_id=db.Column(db.Integer,db.ForeignKey('user.id'),nullable=False)
     post_id=db.Column(db.Integer,db.ForeignKey('post.id'),nullable=False)
-    created_at=db.Column(db.DateTime,default=datetime.utcnow)
\ No newline at end of file
+    created_at=db.Column(db.DateTime,default=datetime.utcnow)
+    __table_args__=(
+        # 文章页评论按时间分页
+        db.Index('idx_comment_post_created','post_id','created_at'),
+    )
+
+#批量导入进度（由 content_transfer.py 维护），与导入的数据在同一事务里提交
+class ImportCheckpoint(db.Model):
+    __tablename__='import_checkpoint'
+    name=db.Column(db.String(191),primary_key=True)
+    byte_offset=db.Column(db.BigInteger,nullable=False,default=0)
+    lines=db.Column(db.Integer,nullable=False,default=0)
+    updated_at=db.Column(db.DateTime,default=datetime.utcnow,onupdate=datetime.utcnow)
+
+#全文搜索词表（由 search.py 维护）
+class SearchTerm(db.Model):
+    __tablename__='search_term'
+    id=db.Column(db.Integer,primary_key=True)
+    # MySQL 默认排序规则不区分大小写和重音（cafe = café），词项要按字节比较，否则唯一索引和 IN 查询会把不同的词当成一个
+    term=db.Column(db.String(32).with_variant(mysql.VARCHAR(32,collation='utf8mb4_bin'),'mysql'),unique=True,nullable=False)
+    doc_count=db.Column(db.Integer,nullable=False,default=0,server_default='0')
+
+#全文搜索倒排表：每个词按权重排序的文章列表
+class SearchPosting(db.Model):
+    __tablename__='search_posting'
+    term_id=db.Column(db.Integer,db.ForeignKey('search_term.id'),primary_key=True)
+    post_id=db.Column(db.Integer,db.ForeignKey('post.id'),primary_key=True,index=True)
+    weight=db.Column(db.Float,nullable=False)
+    __table_args__=(
+        db.Index('idx_search_posting_term_weight','term_id','weight'),
+    )
+
+#复制延迟心跳：主库定期写入当前时间，从只读副本读出来算延迟（见 replicas.py）
+class ReplicaHeartbeat(db.Model):
+    __tablename__='replica_heartbeat'
+    id=db.Column(db.Integer,primary_key=True)
+    beat=db.Column(db.Float,nullable=False) #Unix时间戳
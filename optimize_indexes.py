@@ -1,38 +1,164 @@
+#!/usr/bin/env python3
+"""
+索引校验与同步 - 学习：声明式索引、数据库自省（Inspector）、在线DDL
+索引统一在 models.py 里用 db.Index / index=True 声明，这里对比声明和数据库里实际的索引：
+- 缺少的索引：创建（MySQL 用 ALGORITHM=INPLACE, LOCK=NONE 在线加索引，不阻塞读写）
+- 同名但列不同的索引：删除后按声明重建
+- 没有声明的索引：只列出来，加 --drop-extra 才删除（唯一约束、外键唯一依赖的索引不算）
+可以反复执行，已经一致时什么都不做。
+
+运行：python optimize_indexes.py verify               # 只检查，不一致时返回非0
+      python optimize_indexes.py apply [--drop-extra]  # 补齐差异
+"""
+
 import pymysql
 pymysql.install_as_MySQLdb()
 
-from app import app, db
-from sqlalchemy import text
+import sys
+import time
+
+from sqlalchemy import inspect
+
+
+def declared_indexes(metadata):
+    """models.py 声明的索引：{表名: {索引名: (列,...)}}"""
+    declared = {}
+    for table in metadata.sorted_tables:
+        declared[table.name] = {index.name: tuple(column.name for column in index.columns)
+                                for index in table.indexes}
+    return declared
+
+
+def _protected(inspector, table, index, declared):
+    """
+    唯一约束的索引由约束管理，不算多余；外键列（MySQL 要求外键列上有索引）
+    没有被声明的索引或主键以它们为前缀覆盖时，实际承担外键的索引也要保留
+    """
+    if index.get('unique'):
+        return True
+    columns = index['column_names']
+    covering = [list(declared_columns) for declared_columns in declared]
+    covering.append(inspector.get_pk_constraint(table)['constrained_columns'])
+    for foreign_key in inspector.get_foreign_keys(table):
+        constrained = foreign_key['constrained_columns']
+        if columns[:len(constrained)] != constrained:
+            continue
+        if not any(other[:len(constrained)] == constrained for other in covering):
+            return True
+    return False
+
+
+def diff_indexes(engine, metadata):
+    """
+    对比声明和实际的索引，返回 (缺少, 列不一致, 多余) 三个列表，
+    元素为 (表名, 索引名, 声明的列, 实际的列)
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    missing, changed, extra = [], [], []
+    for table, indexes in declared_indexes(metadata).items():
+        if table not in existing_tables:
+            # 表还没建：create_all 会连同索引一起建
+            continue
+        actual = {index['name']: index for index in inspector.get_indexes(table)}
+        for name, columns in indexes.items():
+            if name not in actual:
+                missing.append((table, name, columns, None))
+            elif tuple(actual[name]['column_names']) != columns:
+                changed.append((table, name, columns, tuple(actual[name]['column_names'])))
+        for name, index in actual.items():
+            if name not in indexes and not _protected(inspector, table, index, indexes.values()):
+                extra.append((table, name, None, tuple(index['column_names'])))
+    return missing, changed, extra
+
+
+def _quote(engine, name):
+    return engine.dialect.identifier_preparer.quote(name)
+
+
+def create_index(engine, table, name, columns):
+    columns_sql = ', '.join(_quote(engine, column) for column in columns)
+    if engine.dialect.name == 'mysql':
+        statement = (f"ALTER TABLE {_quote(engine, table)} ADD INDEX {_quote(engine, name)} ({columns_sql}), "
+                     f"ALGORITHM=INPLACE, LOCK=NONE")
+    else:
+        statement = f"CREATE INDEX IF NOT EXISTS {_quote(engine, name)} ON {_quote(engine, table)} ({columns_sql})"
+    with engine.begin() as conn:
+        conn.exec_driver_sql(statement)
+
+
+def drop_index(engine, table, name):
+    if engine.dialect.name == 'mysql':
+        statement = (f"ALTER TABLE {_quote(engine, table)} DROP INDEX {_quote(engine, name)}, "
+                     f"ALGORITHM=INPLACE, LOCK=NONE")
+    else:
+        statement = f"DROP INDEX IF EXISTS {_quote(engine, name)}"
+    with engine.begin() as conn:
+        conn.exec_driver_sql(statement)
+
+
+def _describe(columns):
+    return '(' + ', '.join(columns) + ')' if columns else ''
+
+
+def verify(engine, metadata):
+    """打印差异，返回是否一致（多余的索引只提示，不算不一致）"""
+    missing, changed, extra = diff_indexes(engine, metadata)
+    for table, name, columns, _ in missing:
+        print(f"❌ 缺少索引 {table}.{name} {_describe(columns)}")
+    for table, name, columns, actual in changed:
+        print(f"❌ 索引列不一致 {table}.{name}: 声明 {_describe(columns)}，实际 {_describe(actual)}")
+    for table, name, _, actual in extra:
+        print(f"⚠️  未声明的索引 {table}.{name} {_describe(actual)}")
+    if not (missing or changed):
+        print("✅ 声明的索引都已存在")
+    return not (missing or changed)
+
+
+def apply(engine, metadata, drop_extra=False):
+    """按声明补齐索引，返回执行的操作数"""
+    missing, changed, extra = diff_indexes(engine, metadata)
+    operations = 0
+    for table, name, columns, actual in changed:
+        print(f"🔄 重建索引 {table}.{name}: {_describe(actual)} -> {_describe(columns)}")
+        drop_index(engine, table, name)
+        missing.append((table, name, columns, None))
+        operations += 1
+    for table, name, columns, _ in missing:
+        print(f"➕ 创建索引 {table}.{name} {_describe(columns)}...")
+        start = time.time()
+        create_index(engine, table, name, columns)
+        print(f"   完成，用时 {time.time() - start:.1f}s")
+        operations += 1
+    if drop_extra:
+        for table, name, _, actual in extra:
+            print(f"➖ 删除未声明的索引 {table}.{name} {_describe(actual)}")
+            try:
+                drop_index(engine, table, name)
+                operations += 1
+            except Exception as e:
+                print(f"❌ 删除失败（可能被外键使用）: {e}")
+    elif extra:
+        print(f"⚠️  有 {len(extra)} 个未声明的索引，确认不需要后加 --drop-extra 删除")
+    print(f"✅ 索引同步完成，执行了 {operations} 个操作")
+    return operations
 
-def optimize_indexes():
-    with app.app_context():
-        print("⚡ 开始优化索引...")
-        
-        try:
-            # 添加 created_at 索引（优化 ORDER BY）
-            print("1. 添加 created_at 索引...")
-            db.session.execute(text("CREATE INDEX idx_post_created_at ON post(created_at DESC)"))
-            
-            # 添加 user_id 索引（优化 JOIN）
-            print("2. 添加 user_id 索引...")
-            db.session.execute(text("CREATE INDEX idx_post_user_id ON post(user_id)"))
-            
-            # 添加复合索引（进一步优化）
-            print("3. 添加复合索引...")
-            db.session.execute(text("CREATE INDEX idx_post_user_created ON post(created_at DESC，user_id )"))
-            
-            db.session.commit()
-            print("✅ 索引优化完成！")
-            
-            # 验证索引创建
-            indexes = db.session.execute(text("SHOW INDEX FROM post"))
-            print("\n📊 当前文章表索引:")
-            for idx in indexes:
-                print(f"   - {idx[2]}: {idx[4]} ({idx[10]})")
-                
-        except Exception as e:
-            print(f"❌ 索引创建失败: {e}")
-            db.session.rollback()
 
 if __name__ == '__main__':
-    optimize_indexes()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='对比 models.py 声明的索引和数据库中的索引')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('verify', help='只检查差异')
+    apply_parser = subparsers.add_parser('apply', help='创建缺少的索引、重建列不一致的索引')
+    apply_parser.add_argument('--drop-extra', action='store_true', help='同时删除未声明的索引')
+    args = parser.parse_args()
+
+    from app import app
+    from models import db
+
+    with app.app_context():
+        print(f"⚡ 检查索引: {db.engine.url.render_as_string(hide_password=True)}")
+        if args.command == 'verify':
+            sys.exit(0 if verify(db.engine, db.metadata) else 1)
+        apply(db.engine, db.metadata, drop_extra=args.drop_extra)
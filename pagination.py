@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+游标（keyset）分页 - 学习：OFFSET的线性代价、复合键比较、近似计数
+按 (created_at, id) 定位上一页的最后一条，每页都只扫描 per_page+1 行，
+与页码深度无关；也不需要对整表 COUNT(*)。
+"""
+
+import base64
+import json
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析"""
+
+
+def encode_cursor(created_at, ident, direction='next'):
+    """把 (created_at, id, 方向) 编码为URL安全的不透明字符串"""
+    payload = json.dumps([created_at.isoformat(), ident, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """解析游标，返回 (created_at, id, 方向)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, ident, direction = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        return datetime.fromisoformat(created_at), int(ident), direction
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise InvalidCursor(f"无效的分页游标: {token!r}") from e
+
+
+class KeysetPage:
+    """游标分页结果"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, time_column, id_column, cursor=None, per_page=10, descending=True):
+    """
+    按 (time_column, id_column) 做游标分页
+    query 上已有的排序会被替换；cursor 为 encode_cursor 生成的字符串或 None（第一页）
+    """
+    created_at, ident, direction = decode_cursor(cursor) if cursor else (None, None, 'next')
+
+    # 向前翻页时反向扫描，取出后再倒序
+    forward = direction == 'next'
+    scan_descending = descending if forward else not descending
+
+    if cursor:
+        if scan_descending:
+            condition = or_(time_column < created_at, and_(time_column == created_at, id_column < ident))
+        else:
+            condition = or_(time_column > created_at, and_(time_column == created_at, id_column > ident))
+        query = query.filter(condition)
+
+    if scan_descending:
+        ordering = (time_column.desc(), id_column.desc())
+    else:
+        ordering = (time_column.asc(), id_column.asc())
+    rows = query.order_by(None).order_by(*ordering).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    if not forward:
+        items.reverse()
+
+    def key_of(item):
+        return getattr(item, time_column.key), getattr(item, id_column.key)
+
+    next_cursor = prev_cursor = None
+    if items:
+        if (has_more if forward else cursor):
+            next_cursor = encode_cursor(*key_of(items[-1]), 'next')
+        if (cursor if forward else has_more):
+            prev_cursor = encode_cursor(*key_of(items[0]), 'prev')
+    return KeysetPage(items, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+_approximate_counts = {}
+
+
+def approximate_count(name, count_function, ttl=60):
+    """
+    进程内缓存的近似计数：ttl 秒内重复使用上次结果
+    count_function 应该是廉价的计数（例如对冗余计数列求和），而不是 COUNT(*)
+    """
+    now = time.monotonic()
+    cached = _approximate_counts.get(name)
+    if cached and now - cached[1] < ttl:
+        return cached[0]
+    value = count_function()
+    _approximate_counts[name] = (value, now)
+    return value
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+读写分离 - 学习：只读副本、会话路由、读己之写（read-your-writes）、复制延迟
+配置了 DATABASE_REPLICA_URLS（逗号分隔）后，每个副本是一个 SQLALCHEMY_BINDS 里的 replica<N>，
+会话按下面的规则选择连接：
+- GET/HEAD 请求里的 SELECT（ORM 查询、select()）读副本，其余一律走主库
+- 请求里一旦写过（flush、INSERT/UPDATE/DELETE），之后的读也走主库，保证同一事务看到自己的修改
+- 写过之后 REPLICA_STICKY_SECONDS 秒内，同一个浏览器会话（Flask session）的请求都读主库，
+  发表文章后跳转到详情页时不会因为复制延迟看不到刚发的文章
+- 复制延迟：主库每隔几秒写一次心跳（replica_heartbeat 表，Celery beat 执行），
+  读副本上的心跳算出延迟，超过 REPLICA_MAX_LAG 秒或副本连不上时回退到主库
+- 要写入页面缓存的渲染（cache_view 未命中或刷新）读主库，副本的延迟数据不会在缓存里留到过期
+- 请求之外（Celery、脚本）只用主库
+
+本地测试：主库和副本用两个 SQLite 文件，复制文件即“同步”，
+    DATABASE_URL=sqlite:///primary.db DATABASE_REPLICA_URLS=sqlite:///replica.db
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm, text
+
+REPLICA_BIND_PREFIX = 'replica'
+HEARTBEAT_TABLE = 'replica_heartbeat'
+# 每个进程多久重新检查一次副本延迟（秒）
+LAG_CHECK_INTERVAL = 5
+# 只读请求的方法
+READ_METHODS = ('GET', 'HEAD')
+# Flask session 里记录读主库截止时间的键
+STICKY_SESSION_KEY = '_primary_until'
+
+_READ_ONLY_TEXT = ('SELECT', 'WITH', 'SHOW', 'EXPLAIN', 'PRAGMA')
+
+
+def replica_binds(app):
+    """配置的副本 bind 名，如 ['replica0', 'replica1']"""
+    return sorted(key for key in (app.config.get('SQLALCHEMY_BINDS') or {})
+                  if key.startswith(REPLICA_BIND_PREFIX))
+
+
+def _is_select(clause):
+    return (clause is not None and getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None)
+
+
+def _is_write(session, clause):
+    """flush 和 DML 算写；文本 SQL 不是 SELECT 之类的只读语句时也算写"""
+    if session._flushing:
+        return True
+    if clause is None:
+        return False
+    if getattr(clause, 'is_dml', False):
+        return True
+    if getattr(clause, 'is_text', False):
+        words = clause.text.split(None, 1)
+        return bool(words) and words[0].upper() not in _READ_ONLY_TEXT
+    return False
+
+
+class _LagMonitor:
+    """按进程缓存每个副本的延迟检查结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def lag(self, engine, bind):
+        """副本延迟秒数；副本不可用或没有心跳时返回 None"""
+        now = time.time()
+        with self._lock:
+            cached = self._checked.get(bind)
+            if cached is not None and now - cached[0] < LAG_CHECK_INTERVAL:
+                return cached[1]
+        try:
+            with engine.connect() as conn:
+                beat = conn.execute(text(f"SELECT beat FROM {HEARTBEAT_TABLE} WHERE id = 1")).scalar()
+            lag = None if beat is None else max(now - float(beat), 0.0)
+        except Exception as e:
+            print(f"⚠️  副本 {bind} 检查失败，暂时读主库: {e}")
+            lag = None
+        with self._lock:
+            self._checked[bind] = (now, lag)
+        return lag
+
+    def reset(self):
+        with self._lock:
+            self._checked.clear()
+
+
+lag_monitor = _LagMonitor()
+
+
+def _sticky():
+    return session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+def _mark_write():
+    """本次请求之后的读都走主库，并让这个浏览器会话在一段时间内也读主库"""
+    g.replica_wrote = True
+    session[STICKY_SESSION_KEY] = time.time() + current_app.config.get('REPLICA_STICKY_SECONDS', 10)
+
+
+def use_primary(f):
+    """视图装饰器：整个请求只读主库（需要最新数据的 GET，如编辑表单）"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.replica_wrote = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@contextmanager
+def primary_reads():
+    """代码块内的读走主库（结果会被缓存的渲染），不影响请求里其余的查询"""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('replica_primary', False)
+    g.replica_primary = True
+    try:
+        yield
+    finally:
+        g.replica_primary = previous
+
+
+def choose_replica(db, app):
+    """当前请求可以读副本时返回副本 Engine，否则返回 None"""
+    if not has_request_context() or request.method not in READ_METHODS:
+        return None
+    if g.get('replica_wrote') or g.get('replica_primary') or _sticky():
+        return None
+    binds = replica_binds(app)
+    if not binds:
+        return None
+    max_lag = app.config.get('REPLICA_MAX_LAG', 30)
+    candidates = list(binds)
+    random.shuffle(candidates)
+    for bind in candidates:
+        engine = db.get_engine(app, bind=bind)
+        if max_lag <= 0:
+            return engine
+        lag = lag_monitor.lag(engine, bind)
+        if lag is not None and lag <= max_lag:
+            return engine
+    return None
+
+
+class RoutingSession(SignallingSession):
+    """按上面的规则在主库和副本之间选择连接"""
+
+    def __init__(self, db, **options):
+        self._routing_db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if has_request_context() and replica_binds(self.app):
+            if _is_write(self, clause):
+                if not g.get('replica_wrote'):
+                    _mark_write()
+            elif _is_select(clause):
+                replica = choose_replica(self._routing_db, self.app)
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """使用 RoutingSession 的 Flask-SQLAlchemy；没有配置副本时和默认行为相同"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def write_heartbeat(db):
+    """在主库写入心跳（Celery beat 定期执行），副本复制到后即可算出延迟"""
+    now = time.time()
+    with db.engine.begin() as conn:
+        updated = conn.execute(text(f"UPDATE {HEARTBEAT_TABLE} SET beat = :beat WHERE id = 1"), {'beat': now})
+        if not updated.rowcount:
+            conn.execute(text(f"INSERT INTO {HEARTBEAT_TABLE} (id, beat) VALUES (1, :beat)"), {'beat': now})
+    return now
+
+
+def replica_status(db, app):
+    """各副本的延迟（秒，None 表示不可用），不使用缓存"""
+    lag_monitor.reset()
+    return {bind: lag_monitor.lag(db.get_engine(app, bind=bind), bind) for bind in replica_binds(app)}
+
+
+if __name__ == '__main__':
+    from app import app
+    from models import db
+
+    with app.app_context():
+        binds = replica_binds(app)
+        if not binds:
+            print("⚠️  没有配置 DATABASE_REPLICA_URLS")
+        for bind, lag in replica_status(db, app).items():
+            if lag is None:
+                print(f"❌ {bind}: 不可用或没有心跳")
+            else:
+                flag = '✅' if lag <= app.config.get('REPLICA_MAX_LAG', 30) else '⚠️ '
+                print(f"{flag} {bind}: 延迟 {lag:.1f}s")
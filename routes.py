@@ -1,37 +1,116 @@
 import pymysql
 pymysql.install_as_MySQLdb()
 
-from flask import Blueprint, request, flash, redirect, render_template, url_for, abort
+from flask import Blueprint, request, flash, redirect, render_template, url_for, abort, current_app, jsonify, Response, stream_with_context
 from models import db, User, Post, Category, Tag, Comment, post_tag
 import json
 from flask_login import login_user, login_required, logout_user, current_user
+from feed_queries import (get_feed_page, get_categories, get_post_detail,
+                          get_comments_page, serialize_comment,
+                          get_feed_validators, get_post_validators,
+                          query_budget_view, FEED_QUERY_BUDGET, POST_QUERY_BUDGET)
+from conditional import conditional_view
+from pagination import decode_cursor, InvalidCursor
+import counters
+import search as search_index
+from tag_service import parse_tag_names, set_post_tags
+import content_transfer
+from functools import wraps
+from datetime import datetime
 
 # 安全导入Celery任务
 try:
-    from celery_tasks import process_user_registration, update_post_statistics
+    from celery_tasks import process_user_registration, schedule_post_statistics
     CELERY_AVAILABLE = True
     print("✅ Celery任务可用")
 except ImportError:
     CELERY_AVAILABLE = False
     print("⚠️  Celery不可用，使用同步模式")
 
+# 安全导入缓存
+try:
+    from cache_helper import cache_view, cache_invalidate
+    from view_counter import count_post_view, most_viewed, remove_post_views
+    CACHE_AVAILABLE = True
+except ImportError:
+    CACHE_AVAILABLE = False
+    print("⚠️  Redis缓存不可用，页面不缓存")
+
+    def cache_view(*args, **kwargs):
+        return lambda f: f
+
+    def cache_invalidate(*args, **kwargs):
+        return lambda f: f
+
+    def count_post_view(f):
+        return f
+
+    def most_viewed(limit=10):
+        return []
+
+    def remove_post_views(post_id):
+        pass
+
+# 安全导入热度排行（依赖 NumPy 和 Redis）
+try:
+    from hot_posts import hot_posts
+except ImportError:
+    print("⚠️  热度排行不可用")
+
+    def hot_posts(offset=0, limit=10):
+        return []
+
 # 创建蓝图
 bp = Blueprint('main', __name__) #创建一个名为 main 的蓝图实例
 
+# 热门文章每页篇数、最多页数
+HOT_PER_PAGE = 10
+HOT_PAGES = 10
+
 # 路由定义
 @bp.route('/')
+@conditional_view(lambda: get_feed_validators(request.args.get('cursor')))
+# 导航栏显示用户名，登录用户各自一份，未登录访客共享一份
+@cache_view(timeout=300, namespaces=('index',), query_args=('cursor',), vary_on_user=True, stale_ttl=60)
+@query_budget_view(FEED_QUERY_BUDGET)
 def index():
+    # 旧的页码分页（OFFSET + COUNT）已下线，深页码统一回到第一页
+    if 'page' in request.args:
+        return redirect(url_for('main.index'), code=301)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursor:
+            abort(400)
     try:
-        page = request.args.get('page', 1, type=int)
-        posts = Post.query.order_by(Post.created_at.desc()).paginate(page=page, per_page=5,error_out=False)
-        categories = Category.query.all()
-        return render_template('index.html', posts=posts, categories=categories)
+        # 作者、分类、标签随文章批量预加载，避免模板中逐篇懒加载（N+1）
+        posts = get_feed_page(cursor, with_total=current_app.config.get('FEED_SHOW_TOTAL', True))
+        categories = get_categories()
+        return render_template('index.html', posts=posts, categories=categories, popular_posts=most_viewed(5))
     except Exception as e:
         print(f"Error in index route: {str(e)}")  # 打印错误信息以便调试
         # 确保即使没有数据也能显示页面
         return render_template('index.html', posts=None, categories=[])
 
 
+@bp.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    results = search_index.search(query, page=page) if query else None
+    return render_template('search.html', query=query, results=results)
+
+
+@bp.route('/hot')
+def hot():
+    # 排行榜由定时任务发布到 Redis，这里只读前 HOT_PAGES 页
+    page = min(max(request.args.get('page', 1, type=int), 1), HOT_PAGES)
+    posts = hot_posts(offset=(page - 1) * HOT_PER_PAGE, limit=HOT_PER_PAGE + 1)
+    has_next = len(posts) > HOT_PER_PAGE and page < HOT_PAGES
+    return render_template('hot.html', posts=posts[:HOT_PER_PAGE], page=page, has_next=has_next)
+
+
 @bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method=='POST':
@@ -133,23 +212,45 @@ def logout():
 def profile():
     # 强制刷新用户数据，确保获取最新的文章和评论计数
     user = User.query.get(current_user.id)
-    # 手动加载文章和评论集合，确保计数是最新的
-    posts_count = Post.query.filter_by(user_id=user.id).count()
-    comments_count = Comment.query.filter_by(user_id=user.id).count()
+    # 计数由 counters.py 在写入时维护，这里只读列
+    posts_count = user.post_count
+    comments_count = user.comment_count
     return render_template('profile.html', user=user, posts_count=posts_count, comments_count=comments_count)
 
 
 
 @bp.route('/post/<int:post_id>')
+@count_post_view
+@conditional_view(get_post_validators)
+@cache_view(timeout=1800, namespaces=('post:{post_id}', 'categories'), vary_on_user=True, stale_ttl=60)
+@query_budget_view(POST_QUERY_BUDGET)
 def show_post(post_id):
-    # 🎯 异步更新文章统计
-    if CELERY_AVAILABLE:
-        update_post_statistics.delay(post_id)
+    post = get_post_detail(post_id)
+    if post is None:
+        abort(404)
+
+    # 热度重算由阅读数落库任务按批派发（这里在页面缓存里面，命中时不会执行）
+    # 只渲染第一页评论，其余页由 comments_json 按需加载
+    comments = get_comments_page(post_id)
+    return render_template('post.html',post=post,comments=comments)
 
-    return render_template('post.html',post=post)
+
+@bp.route('/post/<int:post_id>/comments')
+def comments_json(post_id):
+    if not db.session.query(Post.id).filter_by(id=post_id).first():
+        abort(404)
+    try:
+        comments = get_comments_page(post_id, cursor=request.args.get('cursor'))
+    except InvalidCursor:
+        abort(400)
+    return jsonify({
+        'comments': [serialize_comment(comment) for comment in comments.items],
+        'next_cursor': comments.next_cursor,
+    })
 
 @bp.route('/post/<int:post_id>/comment', methods=['POST'])
 @login_required
+@cache_invalidate('post:{post_id}')
 def add_comment(post_id):
     post = Post.query.get_or_404(post_id)
     content = request.form.get('content')
@@ -159,13 +260,17 @@ def add_comment(post_id):
     
     comment = Comment(content=content, post_id=post_id, user_id=current_user.id)
     db.session.add(comment)
+    counters.comment_added(comment)
     db.session.commit()
+    if CELERY_AVAILABLE:
+        schedule_post_statistics(post_id)
     flash('评论发表成功', 'success')
     return redirect(url_for('main.show_post', post_id=post_id))
 
 
 @bp.route('/create', methods=['GET', 'POST'])
 @login_required
+@cache_invalidate('index')
 def create_post():
     if request.method=='POST':
         if request.is_json:
@@ -173,17 +278,12 @@ def create_post():
             title = data.get('title')
             content = data.get('content')
             category_id = data.get('category')
-            tags = data.get('tags', '')
-            if isinstance(tags, list):
-                tag_names = tags
-            else:
-                tag_names = [t.strip() for t in tags.split(',') if t.strip()]
+            tag_names = parse_tag_names(data.get('tags', ''))
         else:
             title = request.form.get('title')
             content = request.form.get('content')
             category_id = request.form.get('category')
-            tags = request.form.get('tags', '')
-            tag_names = [t.strip() for t in tags.split(',') if t.strip()]
+            tag_names = parse_tag_names(request.form.get('tags', ''))
         
         if not title or not content or not category_id:
             if request.is_json:
@@ -199,16 +299,12 @@ def create_post():
             return redirect(url_for('main.create_post'))
             
         post=Post(title=title,content=content,user_id=current_user.id,category_id=category_id)
-
-        for tag_name in tag_names:
-            tag_name=tag_name.strip()
-            if tag_name:
-                tag=Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag=Tag(name=tag_name)
-                    db.session.add(tag)
-                post.tags.append(tag)
         db.session.add(post)
+        counters.post_created(post)
+        db.session.flush()
+        # 标签批量解析，关联一次插入
+        set_post_tags(post, tag_names, is_new=True)
+        search_index.index_post(post)
         db.session.commit()
         flash('文章已发布','success')
         return redirect(url_for('main.index'))
@@ -218,24 +314,31 @@ def create_post():
 
 @bp.route('/edit/<int:post_id>', methods=['GET', 'POST'])
 @login_required
+@cache_invalidate('index', 'post:{post_id}')
 def edit_post(post_id):
     post=Post.query.get_or_404(post_id)
     if post.author!=current_user:
         abort(403)
     if request.method=='POST':
-        post.title=request.form.get('title')
-        post.content=request.form.get('content')
-        post.category_id=request.form.get('category')
-        tag_names=request.form.get('tags','').split(',')
-        post.tags=[]
-        for tag_name in tag_names:
-            tag_name=tag_name.strip()
-            if tag_name:
-                tag=Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag=Tag(name=tag_name)
-                    db.session.add(tag)
-                post.tags.append(tag)
+        title=request.form.get('title')
+        content=request.form.get('content')
+        category_id=request.form.get('category', type=int)
+        if not title or not content or not category_id:
+            flash('标题、内容和分类都是必填项', 'error')
+            return redirect(url_for('main.edit_post', post_id=post.id))
+        # 验证分类是否存在（在改动计数之前）
+        if not Category.query.get(category_id):
+            flash('无效的分类', 'error')
+            return redirect(url_for('main.edit_post', post_id=post.id))
+        old_category_id=post.category_id
+        post.title=title
+        post.content=content
+        post.category_id=category_id
+        counters.post_category_changed(post, old_category_id)
+        db.session.flush()
+        # 只增删有变化的标签关联
+        set_post_tags(post, parse_tag_names(request.form.get('tags','')))
+        search_index.index_post(post)
         db.session.commit()
         flash('文章已更新','success')
         return redirect(url_for('main.show_post', post_id=post.id))
@@ -246,17 +349,25 @@ def edit_post(post_id):
 
 @bp.route('/delete/<int:post_id>', methods=['POST'])
 @login_required
+@cache_invalidate('index', 'post:{post_id}')
 def delete_post(post_id):
     post=Post.query.get_or_404(post_id)
     if post.author!=current_user:
         abort(403)
+    counters.post_deleted(post)
+    search_index.remove_post(post.id)
+    # 先删除文章下的评论（comment.post_id 不允许为空）
+    Comment.query.filter_by(post_id=post.id).delete(synchronize_session=False)
     db.session.delete(post)
     db.session.commit()
+    remove_post_views(post_id)
     flash('文章已删除','success')
     return redirect(url_for('main.index'))
 
 @bp.route('/categories', methods=['GET', 'POST'])
 @login_required
+# 文章页也显示分类名，改名后通过 categories 命名空间失效
+@cache_invalidate('index', 'categories')
 def manage_categories():
     if request.method == 'POST':
         if request.is_json:
@@ -310,3 +421,41 @@ def manage_categories():
 
     categories = Category.query.order_by(Category.name).all()
     return render_template('categories.html', categories=categories)
+
+
+def admin_required(f):
+    """只允许 ADMIN_USERNAMES 里的用户访问"""
+    @wraps(f)
+    @login_required
+    def decorated_function(*args, **kwargs):
+        if current_user.username not in current_app.config.get('ADMIN_USERNAMES', ()):
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@bp.route('/admin/export')
+@admin_required
+def export_content():
+    # 边查边发送，不在内存里拼出整个文件
+    since = request.args.get('since')
+    try:
+        since = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        abort(400)
+    lines = content_transfer.export_posts(since=since)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=posts.ndjson'})
+
+
+@bp.route('/admin/import', methods=['POST'])
+@admin_required
+@cache_invalidate('index')
+def import_content():
+    # 请求体按行流式读取；带 checkpoint 参数时，中断后重新上传同一文件会跳过已导入的行
+    checkpoint = request.args.get('checkpoint') or None
+    try:
+        stats = content_transfer.import_posts(request.stream, checkpoint_name=checkpoint)
+    except content_transfer.ContentImportError as e:
+        return jsonify({'error': str(e), 'line': e.line_number}), 400
+    return jsonify(stats)
@@ -12,7 +12,7 @@ bp = Blueprint('main', __name__) #创建一个名为 main 的蓝图实例
 
 # 路由定义
 @bp.route('/')
-@cache_view(timeout=60)  # 首页缓存60秒
+@cache_view(timeout=300, namespaces=('index',), query_args=('page',), vary_on_user=True)  # 首页缓存5分钟
 def index():
     try:
         page = request.args.get('page', 1, type=int)
@@ -129,13 +129,14 @@ def profile():
 
 
 @bp.route('/post/<int:post_id>')
-@cache_view(timeout=300)  # 文章页缓存5分钟
+@cache_view(timeout=1800, namespaces=('post:{post_id}',), vary_on_user=True)  # 文章页缓存30分钟
 def show_post(post_id):
     post=Post.query.get_or_404(post_id)
     return render_template('post.html',post=post)
 
 @bp.route('/post/<int:post_id>/comment', methods=['POST'])
 @login_required
+@cache_invalidate('post:{post_id}')  # 评论后文章页缓存失效
 def add_comment(post_id):
     post = Post.query.get_or_404(post_id)
     content = request.form.get('content')
@@ -152,7 +153,7 @@ def add_comment(post_id):
 
 @bp.route('/create', methods=['GET', 'POST'])
 @login_required
-@cache_invalidate('view:index:*')  # 创建文章后清除首页缓存
+@cache_invalidate('index')  # 创建文章后首页缓存失效
 def create_post():
     if request.method=='POST':
         if request.is_json:
@@ -205,6 +206,7 @@ def create_post():
 
 @bp.route('/edit/<int:post_id>', methods=['GET', 'POST'])
 @login_required
+@cache_invalidate('index', 'post:{post_id}')  # 编辑后首页和文章页缓存失效
 def edit_post(post_id):
     post=Post.query.get_or_404(post_id)
     if post.author!=current_user:
@@ -233,6 +235,7 @@ def edit_post(post_id):
 
 @bp.route('/delete/<int:post_id>', methods=['POST'])
 @login_required
+@cache_invalidate('index', 'post:{post_id}')  # 删除后首页和文章页缓存失效
 def delete_post(post_id):
     post=Post.query.get_or_404(post_id)
     if post.author!=current_user:
@@ -8,7 +8,7 @@ from flask_login import login_user, login_required, logout_user, current_user
 
 # 安全导入Celery任务
 try:
-    from celery_tasks import process_user_registration, update_post_statistics
+    from celery_tasks import process_user_registration, schedule_post_statistics
     CELERY_AVAILABLE = True
     print("✅ Celery任务可用")
 except ImportError:
@@ -142,9 +142,9 @@ def profile():
 
 @bp.route('/post/<int:post_id>')
 def show_post(post_id):
-    # 🎯 异步更新文章统计
+    # 🎯 异步更新文章统计（合并派发，窗口内多次阅读只算一次）
     if CELERY_AVAILABLE:
-        update_post_statistics.delay(post_id)
+        schedule_post_statistics(post_id)
 
     return render_template('post.html',post=post)
 
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+全文搜索 - 学习：倒排索引、中文n-gram分词、BM25打分、按权重截断的查询
+倒排表存在数据库里（search_term / search_posting），不依赖外部搜索服务。
+
+分词：英文/数字按单词（小写、去掉重音，café 与 cafe 是同一个词）；中文、日文、韩文按相邻两字（bigram），
+单个汉字成段时保留单字。查询用同样的分词，所以“数据库”会匹配“数据”“据库”。
+
+查询：每个查询词只按 (term_id, weight) 索引取权重最高的 MAX_POSTINGS_PER_TERM 篇，
+扫描量与文章总数无关；覆盖查询词越多、BM25分越高的文章排在越前面。
+运行：python search.py rebuild   # 全量重建索引
+      python search.py <关键词>   # 命令行搜索
+"""
+
+import pymysql
+pymysql.install_as_MySQLdb()
+
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import selectinload
+from models import db, Post, SearchTerm, SearchPosting
+from bulk import insert_ignore
+from feed_queries import feed_query, approx_post_count
+
+# 中日韩字符段 | 拉丁字母数字组成的单词
+TOKEN_RE = re.compile(
+    r'([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+)'
+    r'|([0-9a-z\u00c0-\u024f]+)'
+)
+MAX_TERM_LENGTH = 32
+# MySQL 上 search_term.term 的排序规则（见 models.py）
+TERM_COLLATION = 'utf8mb4_bin'
+
+# 字段权重：标题命中比正文命中更重要
+FIELD_WEIGHTS = {'title': 3.0, 'tags': 2.0, 'content': 1.0}
+
+# BM25 参数；文章长度（词数）按 AVG_DOC_TERMS 归一化，避免每次写入都重算平均长度
+BM25_K1 = 1.2
+BM25_B = 0.75
+AVG_DOC_TERMS = 600
+
+# 每个查询词最多读取的倒排条目数、最多使用的查询词数
+MAX_POSTINGS_PER_TERM = 1000
+MAX_QUERY_TERMS = 12
+
+# IN 查询分批大小
+CHUNK_SIZE = 500
+
+
+def normalize(value):
+    """
+    小写、全角转半角、去掉拉丁字母的重音：NFKD 分解后丢弃 U+0300-U+036F 的组合符号，
+    再 NFKC 组合回去（韩文音节、假名的浊音符在 NFKD 下会拆开，必须重新组合）
+    """
+    decomposed = unicodedata.normalize('NFKD', (value or '').lower())
+    stripped = ''.join(ch for ch in decomposed if not '\u0300' <= ch <= '\u036f')
+    return unicodedata.normalize('NFKC', stripped)
+
+
+def tokenize(value):
+    """分词，返回词项列表（可重复）"""
+    terms = []
+    for cjk, word in TOKEN_RE.findall(normalize(value)):
+        if cjk:
+            if len(cjk) == 1:
+                terms.append(cjk)
+            else:
+                terms.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        elif len(word) > 1 or word.isdigit():
+            terms.append(word[:MAX_TERM_LENGTH])
+    return terms
+
+
+def post_term_weights(title, content, tag_names):
+    """计算一篇文章每个词项的权重（BM25 词频饱和 + 字段加权）"""
+    frequencies = Counter()
+    length = 0
+    for field, value in (('title', title), ('tags', ' '.join(tag_names)), ('content', content)):
+        tokens = tokenize(value)
+        length += len(tokens)
+        for token in tokens:
+            frequencies[token] += FIELD_WEIGHTS[field]
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / AVG_DOC_TERMS)
+    return {term: round(f * (BM25_K1 + 1) / (f + norm), 4) for term, f in frequencies.items()}
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _resolve_term_ids(terms):
+    """词项 -> id；不存在的词一次批量插入（并发写入时重复的直接忽略）"""
+    term_ids = {}
+    for chunk in _chunks(terms):
+        term_ids.update(db.session.query(SearchTerm.term, SearchTerm.id)
+                        .filter(SearchTerm.term.in_(chunk)).all())
+    missing = [term for term in terms if term not in term_ids]
+    if missing:
+        insert_ignore(SearchTerm.__table__, [{'term': term, 'doc_count': 0} for term in missing])
+        for chunk in _chunks(missing):
+            term_ids.update(db.session.query(SearchTerm.term, SearchTerm.id)
+                            .filter(SearchTerm.term.in_(chunk)).all())
+    return term_ids
+
+
+def _adjust_doc_counts(deltas):
+    """按增量批量更新文档频率：相同增量的词项合并成一条 UPDATE ... WHERE id IN"""
+    by_delta = defaultdict(list)
+    for term_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(term_id)
+    for delta, term_ids in by_delta.items():
+        for chunk in _chunks(term_ids):
+            (db.session.query(SearchTerm)
+             .filter(SearchTerm.id.in_(chunk))
+             .update({SearchTerm.doc_count: SearchTerm.doc_count + delta}, synchronize_session=False))
+
+
+def _remove_postings(post_ids):
+    """删除若干文章的倒排条目，返回 {term_id: -减少的文档数}"""
+    deltas = Counter()
+    for chunk in _chunks(post_ids):
+        for (term_id,) in (db.session.query(SearchPosting.term_id)
+                           .filter(SearchPosting.post_id.in_(chunk))):
+            deltas[term_id] -= 1
+        (SearchPosting.query
+         .filter(SearchPosting.post_id.in_(chunk))
+         .delete(synchronize_session=False))
+    return deltas
+
+
+def index_posts(posts):
+    """
+    批量（重新）索引文章：旧倒排条目删除后按当前内容写入，
+    词项解析、倒排插入、文档频率更新都按批执行，与文章数无关地只用少量语句
+    """
+    posts = list(posts)
+    if not posts:
+        return
+    deltas = _remove_postings([post.id for post in posts])
+    weights_by_post = {post.id: post_term_weights(post.title, post.content, [tag.name for tag in post.tags])
+                       for post in posts}
+    all_terms = {term for weights in weights_by_post.values() for term in weights}
+    term_ids = _resolve_term_ids(sorted(all_terms))
+
+    rows = []
+    for post_id, weights in weights_by_post.items():
+        for term, weight in weights.items():
+            rows.append({'term_id': term_ids[term], 'post_id': post_id, 'weight': weight})
+            deltas[term_ids[term]] += 1
+    for chunk in _chunks(rows, 2000):
+        db.session.execute(SearchPosting.__table__.insert(), chunk)
+    _adjust_doc_counts(deltas)
+
+
+def index_post(post):
+    """文章发布或编辑后更新索引（需已 flush，post.id 可用）"""
+    index_posts([post])
+
+
+def remove_post(post_id):
+    """文章删除前移除其索引"""
+    _adjust_doc_counts(_remove_postings([post_id]))
+
+
+class SearchResult:
+    """搜索结果分页"""
+
+    def __init__(self, items, total, page, per_page):
+        self.items = items
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page * self.per_page < self.total
+
+
+def search(query, page=1, per_page=10):
+    """搜索文章，按（覆盖的查询词数, BM25分）降序"""
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return SearchResult([], 0, page, per_page)
+
+    total_docs = max(approx_post_count(), 1)
+    scores = defaultdict(float)
+    matched = Counter()
+    for term_id, doc_count in (db.session.query(SearchTerm.id, SearchTerm.doc_count)
+                               .filter(SearchTerm.term.in_(terms))):
+        if doc_count <= 0:
+            continue
+        idf = math.log(1 + (total_docs - doc_count + 0.5) / (doc_count + 0.5))
+        postings = (db.session.query(SearchPosting.post_id, SearchPosting.weight)
+                    .filter(SearchPosting.term_id == term_id)
+                    .order_by(SearchPosting.weight.desc())
+                    .limit(MAX_POSTINGS_PER_TERM))
+        for post_id, weight in postings:
+            scores[post_id] += weight * idf
+            matched[post_id] += 1
+
+    ranked = sorted(scores, key=lambda post_id: (matched[post_id], scores[post_id]), reverse=True)
+    page_ids = ranked[(page - 1) * per_page: page * per_page]
+    posts = {post.id: post for post in feed_query().filter(Post.id.in_(page_ids))} if page_ids else {}
+    return SearchResult([posts[post_id] for post_id in page_ids if post_id in posts],
+                        len(ranked), page, per_page)
+
+
+def ensure_term_collation():
+    """已有的 MySQL 词表改为按字节比较（create_all 不会修改已存在的表），返回是否修改"""
+    if db.engine.dialect.name != 'mysql':
+        return False
+    column = next(c for c in inspect(db.engine).get_columns(SearchTerm.__tablename__) if c['name'] == 'term')
+    if getattr(column['type'], 'collation', None) == TERM_COLLATION:
+        return False
+    db.session.execute(text(
+        f"ALTER TABLE {SearchTerm.__tablename__} MODIFY term VARCHAR({MAX_TERM_LENGTH}) "
+        f"CHARACTER SET utf8mb4 COLLATE {TERM_COLLATION} NOT NULL"
+    ))
+    db.session.commit()
+    return True
+
+
+def rebuild_index(batch_size=500):
+    """全量重建索引：清空后按 id 分批读取文章（不一次加载全表）"""
+    SearchPosting.query.delete(synchronize_session=False)
+    SearchTerm.query.delete(synchronize_session=False)
+    db.session.commit()
+
+    last_id = 0
+    indexed = 0
+    while True:
+        batch = (Post.query.options(selectinload(Post.tags))
+                 .filter(Post.id > last_id)
+                 .order_by(Post.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+        last_id = batch[-1].id
+        index_posts(batch)
+        db.session.commit()
+        db.session.expunge_all()
+        indexed += len(batch)
+        print(f"   已索引 {indexed} 篇")
+    return indexed
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from app import app
+
+    with app.app_context():
+        if len(sys.argv) > 1 and sys.argv[1] == 'rebuild':
+            if ensure_term_collation():
+                print(f"   + 词表排序规则改为 {TERM_COLLATION}")
+            print("🔎 开始重建搜索索引...")
+            print(f"✅ 索引重建完成: {rebuild_index()} 篇")
+        elif len(sys.argv) > 1:
+            start = time.time()
+            result = search(' '.join(sys.argv[1:]))
+            print(f"🔎 找到 {result.total} 篇，用时 {(time.time() - start) * 1000:.2f}ms")
+            for post in result.items:
+                print(f"   [{post.id}] {post.title}")
+        else:
+            print("用法: python search.py rebuild | python search.py <关键词>")
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+慢查询日志 - 学习：SQL指纹、按指纹聚合、自动 EXPLAIN
+开启后（SLOW_QUERY_LOG=1）通过 SQLAlchemy 的 cursor 事件统计每条 SQL 的耗时：
+把语句里的字面量、参数占位符、IN 列表归一化成指纹，按指纹累计执行次数、总耗时、最大耗时，
+并记录来自哪个路由（后台进程记为 <脚本名>）。单次耗时超过 SLOW_QUERY_THRESHOLD_MS 的 SELECT
+在写入时用单独的连接执行一次 EXPLAIN，每个指纹只抓一次执行计划。
+
+聚合方式和 metrics.py 相同：进程内累计，每 FLUSH_INTERVAL 秒用一个 pipeline 写入 Redis，
+统计按小时分桶（保留 RETENTION_HOURS 小时），报告可以只看最近几小时，最近新出现的指纹会标出来，
+模板里新加的 N+1 查询表现为执行次数突增的新指纹。最大耗时用 ZADD GT（需要 Redis 6.2+）。
+
+运行：python slow_queries.py report [--hours 24] [--sort total|count|max|mean] [--limit 20] [--plans]
+      python slow_queries.py reset
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 安全导入缓存：没有 Redis 时慢查询日志不开启
+try:
+    from cache_helper import cache
+except ImportError:
+    cache = None
+
+KEY_PREFIX = 'slowlog'
+# 每个进程最多每隔多少秒写一次 Redis
+FLUSH_INTERVAL = 10
+# 按小时分桶的统计保留多久
+RETENTION_HOURS = 72
+# 默认 EXPLAIN 阈值（毫秒）
+DEFAULT_THRESHOLD_MS = 100
+# 首次出现在多少小时内的指纹在报告里标为新出现
+NEW_WITHIN_HOURS = 6
+# 路由名超过这么多种时不再细分（防止异常请求撑爆哈希）
+MAX_ROUTES_PER_FINGERPRINT = 50
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|%\(\w+\)s|(?<![:\w]):\w+|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_VALUES = re.compile(r'\bVALUES\s*\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))*', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(statement):
+    """把语句归一化：字面量和参数都变成 ?，IN (?, ?, ?) 和多行 VALUES 折叠成 (...)"""
+    text = _STRING.sub('?', statement)
+    text = _NUMBER.sub('?', text)
+    text = _PLACEHOLDER.sub('?', text)
+    text = _LIST.sub('(...)', text)
+    text = _VALUES.sub('VALUES (...)', text)
+    return _SPACE.sub(' ', text).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+def _hour(ts=None):
+    return datetime.utcfromtimestamp(ts or time.time()).strftime('%Y%m%d%H')
+
+
+def _key(name, hour=None):
+    return f'{KEY_PREFIX}:{name}:{hour}' if hour else f'{KEY_PREFIX}:{name}'
+
+
+def _current_route():
+    if has_request_context():
+        return request.endpoint or request.path
+    return f'<{os.path.basename(sys.argv[0]) or "python"}>'
+
+
+class SlowQueryLog:
+    """进程内的按指纹累计；flush() 把增量写入 Redis 并执行待抓取的 EXPLAIN"""
+
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+        self._statements = {}
+        self._pending_plans = {}
+        self._explained = set()
+        self._normalized = {}
+        self._last_flush = time.monotonic()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # 记在执行上下文上，语句抛出异常时不会留下残值
+        if context is not None:
+            context._slow_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_slow_query_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        if getattr(self._local, 'explaining', False):
+            return
+        self.record(statement, elapsed, _current_route(),
+                    engine=conn.engine, parameters=None if executemany else parameters)
+        if not has_request_context() and time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def record(self, statement, elapsed, route, engine=None, parameters=None):
+        normalized = self._normalized.get(statement)
+        if normalized is None:
+            # 同一条语句文本反复出现（ORM 生成的 SQL 是固定的），正则只跑一次
+            normalized = normalize(statement)
+            if len(self._normalized) < 10000:
+                self._normalized[statement] = normalized
+        fp = fingerprint(normalized)
+        with self._lock:
+            stats = self._stats.get(fp)
+            if stats is None:
+                stats = self._stats[fp] = {'count': 0, 'total': 0.0, 'max': 0.0, 'routes': {}}
+                self._statements[fp] = normalized
+            stats['count'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            stats['routes'][route] = stats['routes'].get(route, 0) + 1
+            if (elapsed >= self.threshold and engine is not None and fp not in self._explained
+                    and normalized.split(' ', 1)[0].upper() in ('SELECT', 'WITH')):
+                self._explained.add(fp)
+                self._pending_plans[fp] = (engine, statement, parameters)
+
+    def _explain(self, engine, statement, parameters):
+        prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+        self._local.explaining = True
+        try:
+            with engine.connect() as conn:
+                result = conn.exec_driver_sql(prefix + statement, parameters or ())
+                columns = list(result.keys())
+                return [dict(zip(columns, [str(value) for value in row])) for row in result]
+        finally:
+            self._local.explaining = False
+
+    def flush(self):
+        """写入 Redis，返回写入的指纹数"""
+        self._last_flush = time.monotonic()
+        with self._lock:
+            stats, self._stats = self._stats, {}
+            statements, self._statements = self._statements, {}
+            pending, self._pending_plans = self._pending_plans, {}
+        if not stats:
+            return 0
+        plans = {}
+        for fp, (engine, statement, parameters) in pending.items():
+            try:
+                plans[fp] = json.dumps(self._explain(engine, statement, parameters), ensure_ascii=False)
+            except Exception as e:
+                plans[fp] = json.dumps([{'error': str(e)}], ensure_ascii=False)
+
+        hour = _hour()
+        ttl = RETENTION_HOURS * 3600
+        try:
+            pipe = cache.redis_client.pipeline(transaction=False)
+            for fp, values in stats.items():
+                pipe.hincrby(_key('count', hour), fp, values['count'])
+                pipe.hincrbyfloat(_key('total', hour), fp, values['total'])
+                pipe.zadd(_key('max', hour), {fp: values['max']}, gt=True)
+                for route, count in list(values['routes'].items())[:MAX_ROUTES_PER_FINGERPRINT]:
+                    pipe.hincrby(_key('routes', hour), f'{fp}|{route}', count)
+                pipe.hsetnx(_key('statements'), fp, statements[fp])
+                pipe.hsetnx(_key('first_seen'), fp, int(time.time()))
+            for name in ('count', 'total', 'max', 'routes'):
+                pipe.expire(_key(name, hour), ttl)
+            if plans:
+                pipe.hset(_key('plans'), mapping=plans)
+            for name in ('statements', 'first_seen', 'plans'):
+                pipe.expire(_key(name), ttl)
+            pipe.execute()
+        except Exception as e:
+            # 丢掉这一批统计，不影响请求；执行计划留到下次再抓
+            print(f"慢查询日志写入失败: {e}")
+            self._explained.difference_update(pending)
+            return 0
+        return len(stats)
+
+    def _teardown(self, exc):
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+
+_log = {'instance': None}
+
+
+def init_app(app):
+    """SLOW_QUERY_LOG 开启时注册 cursor 事件（对所有 Engine 生效）和请求结束时的写入"""
+    if not app.config.get('SLOW_QUERY_LOG'):
+        return None
+    if cache is None:
+        print("⚠️  Redis不可用，慢查询日志未开启")
+        return None
+    if _log['instance'] is None:
+        log = SlowQueryLog(app.config.get('SLOW_QUERY_THRESHOLD_MS', DEFAULT_THRESHOLD_MS))
+        event.listen(Engine, 'before_cursor_execute', log._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', log._after_cursor_execute)
+        atexit.register(log.flush)
+        _log['instance'] = log
+    app.teardown_request(_log['instance']._teardown)
+    return _log['instance']
+
+
+def report(hours=24, sort='total', limit=20, route=None):
+    """汇总最近 hours 小时的统计，按 sort 排序返回前 limit 个指纹"""
+    r = cache.redis_client
+    now = time.time()
+    rows = {}
+    for i in range(hours):
+        hour = _hour(now - i * 3600)
+        for fp, count in r.hgetall(_key('count', hour)).items():
+            rows.setdefault(fp.decode(), {'count': 0, 'total': 0.0, 'max': 0.0, 'routes': {}})['count'] += int(count)
+        for fp, total in r.hgetall(_key('total', hour)).items():
+            if fp.decode() in rows:
+                rows[fp.decode()]['total'] += float(total)
+        for fp, worst in r.zrange(_key('max', hour), 0, -1, withscores=True):
+            if fp.decode() in rows:
+                rows[fp.decode()]['max'] = max(rows[fp.decode()]['max'], worst)
+        for field, count in r.hgetall(_key('routes', hour)).items():
+            fp, name = field.decode().split('|', 1)
+            if fp in rows:
+                rows[fp]['routes'][name] = rows[fp]['routes'].get(name, 0) + int(count)
+    if route:
+        rows = {fp: row for fp, row in rows.items() if route in row['routes']}
+    for row in rows.values():
+        row['mean'] = row['total'] / row['count'] if row['count'] else 0.0
+    top = sorted(rows.items(), key=lambda item: item[1][sort], reverse=True)[:limit]
+    if not top:
+        return []
+
+    fps = [fp for fp, _ in top]
+    statements = r.hmget(_key('statements'), fps)
+    first_seen = r.hmget(_key('first_seen'), fps)
+    plans = r.hmget(_key('plans'), fps)
+    results = []
+    for (fp, row), statement, seen, plan in zip(top, statements, first_seen, plans):
+        row.update({
+            'fingerprint': fp,
+            'statement': statement.decode('utf-8') if statement else '',
+            'first_seen': int(seen) if seen else None,
+            'new': bool(seen) and int(seen) >= now - NEW_WITHIN_HOURS * 3600,
+            'plan': json.loads(plan) if plan else None,
+        })
+        results.append(row)
+    return results
+
+
+def reset():
+    """删除所有慢查询统计"""
+    r = cache.redis_client
+    keys = list(r.scan_iter(match=f'{KEY_PREFIX}:*', count=500))
+    if keys:
+        r.delete(*keys)
+    return len(keys)
+
+
+def _print_report(rows, hours, show_plans):
+    print(f"🐢 最近 {hours} 小时的 SQL 指纹（共 {len(rows)} 个）")
+    for i, row in enumerate(rows, 1):
+        routes = ', '.join(f"{name}×{count}" for name, count in
+                           sorted(row['routes'].items(), key=lambda item: -item[1])[:3])
+        flag = ' 🆕' if row['new'] else ''
+        print(f"\n{i}. [{row['fingerprint']}]{flag} 次数 {row['count']}  总耗时 {row['total'] * 1000:.1f}ms  "
+              f"平均 {row['mean'] * 1000:.2f}ms  最大 {row['max'] * 1000:.2f}ms")
+        print(f"   路由: {routes}")
+        print(f"   {row['statement'][:300]}")
+        if show_plans and row['plan']:
+            print("   执行计划:")
+            for step in row['plan']:
+                print("     " + ', '.join(f"{key}={value}" for key, value in step.items()))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='慢查询日志报告')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    report_parser = subparsers.add_parser('report', help='列出耗时最多的 SQL 指纹')
+    report_parser.add_argument('--hours', type=int, default=24)
+    report_parser.add_argument('--sort', choices=['total', 'count', 'max', 'mean'], default='total')
+    report_parser.add_argument('--limit', type=int, default=20)
+    report_parser.add_argument('--route', help='只看某个路由（如 main.index）')
+    report_parser.add_argument('--plans', action='store_true', help='显示抓到的执行计划')
+    subparsers.add_parser('reset', help='清空统计')
+    args = parser.parse_args()
+
+    if cache is None:
+        print("❌ 慢查询日志存放在 Redis 里，请先安装 redis 并配置 REDIS_URL")
+        raise SystemExit(1)
+    if args.command == 'report':
+        _print_report(report(args.hours, args.sort, args.limit, args.route), args.hours, args.plans)
+    else:
+        print(f"✅ 已删除 {reset()} 个键")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+标签服务 - 学习：批量解析、并发安全的批量插入、差量更新关联表
+发布一篇带20个标签的文章只需4条语句：查已有标签、批量插入缺失标签、
+补查新标签id、批量插入关联；编辑时只增删变化的关联行。
+"""
+
+from datetime import datetime
+
+from models import db, Tag, post_tag
+from bulk import insert_ignore, match_names
+
+# 与 Tag.name 列宽一致
+MAX_TAG_LENGTH = 100
+
+
+def normalize_tag_names(names):
+    """去空白、去空、按首次出现顺序去重"""
+    result = []
+    seen = set()
+    for name in names:
+        name = (name or '').strip()[:MAX_TAG_LENGTH]
+        if name and name not in seen:
+            seen.add(name)
+            result.append(name)
+    return result
+
+
+def parse_tag_names(value):
+    """表单里逗号分隔的字符串或 JSON 里的列表 -> 标签名列表"""
+    if isinstance(value, (list, tuple)):
+        return normalize_tag_names(value)
+    return normalize_tag_names((value or '').split(','))
+
+
+def resolve_tags(names):
+    """
+    标签名 -> Tag（键是请求的名字），不存在的标签批量创建
+    一条 IN 查询取已有标签；缺失的用 INSERT IGNORE 一次插入（并发写入同名标签时不冲突），
+    再用一条 IN 查询取回它们（包括被其它请求抢先插入的）
+    """
+    names = normalize_tag_names(names)
+    if not names:
+        return {}
+    # 不区分大小写的排序规则下，'flask' 对应到已有的 'Flask'
+    tags = match_names(names, ((tag.name, tag) for tag in Tag.query.filter(Tag.name.in_(names))))
+    missing = [name for name in names if name not in tags]
+    if missing:
+        insert_ignore(Tag.__table__, [{'name': name} for name in missing])
+        tags.update(match_names(missing, ((tag.name, tag) for tag in Tag.query.filter(Tag.name.in_(missing)))))
+    return tags
+
+
+def set_post_tags(post, names, is_new=False):
+    """
+    把文章标签更新为 names，只插入新增、删除移除的 post_tag 行
+    post 需已 flush（post.id 可用）；is_new 时跳过读取现有关联
+    返回标签是否有变化
+    """
+    wanted_ids = {tag.id for tag in resolve_tags(names).values()}
+    if is_new:
+        current_ids = set()
+    else:
+        current_ids = {tag_id for (tag_id,) in
+                       db.session.query(post_tag.c.tag_id).filter(post_tag.c.post_id == post.id)}
+
+    added = wanted_ids - current_ids
+    removed = current_ids - wanted_ids
+    if added:
+        db.session.execute(post_tag.insert(),
+                           [{'post_id': post.id, 'tag_id': tag_id} for tag_id in sorted(added)])
+    if removed:
+        db.session.execute(post_tag.delete().where(
+            post_tag.c.post_id == post.id,
+            post_tag.c.tag_id.in_(removed),
+        ))
+    if not (added or removed):
+        return False
+
+    # 关联表是直接改的，让 post.tags 下次访问时重新加载
+    db.session.expire(post, ['tags'])
+    if not is_new:
+        # 标签显示在文章页上，修改标签也算内容更新（ETag / 增量备份依赖 updated_at）
+        post.updated_at = datetime.utcnow()
+    return True
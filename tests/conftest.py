@@ -0,0 +1,69 @@
+"""
+测试环境：临时 SQLite 库 + fakeredis，app 在导入前按环境变量配置，所以要先设置 DATABASE_URL
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_DB_DIR = tempfile.mkdtemp(prefix='blog-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_DB_DIR, 'primary.db')
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+
+import fakeredis
+
+from app import app as flask_app
+from cache_helper import cache
+from models import db
+
+cache.redis_client = fakeredis.FakeRedis()
+
+TEST_USER = 'user1'
+TEST_PASSWORD = 'pw'
+
+
+@pytest.fixture(scope='session')
+def db_dir():
+    yield _DB_DIR
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def app(db_dir):
+    import datagen
+
+    flask_app.config.update(TESTING=True, QUERY_BUDGET_STRICT=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        # 每篇文章带几个标签和评论，N+1 会直接体现在 SQL 条数上
+        datagen.generate(users=10, categories=4, tags=30, posts=40, comments=200, max_tags=4,
+                         password=TEST_PASSWORD)
+        db.session.remove()
+    yield flask_app
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    """每个用例从空的 Redis 和 L1 开始，页面缓存不会掩盖真实的查询"""
+    cache.redis_client.flushall()
+    if cache.local_cache is not None:
+        cache.local_cache.clear()
+    yield
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def logged_in_client(app):
+    client = app.test_client()
+    response = client.post('/login', data={'username': TEST_USER, 'password': TEST_PASSWORD})
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,176 @@
+"""备份与恢复：全量往返、增量只带变化的行、损坏的归档被拒绝、失败的恢复整体回滚"""
+
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+import backup
+import counters
+import search
+from models import Comment, Post, db
+
+
+def _snapshot():
+    """所有备份表的全部行，按主键排序"""
+    rows = {}
+    for name in backup.TABLES:
+        table = db.metadata.tables[name]
+        rows[name] = [tuple(row) for row in
+                      db.session.execute(select(table).order_by(*table.primary_key.columns))]
+    return rows
+
+
+def _read_lines(path):
+    with gzip.open(path, 'rb') as f:
+        return f.read().splitlines(keepends=True)
+
+
+def _write_lines(path, lines):
+    with gzip.open(path, 'wb') as f:
+        f.writelines(lines)
+
+
+@pytest.fixture
+def restored(app):
+    """恢复会清空搜索索引，用例结束后重建，不影响其它测试"""
+    yield
+    with app.app_context():
+        search.rebuild_index()
+
+
+@pytest.fixture
+def full_archive(app, tmp_path):
+    with app.app_context():
+        info = backup.create_backup(str(tmp_path / 'full.ndjson.gz'))
+    return info
+
+
+def test_full_backup_round_trip(app, full_archive, restored):
+    assert full_archive['mode'] == 'full'
+    assert not os.path.exists(full_archive['path'] + '.part')
+    with app.app_context():
+        before = _snapshot()
+        assert full_archive['tables'] == {name: len(rows) for name, rows in before.items()}
+        # 改动一些数据，恢复后应回到备份时的状态
+        db.session.query(Comment).filter(Comment.id % 3 == 0).delete(synchronize_session=False)
+        post = Post.query.order_by(Post.id).first()
+        post.title = 'changed'
+        post.view_count += 7
+        db.session.commit()
+        info = backup.restore_backup(full_archive['path'])
+        db.session.expire_all()
+        assert info['mode'] == 'full'
+        assert _snapshot() == before
+
+
+def test_incremental_backup_exports_only_changes(app, tmp_path, restored):
+    with app.app_context():
+        since = datetime.utcnow()
+        time.sleep(0.01)
+        post = Post.query.order_by(Post.id).first()
+        post.content = post.content + ' edited'
+        comment = Comment(content='new comment', post_id=post.id, user_id=post.user_id)
+        db.session.add(comment)
+        counters.comment_added(comment)
+        # 阅读数由写缓冲更新，不改 updated_at
+        db.session.execute(Post.__table__.update()
+                           .where(Post.__table__.c.id == post.id + 1)
+                           .values(view_count=Post.__table__.c.view_count + 100,
+                                   updated_at=Post.__table__.c.updated_at))
+        db.session.commit()
+        post_count = Post.query.count()
+        tag_count = len(post.tags)
+
+        path = str(tmp_path / 'incremental.ndjson.gz')
+        info = backup.create_backup(path, since=since)
+        assert info['mode'] == 'incremental'
+        assert info['tables']['post'] == 1
+        assert info['tables']['comment'] == 1
+        assert info['tables']['post_tag'] == tag_count
+        # 所有文章的阅读数、热度分都带上
+        assert info['tables']['post.update'] == post_count
+        assert backup.verify_backup(path)['tables'] == info['tables']
+
+        expected = _snapshot()
+        db.session.query(Comment).filter(Comment.id == comment.id).delete(synchronize_session=False)
+        post.content = 'lost'
+        db.session.execute(Post.__table__.update()
+                           .where(Post.__table__.c.id == post.id + 1)
+                           .values(view_count=0, updated_at=Post.__table__.c.updated_at))
+        db.session.commit()
+
+        backup.restore_backup(path)
+        db.session.expire_all()
+        assert _snapshot() == expected
+
+        # 恢复用例新增的评论，其余测试看到的数据保持原样
+        db.session.query(Comment).filter(Comment.id == comment.id).delete(synchronize_session=False)
+        counters.rebuild_counters()
+
+
+def test_verify_rejects_truncated_archive(app, full_archive, tmp_path):
+    lines = _read_lines(full_archive['path'])
+    path = str(tmp_path / 'truncated.ndjson.gz')
+    _write_lines(path, lines[:len(lines) // 2])
+    with pytest.raises(backup.BackupError, match='不完整'):
+        backup.verify_backup(path)
+
+    # gzip 本身被截断
+    with open(full_archive['path'], 'rb') as f:
+        data = f.read()
+    path = str(tmp_path / 'cut.ndjson.gz')
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    with pytest.raises(backup.BackupError):
+        backup.verify_backup(path)
+
+
+def test_verify_rejects_tampered_archive(app, full_archive, tmp_path):
+    lines = _read_lines(full_archive['path'])
+    index = next(i for i, line in enumerate(lines) if line.startswith(b'['))
+    row = json.loads(lines[index])
+    row[1] = 'tampered'
+    lines[index] = (json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8')
+    path = str(tmp_path / 'tampered.ndjson.gz')
+    _write_lines(path, lines)
+    with pytest.raises(backup.BackupError, match='校验和'):
+        backup.verify_backup(path)
+    with app.app_context():
+        before = _snapshot()
+        with pytest.raises(backup.BackupError):
+            backup.restore_backup(path)
+        assert _snapshot() == before
+
+
+def test_failed_full_restore_rolls_back(app, full_archive, tmp_path, monkeypatch):
+    """写入中途出错（这里是重复的主键）时，清空和已写入的批次一起回滚"""
+    monkeypatch.setattr(backup, 'RESTORE_BATCH_SIZE', 50)
+    lines = _read_lines(full_archive['path'])
+    header = next(i for i, line in enumerate(lines) if line.startswith(b'{"table":"comment","columns"'))
+    # 第一条评论在评论表中间再出现一次：之前的批次已经写入，之后的还没有
+    lines.insert(header + 120, lines[header + 1])
+    path = str(tmp_path / 'duplicate.ndjson.gz')
+    _write_lines(path, lines)
+    with app.app_context():
+        before = _snapshot()
+        with pytest.raises(Exception):
+            backup.restore_backup(path, verify=False)
+        db.session.expire_all()
+        assert _snapshot() == before
+
+
+def test_failed_backup_removes_partial_file(app, tmp_path, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(backup, '_backup_query', broken)
+    path = str(tmp_path / 'broken.ndjson.gz')
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            backup.create_backup(path)
+    assert os.listdir(tmp_path) == []
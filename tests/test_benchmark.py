@@ -0,0 +1,72 @@
+"""基准工具：分位数、缓存命中率之差、结果对比和回归判定"""
+
+import json
+
+import pytest
+from sqlalchemy import text
+
+import benchmark
+from models import db
+
+
+def test_percentiles_interpolate_linearly():
+    result = benchmark.percentiles([float(value) for value in range(1, 102)])
+    assert result['p50'] == pytest.approx(51)
+    assert result['p95'] == pytest.approx(96)
+    assert result['p99'] == pytest.approx(100)
+    assert result['mean'] == pytest.approx(51)
+    assert (result['min'], result['max']) == (1, 101)
+
+
+@pytest.mark.parametrize('samples, value', [([], 0.0), ([3.5], 3.5)])
+def test_percentiles_of_tiny_samples(samples, value):
+    assert set(benchmark.percentiles(samples).values()) == {value}
+
+
+def test_cache_delta_reports_hit_rate_per_tier():
+    before = {'l1': {'hits': 10, 'misses': 5}, 'redis': {'hits': 1, 'misses': 1}}
+    after = {'l1': {'hits': 40, 'misses': 15}, 'redis': {'hits': 1, 'misses': 1}, 'new': {'hits': 2}}
+    assert benchmark._cache_delta(before, after) == {
+        'l1': {'hits': 30, 'misses': 10, 'hit_rate': 0.75},
+        'new': {'hits': 2, 'misses': 0, 'hit_rate': 1.0},
+    }
+
+
+def test_run_scenario_counts_statements(app):
+    calls = []
+
+    def scenario(i):
+        calls.append(i)
+        db.session.execute(text('SELECT 1'))
+        db.session.execute(text('SELECT 2'))
+
+    with app.app_context():
+        result = benchmark.run_scenario(scenario, warmup=3, iterations=5, engine=db.engine)
+    # 预热不计入结果，迭代编号接着预热往下
+    assert calls == list(range(8))
+    assert result['iterations'] == 5
+    assert result['sql_per_iteration'] == {'mean': 2, 'max': 2}
+    assert set(result['latency_ms']) == {'p50', 'p95', 'p99', 'mean', 'min', 'max'}
+
+
+def _report(**scenarios):
+    return {'meta': {}, 'scenarios': {
+        name: {'latency_ms': {'p50': p50, 'p95': p95}, 'sql_per_iteration': {'mean': sql}}
+        for name, (p50, p95, sql) in scenarios.items()}}
+
+
+def test_compare_flags_slower_p95_and_more_sql():
+    old = _report(index=(1.0, 2.0, 3), post=(1.0, 2.0, 5), steady=(1.0, 2.0, 4), gone=(1.0, 1.0, 1))
+    new = _report(index=(1.0, 2.5, 3), post=(0.5, 1.0, 6), steady=(3.0, 2.2, 4), added=(1.0, 1.0, 1))
+    regressions = benchmark.compare(old, new, threshold=0.15)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('index: p95')
+    assert regressions[1] == 'post: SQL 5 -> 6'
+
+
+def test_compare_command_exit_code(tmp_path):
+    old, new = tmp_path / 'old.json', tmp_path / 'new.json'
+    old.write_text(json.dumps(_report(index=(1.0, 2.0, 3))))
+    new.write_text(json.dumps(_report(index=(1.0, 2.1, 3))))
+    assert benchmark.main(['compare', str(old), str(new)]) == 0
+    assert benchmark.main(['compare', str(old), str(new), '--threshold', '0.01']) == 1
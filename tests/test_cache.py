@@ -0,0 +1,76 @@
+"""批量缓存接口：get_many / set_many / delete_many 每次只有一次 Redis 往返"""
+
+import fakeredis
+import pytest
+
+from cache_helper import Codec, LocalLRU, RedisCache
+
+
+class CountingRedis(fakeredis.FakeRedis):
+    """记录执行的命令和 pipeline 次数"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commands = []
+        self.pipelines = 0
+
+    def execute_command(self, *args, **options):
+        self.commands.append(args[0])
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, *args, **kwargs):
+        self.pipelines += 1
+        return super().pipeline(*args, **kwargs)
+
+
+@pytest.fixture
+def redis_cache():
+    cache = RedisCache(codec=Codec())
+    cache.redis_client = CountingRedis()
+    return cache
+
+
+def test_set_many_then_get_many(redis_cache):
+    values = {f'k{i}': {'i': i, 'text': 'x' * (i * 500)} for i in range(5)}
+    assert redis_cache.set_many(values, expire=60)
+    assert redis_cache.redis_client.pipelines == 1
+    redis_cache.redis_client.commands.clear()
+
+    assert redis_cache.get_many(list(values) + ['missing']) == values
+    assert redis_cache.redis_client.commands == ['MGET']
+    stats = redis_cache.get_stats()['l2']
+    assert (stats['hits'], stats['misses']) == (5, 1)
+
+
+def test_delete_many(redis_cache):
+    redis_cache.set_many({'a': 1, 'b': 2, 'c': 3})
+    assert redis_cache.delete_many(['a', 'b'])
+    assert redis_cache.get_many(['a', 'b', 'c']) == {'c': 3}
+    assert redis_cache.delete_many([])
+
+
+def test_get_many_uses_local_cache_first():
+    cache = RedisCache(codec=Codec(), local_cache=LocalLRU(max_entries=10))
+    cache.redis_client = CountingRedis()
+    cache.set_many({'a': 1, 'b': 2})
+    cache.redis_client.commands.clear()
+    assert cache.get_many(['a', 'b']) == {'a': 1, 'b': 2}
+    # 两个键都在L1里（订阅线程在运行），不访问 Redis
+    assert 'MGET' not in cache.redis_client.commands
+
+
+def test_get_many_survives_redis_errors(redis_cache):
+    class Broken:
+        def mget(self, keys):
+            raise ConnectionError('down')
+
+    redis_cache.redis_client = Broken()
+    assert redis_cache.get_many(['a']) == {}
+
+
+def test_cached_view_is_quiet_on_the_request_path(client, capsys):
+    """页面缓存的命中、未命中每个请求都会发生，不往标准输出打印"""
+    capsys.readouterr()
+    for _ in range(3):
+        assert client.get('/').status_code == 200
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,78 @@
+"""合并派发：窗口内同一组只投递一次批量任务，失败的批次放回集合"""
+
+import pytest
+
+import celery_tasks
+from cache_helper import cache
+
+GROUP = 'test_group'
+PENDING_KEY = f"{celery_tasks.COALESCE_PREFIX}{GROUP}:pending"
+SCHEDULED_KEY = f"{celery_tasks.COALESCE_PREFIX}{GROUP}:scheduled"
+
+
+class FakeTask:
+    name = 'tests.fake_batch'
+
+    def __init__(self, result=None):
+        self.result = result or {"status": "success"}
+        self.batches = []
+
+    def __call__(self, items):
+        self.batches.append(sorted(items))
+        return self.result
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    calls = []
+    monkeypatch.setattr(celery_tasks.drain_coalesced, 'apply_async',
+                        lambda args, countdown: calls.append((args, countdown)))
+    return calls
+
+
+def _register(monkeypatch, task):
+    monkeypatch.setitem(celery_tasks.celery.tasks, task.name, task)
+    return task
+
+
+def _pending():
+    return sorted(item.decode('utf-8') for item in cache.redis_client.smembers(PENDING_KEY))
+
+
+def test_dispatch_dedupes_items_and_schedules_one_drain(scheduled):
+    task = FakeTask()
+    for post_id in ['1', '2', '1', '3', '2']:
+        celery_tasks.dispatch_coalesced(task, GROUP, post_id, 60)
+    assert scheduled == [((task.name, GROUP), 60)]
+    assert _pending() == ['1', '2', '3']
+
+
+def test_drain_runs_task_once_per_batch_and_allows_new_schedule(monkeypatch, scheduled):
+    task = _register(monkeypatch, FakeTask())
+    for post_id in ['1', '2', '3']:
+        celery_tasks.dispatch_coalesced(task, GROUP, post_id, 60)
+    result = celery_tasks.drain_coalesced(task.name, GROUP)
+    assert result['drained'] == 3
+    assert task.batches == [['1', '2', '3']]
+    assert _pending() == []
+    # 清除了调度标记，下一次派发投递新的批量任务
+    celery_tasks.dispatch_coalesced(task, GROUP, '4', 60)
+    assert len(scheduled) == 2
+
+
+class RaisingTask(FakeTask):
+    def __call__(self, items):
+        super().__call__(items)
+        raise RuntimeError('db down')
+
+
+@pytest.mark.parametrize('task', [FakeTask({"status": "error", "message": "db down"}), RaisingTask()])
+def test_drain_puts_failed_batch_back(monkeypatch, scheduled, task):
+    """任务返回 error 或抛异常：这批项目放回集合，批量任务进入重试"""
+    _register(monkeypatch, task)
+    for post_id in ['1', '2']:
+        celery_tasks.dispatch_coalesced(task, GROUP, post_id, 60)
+    with pytest.raises(Exception, match='db down'):
+        celery_tasks.drain_coalesced(task.name, GROUP)
+    assert task.batches == [['1', '2']]
+    assert _pending() == ['1', '2']
@@ -0,0 +1,67 @@
+"""评论分页：游标翻页不重不漏（同一时间的评论按 id 排序），JSON 接口校验游标"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from feed_queries import COMMENTS_PER_PAGE, get_comments_page
+from models import Comment, Post, db
+
+TOTAL = COMMENTS_PER_PAGE * 2 + 5
+
+
+@pytest.fixture(scope='module')
+def post_id(app):
+    with app.app_context():
+        post = Post(title='many comments', content='body', user_id=1, category_id=1)
+        db.session.add(post)
+        db.session.flush()
+        start = datetime(2024, 1, 1)
+        # 每三条评论同一时间，翻页边界上必须按 id 区分
+        db.session.add_all(Comment(content=f'c{i}', post_id=post.id, user_id=1,
+                                   created_at=start + timedelta(minutes=i // 3))
+                           for i in range(TOTAL))
+        db.session.commit()
+        post_id = post.id
+    yield post_id
+    with app.app_context():
+        Comment.query.filter_by(post_id=post_id).delete()
+        Post.query.filter_by(id=post_id).delete()
+        db.session.commit()
+
+
+def test_walk_pages(app, post_id):
+    with app.app_context():
+        seen, cursor = [], None
+        while True:
+            page = get_comments_page(post_id, cursor=cursor, per_page=7)
+            seen.extend(comment.content for comment in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+    assert seen == [f'c{i}' for i in range(TOTAL)]
+
+
+def test_json_endpoint_pages(client, post_id):
+    contents, cursor = [], None
+    while True:
+        response = client.get(f'/post/{post_id}/comments', query_string={'cursor': cursor} if cursor else {})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert len(data['comments']) <= COMMENTS_PER_PAGE
+        contents.extend(comment['content'] for comment in data['comments'])
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+    assert contents == [f'c{i}' for i in range(TOTAL)]
+
+
+def test_post_page_renders_first_page_only(client, post_id):
+    body = client.get(f'/post/{post_id}').get_data(as_text=True)
+    assert f'<p class="card-text">c{COMMENTS_PER_PAGE - 1}</p>' in body
+    assert f'<p class="card-text">c{COMMENTS_PER_PAGE}</p>' not in body
+
+
+def test_json_endpoint_errors(client, post_id):
+    assert client.get(f'/post/{post_id}/comments?cursor=garbage').status_code == 400
+    assert client.get('/post/999999/comments').status_code == 404
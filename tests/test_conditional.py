@@ -0,0 +1,80 @@
+"""首页、文章页的 ETag 在影响页面内容的修改之后必须变化"""
+
+from models import Category, Post, db
+
+
+def _revalidate(client, url, etag):
+    return client.get(url, headers={'If-None-Match': etag})
+
+
+def test_feed_not_modified(logged_in_client):
+    etag = logged_in_client.get('/').headers['ETag']
+    assert _revalidate(logged_in_client, '/', etag).status_code == 304
+
+
+def test_category_rename_changes_feed_and_post_etag(app, logged_in_client):
+    with app.app_context():
+        post = Post.query.filter(Post.category_id.isnot(None)).first()
+        post_id, category_id = post.id, post.category_id
+        name = db.session.get(Category, category_id).name
+    post_url = f'/post/{post_id}'
+    feed_etag = logged_in_client.get('/').headers['ETag']
+    post_etag = logged_in_client.get(post_url).headers['ETag']
+
+    response = logged_in_client.post('/categories', data={'action': 'edit', 'id': category_id,
+                                                           'name': name + '-renamed'})
+    assert response.status_code == 302
+
+    feed = _revalidate(logged_in_client, '/', feed_etag)
+    assert feed.status_code == 200
+    assert (name + '-renamed').encode() in feed.data
+    page = _revalidate(logged_in_client, post_url, post_etag)
+    assert page.status_code == 200
+    assert (name + '-renamed').encode() in page.data
+
+
+def test_view_flush_changes_feed_etag(app, client):
+    import view_counter
+
+    with app.app_context():
+        post_id = Post.query.order_by(Post.id).first().id
+    etag = client.get('/').headers['ETag']
+    view_counter.record_view(post_id)
+    with app.app_context():
+        view_counter.flush_views()
+    assert _revalidate(client, '/', etag).status_code == 200
+
+
+def test_delete_post_removes_it_from_most_viewed(app, client, logged_in_client):
+    import view_counter
+    from cache_helper import cache
+
+    with app.app_context():
+        category_id = Category.query.first().id
+    logged_in_client.post('/create', data={'title': 'short-lived', 'content': 'body', 'category': category_id})
+    with app.app_context():
+        post_id = Post.query.filter_by(title='short-lived').one().id
+        view_counter.record_view(post_id)
+        view_counter.flush_views()
+    assert cache.redis_client.zscore(view_counter.TOP_KEY, post_id) is not None
+    # 登录用户的下一页带 flash 消息，不走条件请求，用访客检查 ETag
+    etag = client.get('/').headers['ETag']
+
+    assert logged_in_client.post(f'/delete/{post_id}').status_code == 302
+    assert cache.redis_client.zscore(view_counter.TOP_KEY, post_id) is None
+    assert not cache.redis_client.hexists(view_counter.TITLES_KEY, post_id)
+    response = _revalidate(client, '/', etag)
+    assert response.status_code == 200
+    assert b'short-lived' not in response.data
+
+
+def test_no_last_modified_when_it_cannot_cover_the_etag(app, client):
+    with app.app_context():
+        post_id = Post.query.order_by(Post.id).first().id
+    for url in ('/', f'/post/{post_id}'):
+        response = client.get(url)
+        assert 'ETag' in response.headers
+        assert 'Last-Modified' not in response.headers
+    # 只带 If-Modified-Since 的请求不会得到304
+    response = client.get('/', headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+    assert response.status_code == 200
@@ -0,0 +1,39 @@
+"""按启动命令判断进程类型：命令行脚本用 worker 配置，不受 web 的语句超时限制"""
+
+import pytest
+
+import config
+
+
+@pytest.mark.parametrize('argv0, expected', [
+    ('/srv/venv/bin/gunicorn', 'web'),
+    ('/srv/venv/bin/flask', 'web'),
+    ('/srv/venv/lib/python3.11/site-packages/flask/__main__.py', 'web'),
+    ('app.py', 'web'),
+    ('', 'web'),
+    ('/srv/venv/bin/celery', 'worker'),
+    ('/srv/venv/lib/python3.11/site-packages/celery/__main__.py', 'worker'),
+    ('backup.py', 'worker'),
+    ('/srv/flask/search.py', 'worker'),
+    ('hot_posts.py', 'worker'),
+])
+def test_process_type_from_command(monkeypatch, argv0, expected):
+    monkeypatch.delenv('BLOG_PROCESS_TYPE', raising=False)
+    monkeypatch.setattr(config.sys, 'argv', [argv0])
+    assert config.process_type() == expected
+
+
+def test_worker_profile_has_no_statement_timeout(monkeypatch):
+    monkeypatch.setenv('BLOG_PROCESS_TYPE', 'worker')
+    monkeypatch.delenv('DB_STATEMENT_TIMEOUT_MS', raising=False)
+    monkeypatch.delenv('WORKER_DB_STATEMENT_TIMEOUT_MS', raising=False)
+    assert config.database_settings()['statement_timeout_ms'] == 0
+
+
+def test_database_defaults_to_local_sqlite(monkeypatch):
+    """没有 DATABASE_URL 时用本地 SQLite，代码里不带任何数据库账号密码"""
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.delenv('DATABASE_REPLICA_URLS', raising=False)
+    settings = config.database_config()
+    assert settings['SQLALCHEMY_DATABASE_URI'] == 'sqlite:///blog.db'
+    assert '@' not in config.DEFAULT_DATABASE_URL
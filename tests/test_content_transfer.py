@@ -0,0 +1,47 @@
+"""批量导入：名字按数据库排序规则对应，写入失败报告为导入错误"""
+
+import json
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import content_transfer
+from bulk import match_names
+
+
+def _line(**fields):
+    record = {'type': 'post', 'title': 't', 'content': 'c', 'author': 'user1', 'category': 'Imported'}
+    record.update(fields)
+    return json.dumps(record) + '\n'
+
+
+def test_match_names_follows_case_and_accent_insensitive_rows():
+    # MySQL 对 IN ('flask', 'café') 返回的是库里的拼写
+    assert match_names(['flask', 'café', 'redis'], [('Flask', 1), ('CAFE', 2)]) == {'flask': 1, 'café': 2}
+    # 二进制排序规则下两种拼写都在库里时，按原样对应
+    assert match_names(['flask'], [('Flask', 1), ('flask', 2)]) == {'flask': 2}
+
+
+@pytest.fixture
+def admin_client(app, logged_in_client, monkeypatch):
+    monkeypatch.setitem(app.config, 'ADMIN_USERNAMES', ['user1'])
+    return logged_in_client
+
+
+def test_import_batch_failure_is_reported(app, admin_client, monkeypatch):
+    def fail(names):
+        raise OperationalError('INSERT', {}, Exception('lost connection'))
+
+    monkeypatch.setattr(content_transfer, '_resolve_categories', fail)
+    body = '\n' + _line(title='a') + _line(title='b')
+    response = admin_client.post('/admin/import', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 400
+    assert response.get_json()['line'] == 2
+    assert '2-3' in response.get_json()['error']
+
+
+def test_import_resolves_existing_names(app, admin_client):
+    body = _line(title='imported-1', tags=['Flask', 'flask']) + _line(title='imported-2', author='new-author')
+    response = admin_client.post('/admin/import', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.get_json()['posts'] == 2
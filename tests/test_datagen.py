@@ -0,0 +1,87 @@
+"""数据生成：相同参数和种子生成完全相同的数据，计数列与实际行数一致"""
+
+import random
+
+from flask import Flask
+from sqlalchemy import func, select
+
+import datagen
+from models import Category, Comment, Post, Tag, User, db, post_tag
+
+SCALE = {'users': 12, 'categories': 5, 'tags': 20, 'posts': 30, 'comments': 90, 'max_tags': 3}
+
+
+def _generate(tmp_path, name, **options):
+    """在单独的 SQLite 库里生成，返回 (generate 的返回值, 全部行)"""
+    sandbox = Flask(name)
+    sandbox.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / name}.db",
+                          SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(sandbox)
+    with sandbox.app_context():
+        db.create_all()
+        counts = datagen.generate(**dict(SCALE, **options))
+        rows = {}
+        for table in (User.__table__, Category.__table__, Tag.__table__, Post.__table__,
+                      post_tag, Comment.__table__):
+            rows[table.name] = [tuple(row) for row in
+                                db.session.execute(select(table).order_by(*table.primary_key.columns))]
+        rows['counts'] = _counter_check()
+        db.session.remove()
+    return counts, rows
+
+
+def _counter_check():
+    """计数列与实际行数之差（应当全为 0）"""
+    checks = [
+        db.session.query(func.count()).select_from(Post)
+        .filter(Post.comment_count != select(func.count()).where(Comment.post_id == Post.id)
+                .scalar_subquery()).scalar(),
+        db.session.query(func.count()).select_from(User)
+        .filter(User.post_count != select(func.count()).where(Post.user_id == User.id)
+                .scalar_subquery()).scalar(),
+        db.session.query(func.count()).select_from(User)
+        .filter(User.comment_count != select(func.count()).where(Comment.user_id == User.id)
+                .scalar_subquery()).scalar(),
+        db.session.query(func.count()).select_from(Category)
+        .filter(Category.post_count != select(func.count()).where(Post.category_id == Category.id)
+                .scalar_subquery()).scalar(),
+    ]
+    return checks
+
+
+def test_same_seed_generates_identical_data(tmp_path):
+    counts, first = _generate(tmp_path, 'first', seed=7, batch_size=8)
+    _, second = _generate(tmp_path, 'second', seed=7, batch_size=8)
+    assert first == second
+    assert counts['posts'] == len(first['post']) == SCALE['posts']
+    assert counts['comments'] == len(first['comment']) == SCALE['comments']
+    assert counts['post_tag'] == len(first['post_tag'])
+
+
+def test_different_seed_generates_different_data(tmp_path):
+    _, first = _generate(tmp_path, 'seed1', seed=1)
+    _, second = _generate(tmp_path, 'seed2', seed=2)
+    assert first['post'] != second['post']
+
+
+def test_counter_columns_match_rows(tmp_path):
+    _, rows = _generate(tmp_path, 'counters', batch_size=7)
+    assert rows['counts'] == [0, 0, 0, 0]
+
+
+def test_posts_are_created_in_id_order_and_comments_follow(tmp_path):
+    sandbox_rows = _generate(tmp_path, 'order')[1]
+    created_index = Post.__table__.c.keys().index('created_at')
+    created = {row[0]: row[created_index] for row in sandbox_rows['post']}
+    assert list(created.values()) == sorted(created.values())
+    comment_columns = Comment.__table__.c.keys()
+    for row in sandbox_rows['comment']:
+        comment = dict(zip(comment_columns, row))
+        assert comment['created_at'] > created[comment['post_id']]
+
+
+def test_zipf_sampler_prefers_low_ids():
+    sampler = datagen._Sampler(random.Random(0), 50, 1.1)
+    picks = [sampler() for _ in range(5000)]
+    assert min(picks) >= 1 and max(picks) <= 50
+    assert picks.count(1) > picks.count(10) > picks.count(50)
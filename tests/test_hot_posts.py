@@ -0,0 +1,122 @@
+"""文章热度：向量化打分、分段读取、批量写回和排行榜发布"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import hot_posts
+from cache_helper import cache
+from models import Post, db
+
+
+def test_hotness_formula():
+    views = np.array([0.0, 100.0, 0.0])
+    comments = np.array([0.0, 0.0, 5.0])
+    age_hours = np.array([0.0, 0.0, 10.0])
+    scores = hot_posts.hotness(views, comments, age_hours)
+    expected = [(1 + v * hot_posts.VIEW_WEIGHT + c * hot_posts.COMMENT_WEIGHT) / (a + 2) ** hot_posts.GRAVITY
+                for v, c, a in zip(views, comments, age_hours)]
+    assert scores == pytest.approx(expected)
+
+
+def test_hotness_decays_with_age_and_clamps_future_posts():
+    views = np.full(3, 10.0)
+    comments = np.full(3, 2.0)
+    scores = hot_posts.hotness(views, comments, np.array([-5.0, 0.0, 48.0]))
+    # 发布时间在未来的按刚发布处理
+    assert scores[0] == scores[1]
+    assert scores[2] < scores[1]
+
+
+@pytest.fixture
+def frozen_now(monkeypatch):
+    """固定“现在”，两次计算的发布小时数相同，刚发布的文章分数不随测试耗时变化"""
+    now = datetime.utcnow()
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+
+    monkeypatch.setattr(hot_posts, 'datetime', FrozenDatetime)
+    return now
+
+
+def _db_scores(app):
+    with app.app_context():
+        return dict(db.session.query(Post.id, Post.hot_score))
+
+
+def _expected_scores(app):
+    with app.app_context():
+        ids, views, comments, age_hours = hot_posts.load_post_stats()
+    return dict(zip(ids.tolist(), hot_posts.hotness(views, comments, age_hours).tolist()))
+
+
+def test_load_post_stats_pages_by_primary_key(app, monkeypatch):
+    monkeypatch.setattr(hot_posts, 'FETCH_BATCH_SIZE', 7)
+    with app.app_context():
+        ids, views, comments, age_hours = hot_posts.load_post_stats()
+        rows = db.session.query(Post.id, Post.view_count, Post.comment_count).order_by(Post.id).all()
+    assert ids.tolist() == [row.id for row in rows]
+    assert views.tolist() == [row.view_count for row in rows]
+    assert comments.tolist() == [row.comment_count for row in rows]
+    assert (age_hours >= 0).all()
+
+
+def test_score_posts_writes_scores_and_publishes_ranking(app, monkeypatch, frozen_now):
+    monkeypatch.setattr(hot_posts, 'HOT_SIZE', 5)
+    with app.app_context():
+        updated_before = dict(db.session.query(Post.id, Post.updated_at))
+        assert hot_posts.score_posts() == len(updated_before)
+        updated_after = dict(db.session.query(Post.id, Post.updated_at))
+    # 热度不是内容修改，不改 updated_at
+    assert updated_after == updated_before
+
+    stored = _db_scores(app)
+    assert stored == pytest.approx(_expected_scores(app), rel=1e-6)
+
+    ranking = hot_posts.hot_post_ids(limit=100)
+    assert [stored[post_id] for post_id in ranking] == sorted(stored.values(), reverse=True)[:5]
+    with app.app_context():
+        assert [post.id for post in hot_posts.hot_posts(limit=3)] == ranking[:3]
+
+
+def test_scores_of_old_posts_keep_their_order(app):
+    """几个月前的文章热度只有 1e-6 量级，写回时不能被舍入成相同的值"""
+    with app.app_context():
+        hot_posts.score_posts()
+        rows = db.session.query(Post.view_count, Post.comment_count, Post.created_at, Post.hot_score).all()
+    # 统计完全相同的文章分数才相同
+    assert len({row.hot_score for row in rows}) == len({row[:3] for row in rows})
+
+
+@pytest.fixture
+def boosted_post(app):
+    """把最早发布的文章改成刚发布、阅读数很高，测试后恢复"""
+    with app.app_context():
+        post = Post.query.order_by(Post.created_at).first()
+        post_id, original = post.id, (post.view_count, post.created_at)
+    yield post_id
+    with app.app_context():
+        post = db.session.get(Post, post_id)
+        post.view_count, post.created_at = original
+        db.session.commit()
+        hot_posts.score_posts()
+
+
+def test_score_posts_partial_merges_into_ranking(app, monkeypatch, boosted_post):
+    monkeypatch.setattr(hot_posts, 'HOT_SIZE', 5)
+    with app.app_context():
+        hot_posts.score_posts()
+        ranking = hot_posts.hot_post_ids(limit=100)
+        assert boosted_post not in ranking
+        post = db.session.get(Post, boosted_post)
+        post.view_count += 1000000
+        post.created_at = datetime.utcnow()
+        db.session.commit()
+        assert hot_posts.score_posts([boosted_post]) == 1
+    ranking_after = hot_posts.hot_post_ids(limit=100)
+    assert ranking_after == [boosted_post] + ranking[:4]
+    assert cache.redis_client.zcard(hot_posts.HOT_KEY) == 5
@@ -0,0 +1,31 @@
+"""请求指标：SQL 计时不受失败语句影响；没有 Redis 时 /metrics 返回 503"""
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import metrics
+from models import db
+
+
+def test_failed_statement_leaves_no_timing_state(app):
+    with app.app_context(), db.engine.connect() as connection:
+        info_before = dict(connection.info)
+        metrics._local.request = metrics._RequestStats()
+        try:
+            with pytest.raises(OperationalError):
+                connection.execute(text('SELECT * FROM no_such_table'))
+            connection.execute(text('SELECT 1'))
+            stats = metrics._local.request
+        finally:
+            metrics._local.request = None
+        assert stats.statements == 1
+        # 连接会回到连接池被下一个请求复用，上面不能残留计时状态
+        assert dict(connection.info) == info_before
+
+
+def test_metrics_without_redis(client, monkeypatch):
+    monkeypatch.setattr(metrics, 'cache', None)
+    assert client.get('/').status_code == 200
+    assert metrics.flush(force=True) is False
+    assert client.get('/metrics').status_code == 503
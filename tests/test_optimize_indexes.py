@@ -0,0 +1,99 @@
+"""索引同步：声明与实际的差异、受保护的索引、apply 补齐后再检查一致"""
+
+import pytest
+from sqlalchemy import Column, ForeignKey, Index, Integer, MetaData, String, Table, create_engine
+
+import optimize_indexes
+from models import db
+
+
+def _metadata():
+    metadata = MetaData()
+    Table('author', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(50)))
+    Table('article', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('author_id', Integer, ForeignKey('author.id')),
+          Column('category_id', Integer),
+          Column('created_at', Integer),
+          Column('title', String(50)),
+          Index('ix_article_created_at', 'created_at'),
+          Index('ix_article_category_created', 'category_id', 'created_at'))
+    return metadata
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'indexes.db'}")
+    _metadata().create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def _execute(engine, *statements):
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.exec_driver_sql(statement)
+
+
+def test_in_sync_after_create_all(engine):
+    assert optimize_indexes.diff_indexes(engine, _metadata()) == ([], [], [])
+    assert optimize_indexes.verify(engine, _metadata())
+
+
+def test_missing_and_changed_indexes_are_repaired(engine):
+    _execute(engine,
+             "DROP INDEX ix_article_created_at",
+             "DROP INDEX ix_article_category_created",
+             "CREATE INDEX ix_article_category_created ON article (category_id)")
+    missing, changed, extra = optimize_indexes.diff_indexes(engine, _metadata())
+    assert missing == [('article', 'ix_article_created_at', ('created_at',), None)]
+    assert changed == [('article', 'ix_article_category_created', ('category_id', 'created_at'), ('category_id',))]
+    assert extra == []
+    assert not optimize_indexes.verify(engine, _metadata())
+
+    # 一个创建，列不一致的先删后建
+    assert optimize_indexes.apply(engine, _metadata()) == 3
+    assert optimize_indexes.diff_indexes(engine, _metadata()) == ([], [], [])
+    # 再执行一次什么都不做
+    assert optimize_indexes.apply(engine, _metadata()) == 0
+
+
+def test_extra_indexes_are_reported_but_kept_without_drop_extra(engine):
+    _execute(engine, "CREATE INDEX ix_article_title ON article (title)")
+    assert optimize_indexes.diff_indexes(engine, _metadata())[2] == [
+        ('article', 'ix_article_title', None, ('title',))]
+    assert optimize_indexes.apply(engine, _metadata()) == 0
+    assert optimize_indexes.apply(engine, _metadata(), drop_extra=True) == 1
+    assert optimize_indexes.diff_indexes(engine, _metadata()) == ([], [], [])
+
+
+def test_unique_and_foreign_key_indexes_are_protected(engine):
+    _execute(engine,
+             "CREATE UNIQUE INDEX uq_author_name ON author (name)",
+             # 外键列上唯一的索引：MySQL 的外键依赖它，不能当作多余的删除
+             "CREATE INDEX ix_article_author ON article (author_id, created_at)")
+    assert optimize_indexes.diff_indexes(engine, _metadata())[2] == []
+
+
+def test_foreign_key_index_is_extra_when_a_declared_index_covers_it(engine):
+    metadata = _metadata()
+    article = metadata.tables['article']
+    Index('ix_article_author_title', article.c.author_id, article.c.title)
+    _execute(engine,
+             "CREATE INDEX ix_article_author_title ON article (author_id, title)",
+             "CREATE INDEX ix_article_author ON article (author_id)")
+    assert optimize_indexes.diff_indexes(engine, metadata)[2] == [
+        ('article', 'ix_article_author', None, ('author_id',))]
+
+
+def test_tables_not_created_yet_are_skipped(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    assert optimize_indexes.diff_indexes(engine, _metadata()) == ([], [], [])
+
+
+def test_models_declare_every_index_in_the_test_database(app):
+    with app.app_context():
+        missing, changed, _ = optimize_indexes.diff_indexes(db.engine, db.metadata)
+    assert (missing, changed) == ([], [])
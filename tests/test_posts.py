@@ -0,0 +1,41 @@
+"""发布、编辑文章：无效输入在改动计数之前被拒绝"""
+
+import pytest
+
+from models import Category, Post, db
+
+
+@pytest.fixture
+def own_post(app):
+    with app.app_context():
+        post = Post.query.filter_by(user_id=1).order_by(Post.id).first()
+        return post.id, post.category_id
+
+
+def _category_counts(app):
+    with app.app_context():
+        return dict(db.session.query(Category.id, Category.post_count))
+
+
+@pytest.mark.parametrize('category', ['', 'abc', '999999'])
+def test_edit_post_rejects_invalid_category(app, logged_in_client, own_post, category):
+    post_id, category_id = own_post
+    before = _category_counts(app)
+    response = logged_in_client.post(f'/edit/{post_id}', data={'title': 'x', 'content': 'y', 'category': category})
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith(f'/edit/{post_id}')
+    assert _category_counts(app) == before
+    with app.app_context():
+        assert db.session.get(Post, post_id).category_id == category_id
+
+
+def test_edit_post_moves_category_count(app, logged_in_client, own_post):
+    post_id, category_id = own_post
+    with app.app_context():
+        other = Category.query.filter(Category.id != category_id).first().id
+    before = _category_counts(app)
+    response = logged_in_client.post(f'/edit/{post_id}', data={'title': 'x', 'content': 'y', 'category': other})
+    assert response.status_code == 302
+    after = _category_counts(app)
+    assert after[category_id] == before[category_id] - 1
+    assert after[other] == before[other] + 1
@@ -0,0 +1,47 @@
+"""首页和文章详情页的SQL条数不超过 FEED_QUERY_BUDGET / POST_QUERY_BUDGET"""
+
+import pytest
+
+from feed_queries import FEED_QUERY_BUDGET, POST_QUERY_BUDGET, get_feed_page, query_budget
+from models import Post, db
+
+
+@pytest.fixture
+def post_id(app):
+    with app.app_context():
+        # 评论最多的文章，评论和标签的 N+1 最明显
+        return (db.session.query(Post.id)
+                .order_by(Post.comment_count.desc(), Post.id).limit(1).scalar())
+
+
+def test_strict_budget_enabled(app):
+    assert app.testing
+    assert app.config['QUERY_BUDGET_STRICT']
+
+
+@pytest.mark.parametrize('user_client', ['client', 'logged_in_client'])
+def test_feed_query_budget(app, request, user_client):
+    client = request.getfixturevalue(user_client)
+    with app.app_context(), query_budget(FEED_QUERY_BUDGET):
+        response = client.get('/')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('user_client', ['client', 'logged_in_client'])
+def test_feed_next_page_query_budget(app, request, user_client):
+    client = request.getfixturevalue(user_client)
+    with app.test_request_context():
+        cursor = get_feed_page(None, with_total=False).next_cursor
+    assert cursor
+    with app.app_context(), query_budget(FEED_QUERY_BUDGET):
+        response = client.get('/', query_string={'cursor': cursor})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('user_client', ['client', 'logged_in_client'])
+def test_post_query_budget(app, request, user_client, post_id):
+    client = request.getfixturevalue(user_client)
+    with app.app_context(), query_budget(POST_QUERY_BUDGET):
+        response = client.get(f'/post/{post_id}')
+    assert response.status_code == 200
+
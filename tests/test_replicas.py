@@ -0,0 +1,94 @@
+"""读写分离：主库和副本是两个 SQLite 文件，副本里的数据打上标记，看查询读的是哪一个"""
+
+import os
+import sqlite3
+
+import pytest
+
+import replicas
+from conftest import TEST_PASSWORD, TEST_USER
+from models import Comment, Post, db
+
+MARK = 'FROM-REPLICA'
+
+
+def _replica_sql(path, statement):
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(statement)
+    connection.close()
+
+
+@pytest.fixture(scope='module')
+def replica(app, db_dir):
+    """复制一份主库作为副本，副本里第一篇文章的标题和它的评论都改成 MARK"""
+    path = os.path.join(db_dir, 'replica.db')
+    with app.app_context():
+        replicas.write_heartbeat(db)
+        post_id = (db.session.query(Comment.post_id)
+                   .order_by(Comment.post_id).limit(1).scalar())
+        source = sqlite3.connect(db.engine.url.database)
+        target = sqlite3.connect(path)
+        source.backup(target)
+        source.close()
+        target.close()
+        db.session.remove()
+    _replica_sql(path, f"UPDATE post SET title = '{MARK}' WHERE id = {post_id}")
+    _replica_sql(path, f"UPDATE comment SET content = '{MARK}' WHERE post_id = {post_id}")
+    binds = app.config.get('SQLALCHEMY_BINDS')
+    app.config['SQLALCHEMY_BINDS'] = {'replica0': 'sqlite:///' + path}
+    replicas.lag_monitor.reset()
+    yield path, post_id
+    app.config['SQLALCHEMY_BINDS'] = binds
+    replicas.lag_monitor.reset()
+
+
+def _reads_replica(client, post_id):
+    response = client.get(f'/post/{post_id}/comments')
+    assert response.status_code == 200
+    return any(comment['content'] == MARK for comment in response.get_json()['comments'])
+
+
+def _login(app):
+    client = app.test_client()
+    client.post('/login', data={'username': TEST_USER, 'password': TEST_PASSWORD})
+    return client
+
+
+def test_get_reads_replica(app, replica):
+    _, post_id = replica
+    assert _reads_replica(app.test_client(), post_id)
+
+
+def test_reads_stick_to_primary_after_write(app, replica):
+    _, post_id = replica
+    client = _login(app)
+    assert _reads_replica(client, post_id)
+    assert client.post(f'/post/{post_id}/comment', data={'content': 'fresh'}).status_code == 302
+    assert not _reads_replica(client, post_id)
+    # 粘滞时间过后回到副本
+    with client.session_transaction() as session:
+        session[replicas.STICKY_SESSION_KEY] = 0
+    assert _reads_replica(client, post_id)
+
+
+def test_lagging_replica_falls_back_to_primary(app, replica):
+    path, post_id = replica
+    _replica_sql(path, f"UPDATE {replicas.HEARTBEAT_TABLE} SET beat = beat - 3600")
+    replicas.lag_monitor.reset()
+    try:
+        assert not _reads_replica(app.test_client(), post_id)
+    finally:
+        _replica_sql(path, f"UPDATE {replicas.HEARTBEAT_TABLE} SET beat = beat + 3600")
+        replicas.lag_monitor.reset()
+    assert _reads_replica(app.test_client(), post_id)
+
+
+def test_cached_render_reads_primary(app, replica):
+    _, post_id = replica
+    client = app.test_client()
+    response = client.get(f'/post/{post_id}')
+    assert response.status_code == 200
+    assert MARK.encode() not in response.data
+    with app.app_context():
+        assert db.session.get(Post, post_id).title.encode() in response.data
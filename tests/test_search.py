@@ -0,0 +1,33 @@
+"""全文搜索：只差重音或大小写的词项不能互相冲突"""
+
+import pytest
+
+import search as search_index
+from models import Post, SearchTerm, db
+
+
+@pytest.fixture
+def session(app):
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+
+
+def test_tokenize_folds_case_and_accents():
+    assert search_index.tokenize('Café CAFE naïve') == ['cafe', 'cafe', 'naive']
+    # 韩文音节、假名浊音不受去重音影响
+    assert search_index.tokenize('한국어 ガギ') == ['한국', '국어', 'ガギ']
+
+
+def test_resolve_terms_differing_by_accent(session):
+    term_ids = search_index._resolve_term_ids(['strasse', 'straße', 'resume', 'résumé'])
+    assert len(set(term_ids.values())) == 4
+
+
+def test_index_posts_with_accented_terms(session):
+    posts = Post.query.order_by(Post.id).limit(2).all()
+    posts[0].title, posts[1].title = 'Café crème', 'cafe CREME'
+    search_index.index_posts(posts)
+    assert session.query(SearchTerm).filter_by(term='cafe').one().doc_count == 2
+    found = {post.id for post in search_index.search('CAFÉ').items}
+    assert {posts[0].id, posts[1].id} <= found
@@ -0,0 +1,103 @@
+"""慢查询日志：SQL 指纹归一化、按指纹聚合、EXPLAIN 只抓一次、写入 Redis 后出报告"""
+
+import pytest
+from sqlalchemy import event, text
+
+import slow_queries
+from models import db
+
+
+@pytest.mark.parametrize('statement, expected', [
+    ("SELECT * FROM post WHERE id = 42", "SELECT * FROM post WHERE id = ?"),
+    ("SELECT * FROM user WHERE name = 'o''brien' AND score > 1.5",
+     "SELECT * FROM user WHERE name = ? AND score > ?"),
+    ("SELECT * FROM post WHERE id = %s", "SELECT * FROM post WHERE id = ?"),
+    ("SELECT * FROM post WHERE id = %(id_1)s", "SELECT * FROM post WHERE id = ?"),
+    ("SELECT * FROM post WHERE id = :id", "SELECT * FROM post WHERE id = ?"),
+    ("SELECT * FROM post WHERE id IN (?, ?, ?)", "SELECT * FROM post WHERE id IN (...)"),
+    ("INSERT INTO tag (name) VALUES (%s), (%s), (%s)", "INSERT INTO tag (name) VALUES (...)"),
+    ("SELECT *\n  FROM   post\n WHERE id = 1", "SELECT * FROM post WHERE id = ?"),
+])
+def test_normalize(statement, expected):
+    assert slow_queries.normalize(statement) == expected
+
+
+def test_normalize_keeps_identifiers_and_casts():
+    # 列名里的数字、:: 类型转换不是参数
+    assert slow_queries.normalize("SELECT col1, t2.x::text FROM t2") == "SELECT col1, t2.x::text FROM t2"
+
+
+def test_in_lists_of_any_length_share_a_fingerprint():
+    short = slow_queries.normalize("SELECT * FROM post WHERE id IN (%s, %s)")
+    long = slow_queries.normalize("SELECT * FROM post WHERE id IN (%s, %s, %s, %s, %s)")
+    other = slow_queries.normalize("SELECT * FROM comment WHERE id IN (%s)")
+    assert slow_queries.fingerprint(short) == slow_queries.fingerprint(long)
+    assert slow_queries.fingerprint(short) != slow_queries.fingerprint(other)
+    assert len(slow_queries.fingerprint(short)) == 12
+
+
+def test_record_aggregates_by_fingerprint_and_route():
+    log = slow_queries.SlowQueryLog(threshold_ms=1000)
+    log.record("SELECT * FROM post WHERE id = 1", 0.01, 'main.show_post')
+    log.record("SELECT * FROM post WHERE id = 2", 0.03, 'main.show_post')
+    log.record("SELECT * FROM post WHERE id = 3", 0.02, '<celery>')
+    fp = slow_queries.fingerprint("SELECT * FROM post WHERE id = ?")
+    stats = log._stats[fp]
+    assert stats['count'] == 3
+    assert stats['total'] == pytest.approx(0.06)
+    assert stats['max'] == pytest.approx(0.03)
+    assert stats['routes'] == {'main.show_post': 2, '<celery>': 1}
+    assert log._pending_plans == {}
+
+
+def test_only_slow_selects_are_explained_once(app):
+    log = slow_queries.SlowQueryLog(threshold_ms=10)
+    with app.app_context():
+        engine = db.engine
+    log.record("SELECT * FROM post WHERE id = 1", 0.5, 'r', engine=engine)
+    log.record("SELECT * FROM post WHERE id = 2", 0.5, 'r', engine=engine)
+    log.record("UPDATE post SET view_count = 1 WHERE id = 1", 0.5, 'r', engine=engine)
+    log.record("SELECT * FROM tag WHERE id = 1", 0.001, 'r', engine=engine)
+    assert list(log._pending_plans) == [slow_queries.fingerprint("SELECT * FROM post WHERE id = ?")]
+
+
+def test_flush_and_report(app):
+    log = slow_queries.SlowQueryLog(threshold_ms=10)
+    with app.app_context():
+        engine = db.engine
+        for post_id in (1, 2, 3):
+            log.record(f"SELECT * FROM post WHERE id = {post_id}", 0.05, 'main.show_post', engine=engine)
+        log.record("SELECT count(*) FROM tag", 0.001, 'main.index')
+        assert log.flush() == 2
+        assert log.flush() == 0
+
+        rows = slow_queries.report(hours=1, sort='count')
+    assert [row['statement'] for row in rows] == ["SELECT * FROM post WHERE id = ?", "SELECT count(*) FROM tag"]
+    post_row = rows[0]
+    assert post_row['count'] == 3
+    assert post_row['mean'] == pytest.approx(0.05)
+    assert post_row['routes'] == {'main.show_post': 3}
+    assert post_row['new'] is True
+    # 超过阈值的 SELECT 带着执行计划
+    assert post_row['plan'] and 'error' not in post_row['plan'][0]
+    assert rows[1]['plan'] is None
+
+    assert [row['statement'] for row in slow_queries.report(hours=1, route='main.index')] == [
+        "SELECT count(*) FROM tag"]
+    assert slow_queries.reset() > 0
+    assert slow_queries.report(hours=1) == []
+
+
+def test_cursor_events_record_real_statements(app):
+    log = slow_queries.SlowQueryLog(threshold_ms=10000)
+    with app.app_context():
+        connection = db.engine.connect()
+        try:
+            event.listen(connection, 'before_cursor_execute', log._before_cursor_execute)
+            event.listen(connection, 'after_cursor_execute', log._after_cursor_execute)
+            connection.execute(text("SELECT id FROM post WHERE id = :id"), {'id': 5})
+            connection.execute(text("SELECT id FROM post WHERE id = :id"), {'id': 6})
+        finally:
+            connection.close()
+    stats = list(log._stats.values())
+    assert len(stats) == 1 and stats[0]['count'] == 2
@@ -0,0 +1,56 @@
+"""标签：批量解析、编辑时只增删有变化的关联"""
+
+import pytest
+
+from feed_queries import QueryCounter
+from models import Post, db, post_tag
+from tag_service import normalize_tag_names, parse_tag_names, resolve_tags, set_post_tags
+
+
+@pytest.fixture
+def post(app):
+    with app.app_context():
+        post = Post(title='tags', content='body', user_id=1, category_id=1)
+        db.session.add(post)
+        db.session.flush()
+        yield post
+        db.session.rollback()
+
+
+def _names(post):
+    db.session.expire(post, ['tags'])
+    return {tag.name for tag in post.tags}
+
+
+def test_parse_and_normalize():
+    assert parse_tag_names(' flask, redis ,,flask') == ['flask', 'redis']
+    assert normalize_tag_names(['a', ' a ', '', None, 'b']) == ['a', 'b']
+
+
+def test_resolve_tags_creates_missing_in_bulk(app, post):
+    with QueryCounter(db.engine) as counter:
+        tags = resolve_tags([f'bulk-tag-{i}' for i in range(20)])
+    assert len(tags) == 20
+    # 查已有 + 批量插入 + 补查
+    assert counter.count == 3
+
+
+def test_set_post_tags_only_touches_changes(app, post):
+    assert set_post_tags(post, ['t-a', 't-b', 't-c'], is_new=True)
+    assert _names(post) == {'t-a', 't-b', 't-c'}
+
+    with QueryCounter(db.engine) as counter:
+        assert set_post_tags(post, ['t-b', 't-c', 't-d'])
+    assert _names(post) == {'t-b', 't-c', 't-d'}
+    inserts = [s for s in counter.statements if s.startswith('INSERT INTO post_tag')]
+    deletes = [s for s in counter.statements if s.startswith('DELETE FROM post_tag')]
+    assert len(inserts) == 1 and len(deletes) == 1
+
+
+def test_set_post_tags_without_changes(app, post):
+    set_post_tags(post, ['same-1', 'same-2'], is_new=True)
+    updated_at = post.updated_at
+    with QueryCounter(db.engine) as counter:
+        assert not set_post_tags(post, ['same-2', 'same-1'])
+    assert not any(s.startswith(('INSERT', 'DELETE')) for s in counter.statements)
+    assert post.updated_at == updated_at
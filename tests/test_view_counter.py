@@ -0,0 +1,88 @@
+"""阅读数落库：重叠的 flush_views 不会把同一批阅读数写两次"""
+
+import pytest
+
+import view_counter
+from cache_helper import cache
+from models import Post, db
+
+
+@pytest.fixture
+def post_id(app):
+    with app.app_context():
+        return Post.query.order_by(Post.id).first().id
+
+
+def _view_count(app, post_id):
+    with app.app_context():
+        return db.session.get(Post, post_id).view_count
+
+
+def test_flush_writes_pending_views(app, post_id):
+    before = _view_count(app, post_id)
+    for _ in range(3):
+        view_counter.record_view(post_id)
+    with app.app_context():
+        assert view_counter.flush_views() == 3
+        assert view_counter.flush_views() == 0
+    assert _view_count(app, post_id) == before + 3
+
+
+def test_flush_skips_while_another_flush_holds_the_lock(app, post_id):
+    before = _view_count(app, post_id)
+    view_counter.record_view(post_id)
+    lock = cache.acquire_lock('views:flush', 30)
+    try:
+        with app.app_context():
+            assert view_counter.flush_views() == 0
+        assert _view_count(app, post_id) == before
+    finally:
+        cache.release_lock(lock)
+    with app.app_context():
+        assert view_counter.flush_views() == 1
+    assert _view_count(app, post_id) == before + 1
+
+
+def test_flush_stops_when_lock_expires(app, post_id, monkeypatch):
+    """锁超时后剩下的批次留在 Redis，由下一次任务处理"""
+    before = _view_count(app, post_id)
+    r = cache.redis_client
+    r.hset(view_counter.FLUSHING_PREFIX + 'a', post_id, 2)
+    r.hset(view_counter.FLUSHING_PREFIX + 'b', post_id, 3)
+    written = []
+    original = view_counter._write_batch
+
+    def write_then_expire(counts):
+        original(counts)
+        written.append(counts)
+        r.delete('lock:views:flush')
+
+    monkeypatch.setattr(view_counter, '_write_batch', write_then_expire)
+    with app.app_context():
+        first = view_counter.flush_views()
+    assert len(written) == 1
+    assert len(list(r.scan_iter(match=view_counter.FLUSHING_PREFIX + '*'))) == 1
+    monkeypatch.setattr(view_counter, '_write_batch', original)
+    with app.app_context():
+        assert first + view_counter.flush_views() == 5
+    assert _view_count(app, post_id) == before + 5
+
+
+def test_flush_reports_touched_posts(app, post_id):
+    """落库任务用写回的文章id派发热度重算；没有阅读数时不派发"""
+    calls = []
+    view_counter.record_view(post_id)
+    view_counter.record_view(post_id)
+    with app.app_context():
+        view_counter.flush_views(on_flushed=calls.append)
+        view_counter.flush_views(on_flushed=calls.append)
+    assert calls == [[post_id]]
+
+
+def test_cached_post_page_does_not_schedule_statistics(app, client, post_id, monkeypatch):
+    import routes
+    calls = []
+    monkeypatch.setattr(routes, 'CELERY_AVAILABLE', True)
+    monkeypatch.setattr(routes, 'schedule_post_statistics', calls.append, raising=False)
+    assert client.get(f'/post/{post_id}').status_code == 200
+    assert calls == []
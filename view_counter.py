@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+文章阅读数 - 学习：写缓冲、批量落库、至少一次（at-least-once）语义
+请求路径上只做一次 Redis 往返（HINCRBY + ZINCRBY），不写 MySQL；
+Celery 定时任务把累积的增量用一条 executemany UPDATE 批量写回 post.view_count。
+
+可靠性：
+- 落库前先把 views:pending RENAME 成 views:flushing:<id>，新的阅读数写到新的 pending 里；
+  提交数据库后才删除 flushing 批次。任务中途崩溃时批次留在 Redis，下次重放（可能重复计数一次）。
+- 同一时间只有一个落库任务（views:flush 锁），避免两个任务扫描到同一个遗留批次各写一次；
+  每写一个批次前确认锁仍归自己，锁超时后立刻停下，剩下的批次留给下一次任务。
+- Redis 重启最多丢失一个落库周期内的增量（开启 AOF 时更少）。
+- “最多阅读”排行榜 views:top 在每次落库后用数据库总数校正；丢失后从数据库补齐。
+"""
+
+import uuid
+from functools import wraps
+
+import redis
+from flask import make_response, request
+from sqlalchemy import bindparam
+
+from models import db, Post
+from cache_helper import cache
+
+PENDING_KEY = 'views:pending'
+FLUSHING_PREFIX = 'views:flushing:'
+TOP_KEY = 'views:top'
+TITLES_KEY = 'views:titles'
+
+# 排行榜变化时递增版本号的页面缓存命名空间，首页的 ETag 带上它（见 feed_queries.get_feed_validators）
+VIEWS_NAMESPACE = 'views'
+
+# 落库锁的超时秒数（要比一次落库的耗时长得多）
+FLUSH_LOCK_TIMEOUT = 300
+
+# 排行榜保留的文章数
+TOP_SIZE = 100
+# 每条 executemany 的行数
+FLUSH_BATCH_SIZE = 1000
+
+
+def record_view(post_id):
+    """记录一次阅读：一个 pipeline，一次往返"""
+    try:
+        pipe = cache.redis_client.pipeline(transaction=False)
+        pipe.hincrby(PENDING_KEY, post_id, 1)
+        pipe.zincrby(TOP_KEY, 1, post_id)
+        pipe.execute()
+    except Exception as e:
+        print(f"阅读数记录失败: {e}")
+
+
+def count_post_view(f):
+    """
+    文章页阅读计数装饰器（放在 conditional_view / cache_view 外层，
+    所以缓存命中和304也计入阅读）；只统计成功的 GET
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        response = make_response(f(*args, **kwargs))
+        if request.method == 'GET' and response.status_code in (200, 304):
+            record_view(kwargs['post_id'])
+        return response
+    return decorated_function
+
+
+def most_viewed(limit=10):
+    """阅读数最多的文章 [{'id', 'title', 'views'}]，只读 Redis"""
+    try:
+        ranked = cache.redis_client.zrevrange(TOP_KEY, 0, limit * 2 - 1, withscores=True)
+        if not ranked:
+            return []
+        titles = cache.redis_client.hmget(TITLES_KEY, [post_id for post_id, _ in ranked])
+    except Exception as e:
+        print(f"热门文章获取失败: {e}")
+        return []
+    result = []
+    for (post_id, views), title in zip(ranked, titles):
+        # 没有标题的是已删除或尚未落库校正的文章
+        if title is None:
+            continue
+        result.append({'id': int(post_id), 'title': title.decode('utf-8'), 'views': int(views)})
+        if len(result) >= limit:
+            break
+    return result
+
+
+def remove_post_views(post_id):
+    """文章删除后从排行榜和标题表中移除，未落库的阅读数一并丢弃"""
+    try:
+        pipe = cache.redis_client.pipeline(transaction=False)
+        pipe.zrem(TOP_KEY, post_id)
+        pipe.hdel(TITLES_KEY, post_id)
+        pipe.hdel(PENDING_KEY, post_id)
+        pipe.execute()
+    except Exception as e:
+        print(f"阅读数清理失败: {e}")
+    cache.invalidate_namespace(VIEWS_NAMESPACE)
+
+
+def _write_batch(counts):
+    """把 {post_id: 增量} 写回数据库：每 FLUSH_BATCH_SIZE 行一条 executemany"""
+    statement = (Post.__table__.update()
+                 .where(Post.__table__.c.id == bindparam('post_id'))
+                 .values(view_count=Post.__table__.c.view_count + bindparam('delta'),
+                         # 阅读数不是内容修改，不触发 onupdate
+                         updated_at=Post.__table__.c.updated_at))
+    rows = [{'post_id': post_id, 'delta': delta} for post_id, delta in counts.items()]
+    for i in range(0, len(rows), FLUSH_BATCH_SIZE):
+        db.session.execute(statement, rows[i:i + FLUSH_BATCH_SIZE])
+
+
+def _refresh_top(post_ids):
+    """
+    用数据库里的总数校正排行榜，并记录标题；
+    排行榜不满 TOP_SIZE（如 Redis 重启后只剩新增的阅读）时用数据库前 TOP_SIZE 名补齐
+    """
+    r = cache.redis_client
+    rows = []
+    if r.zcard(TOP_KEY) < TOP_SIZE:
+        rows.extend(db.session.query(Post.id, Post.title, Post.view_count)
+                    .filter(Post.view_count > 0)
+                    .order_by(Post.view_count.desc())
+                    .limit(TOP_SIZE))
+    post_ids = list(post_ids)
+    for i in range(0, len(post_ids), FLUSH_BATCH_SIZE):
+        rows.extend(db.session.query(Post.id, Post.title, Post.view_count)
+                    .filter(Post.id.in_(post_ids[i:i + FLUSH_BATCH_SIZE])))
+    pipe = r.pipeline(transaction=False)
+    if rows:
+        pipe.zadd(TOP_KEY, {post_id: view_count for post_id, _, view_count in rows})
+        pipe.hset(TITLES_KEY, mapping={post_id: title for post_id, title, _ in rows})
+    # 只保留前 TOP_SIZE 名
+    pipe.zremrangebyrank(TOP_KEY, 0, -(TOP_SIZE + 1))
+    pipe.execute()
+
+
+def flush_views(on_flushed=None):
+    """
+    把 Redis 中累积的阅读数批量写回数据库，返回写回的阅读次数
+    先重放上次未完成的批次，再处理当前 pending；另一个任务正在落库时直接返回 0
+    on_flushed(post_ids)：有阅读数写回时，用这些文章的id调用一次（例如派发热度重算）
+    """
+    lock = cache.acquire_lock('views:flush', FLUSH_LOCK_TIMEOUT)
+    if lock is None:
+        return 0
+    try:
+        return _flush_views(lock, on_flushed)
+    finally:
+        cache.release_lock(lock)
+
+
+def _flush_views(lock, on_flushed):
+    r = cache.redis_client
+    batches = list(r.scan_iter(match=FLUSHING_PREFIX + '*', count=100))
+    batch_key = FLUSHING_PREFIX + uuid.uuid4().hex
+    try:
+        r.rename(PENDING_KEY, batch_key)
+        batches.append(batch_key)
+    except redis.ResponseError:
+        # 没有新的阅读数
+        pass
+
+    flushed = 0
+    touched = set()
+    for key in batches:
+        if not lock.owned():
+            # 锁已超时，可能有别的任务在落库
+            break
+        counts = {int(post_id): int(delta) for post_id, delta in r.hgetall(key).items()}
+        if counts:
+            _write_batch(counts)
+            db.session.commit()
+            flushed += sum(counts.values())
+            touched.update(counts)
+        r.delete(key)
+    _refresh_top(touched)
+    # 排行榜里被挤出前 TOP_SIZE 的文章，标题也不再需要
+    if touched:
+        touched = list(touched)
+        pipe = r.pipeline(transaction=False)
+        for post_id in touched:
+            pipe.zscore(TOP_KEY, post_id)
+        stale = [post_id for post_id, score in zip(touched, pipe.execute()) if score is None]
+        if stale:
+            r.hdel(TITLES_KEY, *stale)
+        # 排行榜的阅读数已按数据库校正，首页的 ETag 随之变化
+        cache.invalidate_namespace(VIEWS_NAMESPACE)
+        if on_flushed is not None:
+            on_flushed(sorted(touched))
+    return flushed